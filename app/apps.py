@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class AppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "app"
+
+    def ready(self):
+        if settings.FUZZY_LUT_MODE:
+            from app.fuzzy import get_lookup_tables
+
+            # Pay the table precomputation at startup, not on the first request
+            get_lookup_tables()
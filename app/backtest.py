@@ -0,0 +1,240 @@
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+
+from app.compute import _warm
+from app.fuzzy import get_ruleset, score
+from app.indicators import compute_indicators
+from app.pipeline import history_frame
+
+
+@dataclass
+class BacktestParams:
+    """
+    Long-only trading rules. A position is opened when ``Entry_Position``
+    reaches ``entry`` and closed when ``Exit_Position`` reaches ``exit``,
+    both at the next bar's open. Orders are whole lots of ``lot_size``
+    shares paying ``buy_fee`` / ``sell_fee`` (fractions of the value).
+    """
+    entry: float
+    exit: float
+    capital: float
+    lot_size: int
+    buy_fee: float
+    sell_fee: float
+
+    def __post_init__(self):
+        # Raises ValueError with a message for the client
+        for name in ('entry', 'exit', 'capital', 'buy_fee', 'sell_fee'):
+            if not math.isfinite(getattr(self, name)):
+                raise ValueError(f"'{name}' must be a finite number")
+        for name in ('entry', 'exit'):
+            if not 0 <= getattr(self, name) <= 100:
+                raise ValueError(f"'{name}' must be between 0 and 100")
+        if self.capital <= 0:
+            raise ValueError("'capital' must be positive")
+        if self.lot_size < 1:
+            raise ValueError("'lot_size' must be a positive integer")
+        for name in ('buy_fee', 'sell_fee'):
+            if not 0 <= getattr(self, name) < 1:
+                raise ValueError(f"'{name}' must be at least 0 and below 1")
+
+    @classmethod
+    def defaults(cls, **overrides):
+        """``settings.BACKTEST_DEFAULTS`` updated with ``overrides``."""
+        return cls(**{**settings.BACKTEST_DEFAULTS, **overrides})
+
+
+def positions(entry_scores, exit_scores, params):
+    """
+    Whether a position is held after the close of each bar.
+
+    Entries and exits become +1 / 0 marks (a bar with both keeps the
+    previous state) and are forward filled, the usual vectorized form of
+    the enter/exit state machine.
+    """
+    with np.errstate(invalid='ignore'):
+        enter = entry_scores >= params.entry
+        leave = exit_scores >= params.exit
+    marks = np.full(len(entry_scores), np.nan)
+    marks[enter & ~leave] = 1.
+    marks[leave & ~enter] = 0.
+
+    # Forward fill: index of the last mark at or before each bar
+    last = np.where(np.isnan(marks), 0, np.arange(len(marks)))
+    np.maximum.accumulate(last, out=last)
+    held = marks[last]
+    held[np.isnan(held)] = 0.
+    return held.astype(bool)
+
+
+def simulate(dates, open_prices, close_prices, entry_scores, exit_scores, params):
+    """
+    Backtest one stock. Signals on a bar's close are filled at the next
+    bar's open; a position still open at the end is valued at the last
+    close. Returns the equity curve, drawdown, trades and a summary.
+    """
+    n = len(close_prices)
+    # Held during bar t when the signal of bar t - 1 said so
+    held = np.zeros(n, dtype=bool)
+    held[1:] = positions(entry_scores, exit_scores, params)[:-1]
+    changes = np.diff(held.astype(np.int8), prepend=np.int8(0))
+    entries = np.flatnonzero(changes == 1)
+    exits = np.flatnonzero(changes == -1)
+
+    # Only the fills are sequential (each trade sizes with the cash left)
+    cash = params.capital
+    trades = []
+    shares_at = np.zeros(n)
+    cash_at = np.full(n, np.nan)
+    cash_at[0] = cash
+    for number, start in enumerate(entries):
+        buy_price = open_prices[start]
+        lots = math.floor(cash / (buy_price * params.lot_size * (1 + params.buy_fee)))
+        shares = lots * params.lot_size
+        if not shares:
+            continue
+        cost = shares * buy_price * (1 + params.buy_fee)
+        cash -= cost
+        cash_at[start] = cash
+
+        end = exits[number] if number < len(exits) else None
+        if end is None:
+            shares_at[start:] = shares
+            trades.append({
+                'entry_date': dates[start], 'entry_price': buy_price, 'shares': shares,
+                'exit_date': None, 'exit_price': None, 'pnl': None, 'return': None,
+            })
+            continue
+
+        sell_price = open_prices[end]
+        proceeds = shares * sell_price * (1 - params.sell_fee)
+        cash += proceeds
+        cash_at[end] = cash
+        shares_at[start:end] = shares
+        trades.append({
+            'entry_date': dates[start], 'entry_price': buy_price, 'shares': shares,
+            'exit_date': dates[end], 'exit_price': sell_price,
+            'pnl': proceeds - cost, 'return': proceeds / cost - 1,
+        })
+
+    # Cash changes only on fills: forward fill it between them
+    last = np.where(np.isnan(cash_at), 0, np.arange(n))
+    np.maximum.accumulate(last, out=last)
+    equity = cash_at[last] + shares_at * close_prices
+    drawdown = equity / np.maximum.accumulate(equity) - 1
+
+    closed = [trade for trade in trades if trade['pnl'] is not None]
+    wins = sum(trade['pnl'] > 0 for trade in closed)
+    return {
+        'summary': {
+            'final_equity': float(equity[-1]),
+            'total_return': float(equity[-1] / params.capital - 1),
+            'max_drawdown': float(drawdown.min()),
+            'trades': len(trades),
+            'win_rate': wins / len(closed) if closed else None,
+            'exposure': float((shares_at > 0).mean()),
+        },
+        'trades': trades,
+        'equity': equity,
+        'drawdown': drawdown,
+    }
+
+
+_lock = threading.Lock()
+# Worker count -> warm worker processes, kept between backtests
+_pools = {}
+
+
+def get_pool(workers):
+    """The ``workers`` backtest processes, started on first use."""
+    with _lock:
+        if workers not in _pools:
+            # Spawned, not forked: the server has threads (and their locks) running
+            _pools[workers] = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                                  initializer=_warm)
+        return _pools[workers]
+
+
+def shutdown_pools():
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(cancel_futures=True)
+
+
+def _backtest_frame(code, df, params):
+    # Runs in a worker process: indicators, scoring and simulation need no database
+    if not set(get_ruleset().columns) <= set(df.columns):
+        compute_indicators(df)
+    score(df)
+    result = simulate(
+        df['Date'].tolist(),
+        df['Open'].to_numpy(dtype=np.float64),
+        df['Close'].to_numpy(dtype=np.float64),
+        df['Entry_Position'].to_numpy(dtype=np.float64),
+        df['Exit_Position'].to_numpy(dtype=np.float64),
+        params,
+    )
+    result['dates'] = df['Date'].tolist()
+    return code, result
+
+
+def read_frames(stocks):
+    """
+    ``(code, history)`` of each of ``stocks`` with bars, cut down to the
+    columns a backtest reads when the indicator store is up to date.
+    """
+    # DataFrame columns read by the fuzzy systems, all a worker needs
+    score_inputs = get_ruleset().columns
+    frames = []
+    for stock in stocks:
+        df = history_frame(stock, compute=False)
+        if df is not None:
+            if set(score_inputs) <= set(df.columns):
+                df = df[['Date', 'Open', 'Close', *score_inputs]].copy()
+            frames.append((stock.code, df))
+    return frames
+
+
+def backtest_frames(frames, params=None, workers=None):
+    """
+    Backtest the ``read_frames`` histories with ``params``
+    (``BacktestParams.defaults()``), without touching the database.
+
+    Each stock's indicators (when the store is behind), scores and
+    simulation run in a pool of ``workers`` processes
+    (``settings.BACKTEST_WORKERS``, else one per CPU), spawned on the first
+    backtest and kept warm for the next ones. With a single stock or worker
+    everything runs in this process. Returns ``{code: result}``.
+    """
+    params = params or BacktestParams.defaults()
+    workers = workers or settings.BACKTEST_WORKERS or os.cpu_count()
+    if workers <= 1 or len(frames) <= 1:
+        return dict(_backtest_frame(code, df, params) for code, df in frames)
+    pool = get_pool(workers)
+    try:
+        futures = [pool.submit(_backtest_frame, code, df, params) for code, df in frames]
+        return dict(future.result() for future in futures)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory): start over next time, finish here
+        with _lock:
+            if _pools.get(workers) is pool:
+                del _pools[workers]
+        return dict(_backtest_frame(code, df, params) for code, df in frames)
+
+
+def run_backtests(stocks, params=None, workers=None):
+    """
+    Backtest ``stocks``: ``backtest_frames`` of their ``read_frames``.
+    Returns ``{code: result}`` for the stocks with bars.
+    """
+    return backtest_frames(read_frames(stocks), params, workers)
@@ -0,0 +1,154 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db.models import Max
+
+from app.models import Price
+
+# One raw file per column, appended in date order
+bar_columns = {
+    'id': np.int64,
+    'date': 'datetime64[D]',
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'volume': np.int64,
+}
+
+
+def store_dir():
+    """``settings.BAR_STORE_DIR``, ``None`` when the store is disabled."""
+    return getattr(settings, 'BAR_STORE_DIR', None)
+
+
+def _stock_dir(stock):
+    return os.path.join(store_dir(), str(stock.pk))
+
+
+def _column_path(directory, column):
+    return os.path.join(directory, f'{column}.bin')
+
+
+def read_bars(stock):
+    """
+    Memory-map the stored columns of ``stock``.
+
+    Returns a dict of read-only arrays keyed by ``bar_columns``, or ``None``
+    when the store is disabled, has nothing for ``stock`` or its columns
+    disagree in length (an append in progress or interrupted).
+    """
+    if not store_dir():
+        return None
+    directory = _stock_dir(stock)
+    columns = {}
+    for column, dtype in bar_columns.items():
+        path = _column_path(directory, column)
+        if not os.path.exists(path):
+            return None
+        if os.path.getsize(path):
+            columns[column] = np.memmap(path, dtype=dtype, mode='r')
+        else:
+            columns[column] = np.empty(0, dtype=dtype)
+    if len({len(values) for values in columns.values()}) != 1:
+        return None
+    return columns
+
+
+def read_current_bars(stock):
+    """``read_bars``, or ``None`` when the store lags behind the last ``Price`` of ``stock``."""
+    columns = read_bars(stock)
+    if columns is None or not len(columns['date']):
+        return None
+    last_date = Price.objects.filter(stock=stock).aggregate(last=Max('date'))['last']
+    if columns['date'][-1].item() != last_date:
+        return None
+    return columns
+
+
+def bars_to_frame(stock, columns):
+    """The ``prices_to_frame`` DataFrame built from ``read_bars`` columns."""
+    return pd.DataFrame({
+        'id': columns['id'],
+        'stock_id': np.full(len(columns['id']), stock.pk, dtype=np.int64),
+        # datetime.date objects, as the ORM returns them
+        'Date': columns['date'].astype(object),
+        'Open': columns['open'],
+        'High': columns['high'],
+        'Low': columns['low'],
+        'Close': columns['close'],
+        'Volume': columns['volume'],
+    })
+
+
+def _write(directory, rows, mode):
+    values = list(zip(*rows)) if rows else [()] * len(bar_columns)
+    for (column, dtype), column_values in zip(bar_columns.items(), values):
+        with open(_column_path(directory, column), mode) as output:
+            output.write(np.asarray(column_values, dtype=dtype).tobytes())
+
+
+def rebuild_bars(stock):
+    """Rewrite the stored columns of ``stock`` from its ``Price`` rows. Returns the row count."""
+    rows = list(Price.objects.filter(stock=stock).order_by('date').values_list(*bar_columns))
+    directory = _stock_dir(stock)
+    building = f'{directory}.building-{os.getpid()}'
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    _write(building, rows, 'wb')
+
+    # Swap the directories so readers never see a half written store
+    replaced = f'{directory}.replaced-{os.getpid()}'
+    if os.path.exists(directory):
+        os.rename(directory, replaced)
+    os.rename(building, directory)
+    shutil.rmtree(replaced, ignore_errors=True)
+    return len(rows)
+
+
+def update_bars(stock):
+    """
+    Append the ``Price`` rows of ``stock`` newer than its last stored bar.
+
+    Falls back to ``rebuild_bars`` when nothing is stored yet or when bars
+    were inserted inside the stored range. Does nothing when the store is
+    disabled. Returns the number of rows written.
+    """
+    if not store_dir():
+        return 0
+    columns = read_bars(stock)
+    if columns is None or not len(columns['date']):
+        return rebuild_bars(stock)
+
+    last_date = columns['date'][-1].item()
+    if Price.objects.filter(stock=stock, date__lte=last_date).count() != len(columns['date']):
+        return rebuild_bars(stock)
+
+    rows = list(Price.objects.filter(stock=stock, date__gt=last_date).order_by('date').values_list(*bar_columns))
+    if rows:
+        _write(_stock_dir(stock), rows, 'ab')
+    return len(rows)
+
+
+def verify_bars(stock):
+    """
+    Compare the stored columns of ``stock`` with its ``Price`` rows.
+    Returns a list of ``(date, column)`` mismatches.
+    """
+    columns = read_bars(stock)
+    if columns is None:
+        return [(None, 'missing or torn store')]
+    rows = list(Price.objects.filter(stock=stock).order_by('date').values_list(*bar_columns))
+    if len(rows) != len(columns['date']):
+        return [(None, f"{len(columns['date'])} stored rows, {len(rows)} in the database")]
+
+    mismatches = []
+    values = list(zip(*rows)) if rows else [()] * len(bar_columns)
+    dates = columns['date'].astype(object)
+    for (column, dtype), expected in zip(bar_columns.items(), values):
+        same = columns[column] == np.asarray(expected, dtype=dtype)
+        mismatches.extend((dates[i], column) for i in np.flatnonzero(~same))
+    return mismatches
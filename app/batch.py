@@ -0,0 +1,50 @@
+import pandas as pd
+
+from app.compute import run_compute, score_frame
+from app.indicators import prices_to_frame
+from app.models import Price
+from app.timing import stage
+
+
+def _batch_prices(stocks):
+    return Price.objects.filter(stock__in=stocks).order_by('stock_id', 'date').values()
+
+
+def batch_frames(stocks, ruleset=None):
+    """
+    Score the whole history of several stocks at once.
+
+    One query reads the bars of every stock in (stock, date) order, the
+    indicators are computed on the combined frame with each window kept
+    within its stock (``compute_indicators(by='stock_id')``) and every row
+    goes through a single fuzzy call. Returns ``{code: DataFrame}`` in the
+    order of ``stocks``, with the rows of ``api/saham``; stocks without
+    bars are left out.
+    """
+    with stage('db'):
+        rows = list(_batch_prices(stocks))
+    return score_batch(rows, stocks, ruleset)
+
+
+async def abatch_frames(stocks, ruleset=None):
+    """``batch_frames`` for async views, scoring in the compute pool."""
+    with stage('db'):
+        rows = [row async for row in _batch_prices(stocks)]
+    return await run_compute(score_batch, rows, stocks, ruleset)
+
+
+def score_batch(rows, stocks, ruleset=None):
+    """The CPU part of ``batch_frames``, from the ``Price`` rows of ``stocks``."""
+    if not rows:
+        return {}
+    with stage('frame'):
+        df = prices_to_frame(rows)
+    score_frame(df, ruleset, by='stock_id')
+    df['Date'] = pd.to_datetime(df['Date']).dt.strftime('%Y-%m-%d')
+
+    frames = {}
+    groups = dict(list(df.groupby('stock_id', sort=False)))
+    for stock in stocks:
+        if stock.pk in groups:
+            frames[stock.code] = groups[stock.pk].reset_index(drop=True)
+    return frames
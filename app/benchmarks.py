@@ -0,0 +1,204 @@
+import json
+import os
+import platform
+import statistics
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import Client
+
+from app import fuzzy
+from app.indicator_store import update_indicators
+from app.indicators import compute_indicators
+from app.ingest import upsert_prices
+from app.models import Stock
+from app.signal_cache import get_cache
+from app.synthetic import make_ohlcv
+
+# Synthetic data sizes: bars of one stock and stocks of 1000 bars
+sizes = {
+    'quick': {'bars': [1000, 10000], 'tickers': [1, 100]},
+    'full': {'bars': [1000, 10000, 100000], 'tickers': [1, 100, 900]},
+}
+
+# Rows scored by the per-row skfuzzy reference, too slow for more
+SKFUZZY_BARS = 1000
+
+groups = ('ingest', 'indicators', 'fuzzy', 'api')
+
+
+def make_csv(bars, seed=7):
+    """``make_ohlcv`` as the CSV accepted by ``api/create``."""
+    return make_ohlcv(bars, seed).to_csv(index=False)
+
+
+def make_tickers(tickers, bars=1000):
+    """One combined frame of ``tickers`` synthetic histories with a ``stock_id`` column."""
+    frames = []
+    for number in range(tickers):
+        df = make_ohlcv(bars, seed=number)
+        df['stock_id'] = number
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+class Suite:
+    """Runs benchmarks and keeps ``{name: {'min', 'median', 'repeat', 'rows'}}`` in seconds."""
+
+    def __init__(self, repeat=5, log=None):
+        self.repeat = repeat
+        self.log = log or (lambda line: None)
+        self.results = {}
+
+    def measure(self, name, func, rows=None, setup=None, repeat=None):
+        """Time ``func(setup())`` (or ``func()``) ``repeat`` times; ``setup`` isn't timed."""
+        timings = []
+        for _ in range(repeat or self.repeat):
+            argument = setup() if setup else None
+            started = time.perf_counter()
+            func(argument) if setup else func()
+            timings.append(time.perf_counter() - started)
+        result = {'min': min(timings), 'median': statistics.median(timings), 'repeat': len(timings), 'rows': rows}
+        self.results[name] = result
+        rate = f'{rows / result["min"]:12.0f} rows/s' if rows else ''
+        self.log(f'{name:<48} {result["min"]:9.4f}s {result["median"]:9.4f}s {rate}')
+        return result
+
+
+def bench_ingest(suite, size):
+    client = Client()
+    for bars in size['bars']:
+        content = make_csv(bars).encode()
+        codes = iter(range(suite.repeat))
+
+        def upload():
+            csv_file = SimpleUploadedFile('bars.csv', content, content_type='text/csv')
+            response = client.post('/api/create', {'csv_file': csv_file, 'name': 'Bench',
+                                                   'code': f'INGEST{bars}X{next(codes)}', 'sector': 'Bench'})
+            assert response.status_code == 201, response.content
+
+        suite.measure(f'ingest[upload_csv,bars={bars}]', upload, rows=bars)
+
+
+def bench_indicators(suite, size):
+    for bars in size['bars']:
+        df = make_ohlcv(bars)
+        suite.measure(f'indicators[bars={bars}]', compute_indicators, rows=bars, setup=df.copy)
+    for tickers in size['tickers']:
+        if tickers > 1:
+            df = make_tickers(tickers)
+            suite.measure(f'indicators[grouped,tickers={tickers}]', lambda frame: compute_indicators(frame, by='stock_id'),
+                          rows=len(df), setup=df.copy)
+
+
+def bench_fuzzy(suite, size):
+    fuzzy.get_vectorized_systems()
+    fuzzy.get_lookup_tables()
+    for bars in size['bars']:
+        df = compute_indicators(make_ohlcv(bars))
+        if bars <= SKFUZZY_BARS:
+            suite.measure(f'fuzzy[skfuzzy,bars={bars}]', fuzzy.score_skfuzzy, rows=bars, setup=df.copy, repeat=1)
+        suite.measure(f'fuzzy[vectorized,bars={bars}]', lambda frame: fuzzy.score(frame, lut_mode=''),
+                      rows=bars, setup=df.copy)
+        suite.measure(f'fuzzy[lut,bars={bars}]', lambda frame: fuzzy.score(frame, lut_mode='nearest'),
+                      rows=bars, setup=df.copy)
+
+
+def _seed_stock(code, bars, seed=7):
+    stock = Stock.objects.create(name=code, code=code, sector='Bench')
+    upsert_prices(stock, make_ohlcv(bars, seed).itertuples(index=False, name=None), batch_size=1000)
+    update_indicators(stock)
+    return stock
+
+
+def bench_api(suite, size):
+    client = Client()
+
+    def get(path, params=None):
+        response = client.get(path, params)
+        assert response.status_code == 200, response.content
+
+    for bars in size['bars']:
+        stock = _seed_stock(f'API{bars}', bars)
+        suite.measure(f'api[api_view,cache=cold,bars={bars}]', lambda _: get('/api/saham', {'kode': stock.code}),
+                      rows=bars, setup=get_cache().clear)
+        suite.measure(f'api[api_view,cache=warm,bars={bars}]', lambda: get('/api/saham', {'kode': stock.code}),
+                      rows=bars)
+        suite.measure(f'api[get_stock_data,bars={bars}]', lambda: get(f'/api/saham/{stock.code}'), rows=bars)
+
+    for tickers in size['tickers']:
+        if tickers > 1:
+            codes = [_seed_stock(f'BATCH{tickers}X{number}', 1000, number).code for number in range(tickers)]
+            suite.measure(
+                f'api[batch,tickers={tickers}]',
+                lambda: client.post('/api/saham/batch', {'codes': codes}, content_type='application/json'),
+                rows=tickers * 1000,
+            )
+
+
+def run_suite(size='quick', repeat=5, only=None, log=None):
+    """
+    Run the benchmark ``groups`` (all unless ``only``) on synthetic data
+    of ``sizes[size]``. Database rows written by the benchmarks are rolled
+    back. Returns the results document stored by ``save_results``.
+    """
+    suite = Suite(repeat, log)
+    benchmarks = {'ingest': bench_ingest, 'indicators': bench_indicators, 'fuzzy': bench_fuzzy, 'api': bench_api}
+    with transaction.atomic():
+        for group in groups:
+            if not only or group in only:
+                benchmarks[group](suite, sizes[size])
+        transaction.set_rollback(True)
+    get_cache().clear()
+
+    return {
+        'meta': {
+            'date': datetime.now(timezone.utc).isoformat(),
+            'size': size,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'results': suite.results,
+    }
+
+
+def save_results(path, document):
+    with open(path, 'w') as output:
+        json.dump(document, output, indent=2)
+
+
+def load_results(path):
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def compare(document, baseline, tolerance=0.25, only=None):
+    """
+    Compare the best times of ``document`` with ``baseline``. Returns
+    ``(name, baseline_min, current_min, ratio, status)`` rows; ``status`` is
+    'regressed' when a benchmark got slower by more than ``tolerance``,
+    'improved' when it got as much faster, else 'ok' ('new' / 'missing'
+    when only one side has it). ``only`` limits the comparison to the
+    groups that were run.
+    """
+    rows = []
+    current, before = document['results'], baseline['results']
+    for name in list(before) + [name for name in current if name not in before]:
+        if only and name.split('[')[0] not in only:
+            continue
+        if name not in current:
+            rows.append((name, before[name]['min'], None, None, 'missing'))
+        elif name not in before:
+            rows.append((name, None, current[name]['min'], None, 'new'))
+        else:
+            ratio = current[name]['min'] / before[name]['min']
+            status = 'regressed' if ratio > 1 + tolerance else 'improved' if ratio < 1 / (1 + tolerance) else 'ok'
+            rows.append((name, before[name]['min'], current[name]['min'], ratio, status))
+    return rows
@@ -0,0 +1,280 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import multiprocessing
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextvars import ContextVar
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+
+from app.fuzzy import get_lookup_tables, get_ruleset, get_vectorized_systems, ruleset_names, score
+from app.indicators import compute_indicators, indicator_columns
+from app.timing import stage
+
+_lock = threading.Lock()
+# Thread count -> executor, so tests and the load test can change COMPUTE_THREADS
+_executors = {}
+_pool = None
+
+# Jobs queued or running in the compute threads, and what became of the others
+_pending = 0
+_counts = Counter()
+
+# Set by ?profile=1 so the profiler sees the work, which it can't in other threads
+inline = ContextVar('inline_compute', default=False)
+
+# Boolean indicator columns, carried as 0/1 through the shared memory
+flag_columns = {'SupportArea', 'ResistanceArea', 'BullishHammer', 'Doji', 'MACD_GoldenCross',
+                'MACD_DeathCross', 'Above_EMA_200', 'Engulfing'}
+score_columns = ['Entry_Position', 'Exit_Position']
+price_columns = ['Open', 'High', 'Low', 'Close']
+
+
+class ComputeBusy(Exception):
+    """``COMPUTE_QUEUE_LIMIT`` jobs are already queued or running."""
+
+
+class ComputeTimeout(Exception):
+    """A job took longer than ``COMPUTE_TIMEOUT``."""
+
+
+def get_executor():
+    """The pool running the CPU-heavy work of the async views, ``None`` when ``COMPUTE_THREADS`` is 0."""
+    threads = settings.COMPUTE_THREADS
+    if not threads:
+        return None
+    with _lock:
+        if threads not in _executors:
+            _executors[threads] = ThreadPoolExecutor(threads, thread_name_prefix='compute')
+        return _executors[threads]
+
+
+def _release(future):
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+async def run_compute(func, *args, **kwargs):
+    """
+    Await ``func(*args, **kwargs)`` run in the compute pool, so indicators,
+    fuzzy scoring and encoding don't block the event loop. At most
+    ``COMPUTE_THREADS`` run at once, the rest wait their turn. The context
+    (the request's ``app.timing`` timer) goes along. ``func`` must not touch
+    the database: those threads aren't Django's sync thread.
+
+    Raises ``ComputeBusy`` rather than queueing past ``COMPUTE_QUEUE_LIMIT``
+    jobs, and ``ComputeTimeout`` when the result takes longer than
+    ``COMPUTE_TIMEOUT`` seconds (the thread still finishes the job).
+    """
+    global _pending
+    executor = get_executor()
+    if executor is None or inline.get():
+        return func(*args, **kwargs)
+
+    with _lock:
+        if _pending >= settings.COMPUTE_QUEUE_LIMIT:
+            _counts['rejected'] += 1
+            raise ComputeBusy(f'{_pending} compute jobs pending')
+        _pending += 1
+    future = executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+    # Counted out when the job ends or is cancelled before it starts
+    future.add_done_callback(_release)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), settings.COMPUTE_TIMEOUT)
+    except asyncio.TimeoutError:
+        with _lock:
+            _counts['timeouts'] += 1
+        raise ComputeTimeout(f'No result after {settings.COMPUTE_TIMEOUT}s')
+
+
+async def async_chunks(chunks, database=False):
+    """
+    ``chunks``, a generator of response chunks, as an async iterator for
+    ``StreamingHttpResponse``. Each chunk is made in the compute threads, or
+    in Django's sync thread when reading it queries the ``database``. A
+    started response isn't subject to the queue limit or the timeout.
+    """
+    while True:
+        if database:
+            chunk = await sync_to_async(next)(chunks, None)
+        else:
+            chunk = await _unbounded(next, chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def stream_chunks(request, chunks, database=False):
+    """
+    ``chunks`` for the ``StreamingHttpResponse`` of ``request``, in the
+    kind of iterator its server consumes as it goes: ``async_chunks`` under
+    ASGI, the generator itself under WSGI. Django buffers the whole body of
+    the other kind.
+    """
+    if isinstance(request, ASGIRequest):
+        return async_chunks(chunks, database)
+    return chunks
+
+
+async def _unbounded(func, *args):
+    executor = get_executor()
+    if executor is None or inline.get():
+        return func(*args)
+    return await asyncio.wrap_future(executor.submit(contextvars.copy_context().run, func, *args))
+
+
+def _warm():
+    # Worker initializer: a spawned process has to set Django up itself,
+    # then compiles the fuzzy systems before the first job comes in. This
+    # module is imported before that, so it must not import the models
+    import django
+    django.setup()
+    for name in ruleset_names():
+        ruleset = get_ruleset(name)
+        get_vectorized_systems(ruleset)
+        if settings.FUZZY_LUT_MODE:
+            get_lookup_tables(ruleset)
+
+
+def _ready():
+    return True
+
+
+def get_pool():
+    """The warm worker processes scoring for the API, ``None`` when ``COMPUTE_PROCESSES`` is 0."""
+    global _pool
+    if not settings.COMPUTE_PROCESSES:
+        return None
+    with _lock:
+        if _pool is None:
+            # Spawned, not forked: the server has threads (and their locks) running
+            _pool = ProcessPoolExecutor(settings.COMPUTE_PROCESSES, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_warm)
+        return _pool
+
+
+def start_pool():
+    """Start the worker processes now rather than on the first request."""
+    pool = get_pool()
+    if pool is not None:
+        pool.submit(_ready).result()
+
+
+def shutdown_pool():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+
+def score_frame(df, ruleset=None, by=None):
+    """
+    Add the indicator columns ``df`` lacks (all or none) and the fuzzy
+    scores, with ``compute_indicators(by=by)`` and ``score``. Done by the
+    warm worker processes when ``COMPUTE_PROCESSES`` is set, the frame's
+    arrays going through shared memory; here otherwise, or when the pool
+    broke. Returns ``df``.
+    """
+    ruleset = ruleset or get_ruleset()
+    pool = get_pool()
+    if pool is not None and len(df):
+        try:
+            with stage('pool'):
+                return _score_in_pool(pool, df, ruleset, by)
+        except BrokenProcessPool:
+            logging.exception('Compute pool broken, scoring in process')
+            shutdown_pool()
+            with _lock:
+                _counts['fallbacks'] += 1
+    return _score_here(df, ruleset, by)
+
+
+def _score_here(df, ruleset, by=None):
+    if not set(indicator_columns.values()) <= set(df.columns):
+        with stage('indicators'):
+            compute_indicators(df, by=by)
+    # Score every row at once with the vectorized fuzzy engine
+    with stage('fuzzy'):
+        score(df, ruleset=ruleset)
+    return df
+
+
+def _layout(by, compute):
+    # Columns of the shared block: the ones sent, then the ones sent back
+    sent = price_columns + ([by] if by else [])
+    if compute:
+        return sent, list(indicator_columns.values()) + score_columns
+    return sent + list(indicator_columns.values()), score_columns
+
+
+def _score_in_pool(pool, df, ruleset, by):
+    compute = not set(indicator_columns.values()) <= set(df.columns)
+    sent, returned = _layout(by, compute)
+    shape = (len(df), len(sent) + len(returned))
+    block = shared_memory.SharedMemory(create=True, size=shape[0] * shape[1] * 8)
+    try:
+        values = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+        values[:, :len(sent)] = df[sent].to_numpy(dtype=np.float64)
+        future = pool.submit(_score_shared, block.name, shape, ruleset, by, compute)
+        try:
+            future.result(timeout=settings.COMPUTE_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            with _lock:
+                _counts['timeouts'] += 1
+            raise ComputeTimeout(f'No result after {settings.COMPUTE_TIMEOUT}s')
+        for number, column in enumerate(returned, len(sent)):
+            df[column] = values[:, number].astype(bool) if column in flag_columns else values[:, number].copy()
+        del values
+    finally:
+        block.close()
+        block.unlink()
+    return df
+
+
+def _score_shared(name, shape, ruleset, by, compute):
+    # Runs in a worker: read the sent columns, write back the returned ones
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        values = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+        sent, returned = _layout(by, compute)
+        df = pd.DataFrame({
+            column: values[:, number].astype(bool) if column in flag_columns else values[:, number].copy()
+            for number, column in enumerate(sent)
+        })
+        _score_here(df, ruleset, by)
+        values[:, len(sent):] = df[returned].to_numpy(dtype=np.float64)
+        del values
+    finally:
+        block.close()
+
+
+def metric_lines():
+    """Queue depth and outcomes of the compute jobs, in Prometheus text format."""
+    with _lock:
+        pending, counts = _pending, dict(_counts)
+    return [
+        '# HELP compute_queue_depth Compute jobs queued or running.',
+        '# TYPE compute_queue_depth gauge',
+        f'compute_queue_depth {pending}',
+        '# HELP compute_rejected_total Compute jobs refused because the queue was full.',
+        '# TYPE compute_rejected_total counter',
+        f"compute_rejected_total {counts.get('rejected', 0)}",
+        '# HELP compute_timeouts_total Compute jobs that ran past COMPUTE_TIMEOUT.',
+        '# TYPE compute_timeouts_total counter',
+        f"compute_timeouts_total {counts.get('timeouts', 0)}",
+        '# HELP compute_fallbacks_total Jobs scored in process because the worker pool broke.',
+        '# TYPE compute_fallbacks_total counter',
+        f"compute_fallbacks_total {counts.get('fallbacks', 0)}",
+    ]
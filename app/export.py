@@ -0,0 +1,148 @@
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+
+from app.fuzzy import score
+from app.indicator_store import attach_indicators
+from app.indicators import compute_indicators, indicator_columns, prices_to_frame
+from app.models import Indicator, Price
+
+export_formats = {
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+price_fields = ['date', 'open', 'high', 'low', 'close', 'volume']
+
+
+def export_schema(signals=False):
+    """Arrow schema of the export, with the indicator and score columns when ``signals``."""
+    fields = [
+        pa.field('Code', pa.dictionary(pa.int32(), pa.string())),
+        pa.field('Date', pa.date32()),
+        pa.field('Open', pa.float64()),
+        pa.field('High', pa.float64()),
+        pa.field('Low', pa.float64()),
+        pa.field('Close', pa.float64()),
+        pa.field('Volume', pa.int64()),
+    ]
+    if signals:
+        for field, column in indicator_columns.items():
+            boolean = Indicator._meta.get_field(field).get_internal_type() == 'BooleanField'
+            fields.append(pa.field(column, pa.bool_() if boolean else pa.float64()))
+        fields += [pa.field('Entry_Position', pa.float64()), pa.field('Exit_Position', pa.float64())]
+    return pa.schema(fields)
+
+
+def _full_history(stock):
+    history = list(Price.objects.filter(stock=stock).order_by('date').values())
+    return compute_indicators(prices_to_frame(history))
+
+
+def iter_frames(stocks, signals=False, chunk_rows=None):
+    """
+    Yield the bars of ``stocks`` as DataFrames of at most ``chunk_rows``
+    rows, stock by stock in date order.
+
+    Each chunk is one keyset query on (stock, date), so memory stays
+    bounded whatever the history length. With ``signals`` the chunks carry
+    the stored indicators of their range and are scored; a stock whose
+    store is behind has its indicators computed over its whole history.
+    """
+    chunk_rows = chunk_rows or settings.EXPORT_CHUNK_ROWS
+    columns = [field.name for field in export_schema(signals)]
+
+    for stock in stocks:
+        history = None
+        last_date = None
+        while True:
+            prices = Price.objects.filter(stock=stock).order_by('date')
+            if last_date is not None:
+                prices = prices.filter(date__gt=last_date)
+            rows = list(prices.values(*price_fields)[:chunk_rows])
+            if not rows:
+                break
+            last_date = rows[-1]['date']
+
+            df = prices_to_frame(rows)
+            if signals:
+                if history is None and not attach_indicators(stock, df):
+                    history = _full_history(stock)
+                if history is not None:
+                    df = history[history['Date'].isin(set(df['Date']))].reset_index(drop=True)
+                score(df)
+            df.insert(0, 'Code', pd.Categorical([stock.code] * len(df)))
+            yield df[columns]
+
+            if len(rows) < chunk_rows:
+                break
+
+
+def iter_batches(stocks, signals=False, chunk_rows=None):
+    """``iter_frames`` as Arrow record batches of ``export_schema(signals)``."""
+    schema = export_schema(signals)
+    for df in iter_frames(stocks, signals, chunk_rows):
+        yield pa.RecordBatch.from_pandas(df, schema=schema, preserve_index=False)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last ``drain``."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _open_writer(sink, export_format, schema):
+    if export_format == 'parquet':
+        return pq.ParquetWriter(sink, schema)
+    return pa.ipc.new_stream(sink, schema)
+
+
+def stream_export(stocks, export_format='arrow', signals=False, chunk_rows=None):
+    """
+    Yield an Arrow IPC stream or a Parquet file of ``stocks`` as bytes,
+    one record batch (or row group) at a time.
+    """
+    schema = export_schema(signals)
+    sink = _ChunkSink()
+    writer = _open_writer(sink, export_format, schema)
+    for batch in iter_batches(stocks, signals, chunk_rows):
+        if export_format == 'parquet':
+            writer.write_batch(batch, row_group_size=batch.num_rows)
+        else:
+            writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def write_export(path, stocks, export_format='arrow', signals=False, chunk_rows=None):
+    """Write the export of ``stocks`` to ``path``. Returns the number of rows."""
+    rows = 0
+    with open(path, 'wb') as output:
+        writer = _open_writer(output, export_format, export_schema(signals))
+        for batch in iter_batches(stocks, signals, chunk_rows):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+        writer.close()
+    return rows
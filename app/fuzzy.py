@@ -0,0 +1,500 @@
+import hashlib
+import itertools
+import json
+import math
+import operator
+import os
+import queue
+import re
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import partial, reduce
+
+import numpy as np
+import skfuzzy as fuzz
+from django.conf import settings
+from skfuzzy import control as ctrl
+from skfuzzy.control.term import Term, TermAggregate
+
+
+class RuleSet:
+    """
+    Membership functions and entry/exit rules read from
+    ``settings.FUZZY_RULESETS_DIR/<name>.json`` (see ``default.json``).
+
+    ``inputs`` maps each antecedent to its DataFrame column, universe
+    (``np.arange`` arguments) and triangular terms; ``outputs`` does the same
+    for ``entry_position`` / ``exit_position`` and ``rules`` lists, per
+    output, the AND of antecedent terms that sets one of its terms.
+    ``version`` hashes the definition: cached scores and compiled systems
+    are keyed by it, so an edited file takes effect without a deploy.
+    """
+
+    def __init__(self, name, definition):
+        self.name = name
+        self.definition = definition
+        self.version = hashlib.sha256(json.dumps(definition, sort_keys=True).encode()).hexdigest()[:16]
+
+    def inputs(self, output):
+        """``{antecedent: column}`` of the inputs the rules of ``output`` read."""
+        used = {label for rule in self.definition['rules'][output] for label in rule['if']}
+        return {label: variable['column'] for label, variable in self.definition['inputs'].items()
+                if label in used}
+
+    @property
+    def columns(self):
+        """Every DataFrame column the rule set reads."""
+        return list(dict.fromkeys([*self.inputs('entry_position').values(), *self.inputs('exit_position').values()]))
+
+
+_rulesets = {}
+
+
+def ruleset_names():
+    """Names of the rule sets in ``settings.FUZZY_RULESETS_DIR``."""
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(settings.FUZZY_RULESETS_DIR)
+                  if name.endswith('.json'))
+
+
+def get_ruleset(name=None):
+    """
+    Return the ``RuleSet`` called ``name`` (default ``settings.FUZZY_RULESET``),
+    re-read when its file changed. Raises ``ValueError`` for an unknown name.
+    """
+    name = name or settings.FUZZY_RULESET
+    if not re.fullmatch(r'[\w-]+', name):
+        raise ValueError(f"Unknown rule set '{name}'")
+    path = os.path.join(settings.FUZZY_RULESETS_DIR, f'{name}.json')
+    try:
+        modified = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        raise ValueError(f"Unknown rule set '{name}'")
+
+    cached = _rulesets.get(path)
+    if cached is None or cached[0] != modified:
+        with open(path) as ruleset_file:
+            cached = (modified, RuleSet(name, json.load(ruleset_file)))
+        _rulesets[path] = cached
+    return cached[1]
+
+
+def build_control_systems(ruleset=None, memberships=None):
+    """
+    Build the skfuzzy entry and exit ``ControlSystem``s of ``ruleset``
+    (default ``get_ruleset()``). ``memberships`` overrides input terms,
+    e.g. ``{'rsi': {'oversold': [0, 25, 40]}}``.
+    """
+    definition = (ruleset or get_ruleset()).definition
+    memberships = memberships or {}
+
+    # Define the input and output variables with their membership functions
+    antecedents = {}
+    for label, variable in definition['inputs'].items():
+        antecedent = ctrl.Antecedent(np.arange(*variable['universe']), label)
+        for term, abc in {**variable['terms'], **memberships.get(label, {})}.items():
+            antecedent[term] = fuzz.trimf(antecedent.universe, abc)
+        antecedents[label] = antecedent
+
+    systems = []
+    for label in ('entry_position', 'exit_position'):
+        variable = definition['outputs'][label]
+        consequent = ctrl.Consequent(np.arange(*variable['universe']), label)
+        for term, abc in variable['terms'].items():
+            consequent[term] = fuzz.trimf(consequent.universe, abc)
+
+        rules = [
+            ctrl.Rule(reduce(operator.and_, [antecedents[name][term] for name, term in rule['if'].items()]),
+                      consequent[rule['then']])
+            for rule in definition['rules'][label]
+        ]
+        systems.append(ctrl.ControlSystem(rules))
+
+    entry_position_ctrl, exit_position_ctrl = systems
+    return entry_position_ctrl, exit_position_ctrl
+
+
+class VectorizedSystem:
+    """
+    Batched Mamdani evaluator compiled from a skfuzzy ``ControlSystem``.
+
+    Rules are evaluated on whole input columns at once and every row is
+    defuzzified in a single pass. The semantics follow
+    ``ControlSystemSimulation``: inputs are clipped to their universe, AND/OR
+    use the rule's ``fmin``/``fmax`` (so a NaN membership is ignored when the
+    other side is defined) and the centroid is taken over the universe
+    upsampled with the cut crossing points. Rows whose aggregated output has
+    no area, which skfuzzy rejects with a ``ValueError``, come out as NaN.
+    """
+
+    def __init__(self, control_system):
+        self.antecedents = {a.label: a for a in control_system.antecedents}
+        self.rules = list(control_system.rules)
+        self.consequents = list(control_system.consequents)
+
+    def compute(self, inputs):
+        """
+        Evaluate the system for ``inputs``, a dict of antecedent label to a
+        1-d array (all the same length). Returns a dict of consequent label
+        to a float64 array of crisp outputs.
+        """
+        memberships = {}
+        for label, antecedent in self.antecedents.items():
+            if label not in inputs:
+                raise ValueError("All antecedents must have input values!")
+            value = np.asarray(inputs[label], dtype=np.float64)
+            universe = antecedent.universe
+            value = np.where(value > universe.max(), universe.max(), value)
+            value = np.where(value < universe.min(), universe.min(), value)
+            for term in antecedent.terms.values():
+                memberships[term] = np.interp(value, universe, term.mf, left=0.0, right=0.0)
+
+        cuts = {}
+        for rule in self.rules:
+            firing = self._firing(rule.antecedent, rule, memberships)
+            for weighted in rule.consequent:
+                activation = firing * weighted.weight
+                term = weighted.term
+                if term in cuts:
+                    cuts[term] = term.parent.accumulation_method(activation, cuts[term])
+                else:
+                    cuts[term] = activation
+
+        return {
+            consequent.label: self._defuzz(consequent, cuts)
+            for consequent in self.consequents
+        }
+
+    def _firing(self, antecedent, rule, memberships):
+        if isinstance(antecedent, Term):
+            return memberships[antecedent]
+        assert isinstance(antecedent, TermAggregate)
+        term1 = self._firing(antecedent.term1, rule, memberships)
+        if antecedent.kind == 'and':
+            return rule.and_func(term1, self._firing(antecedent.term2, rule, memberships))
+        elif antecedent.kind == 'or':
+            return rule.or_func(term1, self._firing(antecedent.term2, rule, memberships))
+        elif antecedent.kind == 'not':
+            return 1. - term1
+        raise NotImplementedError()
+
+    @staticmethod
+    def _defuzz(consequent, cuts):
+        universe = consequent.universe.astype(np.float64)
+        terms = [term for term in consequent.terms.values() if term in cuts]
+        if len(terms) == 0:
+            raise ValueError("No terms have memberships.  Make sure you "
+                             "have at least one rule connected to this "
+                             "variable and have run the rules calculation.")
+        # Rows often share the same cuts, so defuzzify each distinct set once
+        distinct, inverse = np.unique(
+            np.column_stack([cuts[term] for term in terms]), axis=0, return_inverse=True)
+        cuts = {term: distinct[:, i] for i, term in enumerate(terms)}
+        rows = len(distinct)
+
+        # Upsample the universe with the points where each term crosses its cut
+        points = [np.broadcast_to(universe, (rows, len(universe)))]
+        for term in terms:
+            mf = term.mf.astype(np.float64)
+            cut = cuts[term][:, None]
+            above = np.where(cut == 0., mf > cut, mf >= cut)
+            crossing = above[:, 1:] != above[:, :-1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x = universe[:-1] + (cut - mf[:-1]) * np.diff(universe) / np.diff(mf)
+            # Padding with the universe end gives zero-width segments
+            points.append(np.where(crossing, x, universe[-1]))
+        x = np.sort(np.concatenate(points, axis=1), axis=1)
+
+        # Aggregate the clipped output memberships on the upsampled universe
+        y = np.zeros_like(x)
+        for term in terms:
+            clipped = np.interp(x, universe, term.mf.astype(np.float64))
+            np.maximum(y, np.minimum(cuts[term][:, None], clipped), y)
+
+        # Exact centroid of the piecewise linear output (as skfuzzy.centroid)
+        x1, x2 = x[:, :-1], x[:, 1:]
+        y1, y2 = y[:, :-1], y[:, 1:]
+        width = x2 - x1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            moment = np.select(
+                [y1 == y2, (y1 == 0.) & (y2 != 0.), (y2 == 0.) & (y1 != 0.)],
+                [0.5 * (x1 + x2), 2. / 3. * width + x1, 1. / 3. * width + x1],
+                (2. / 3. * width * (y2 + 0.5 * y1)) / (y1 + y2) + x1,
+            )
+        area = np.select(
+            [y1 == y2, (y1 == 0.) & (y2 != 0.), (y2 == 0.) & (y1 != 0.)],
+            [width * y1, 0.5 * width * y2, 0.5 * width * y1],
+            0.5 * width * (y1 + y2),
+        )
+        skip = ((y1 == 0.) & (y2 == 0.)) | (x1 == x2)
+        moment = np.where(skip, 0., moment)
+        area = np.where(skip, 0., area)
+
+        output = (moment * area).sum(axis=1) / np.fmax(area.sum(axis=1), np.finfo(float).eps)
+        output[y.sum(axis=1) == 0] = np.nan
+        return output[inverse.ravel()]
+
+
+class LookupTable:
+    """
+    Precomputed outputs of a ``VectorizedSystem`` over its discrete input grid.
+
+    Antecedents with a ``[0, 1]`` universe are treated as boolean flags and
+    every other antecedent is sampled at each point of its universe, plus one
+    extra slot for NaN inputs. Scoring then becomes an array gather.
+
+    ``lookup`` supports two interpolation modes for the continuous axes:
+
+    * ``'nearest'`` rounds each input to the closest grid point. This is exact
+      for inputs on the grid and otherwise off by at most the output change
+      over half a grid step.
+    * ``'linear'`` blends the outputs of the surrounding grid points
+      (bilinear for two continuous axes). It is smoother but still an
+      approximation: the centroid is not a linear function of the inputs.
+    """
+
+    interpolations = ('nearest', 'linear')
+
+    def __init__(self, system, chunk_size=20000):
+        self.labels = list(system.antecedents)
+        self.universes = [system.antecedents[label].universe.astype(np.float64) for label in self.labels]
+        self.flags = [len(universe) == 2 for universe in self.universes]
+
+        axes = [
+            universe if flag else np.append(universe, np.nan)
+            for universe, flag in zip(self.universes, self.flags)
+        ]
+        self.shape = tuple(len(axis) for axis in axes)
+        grid = [values.ravel() for values in np.meshgrid(*axes, indexing='ij')]
+
+        self.tables = {consequent.label: np.empty(grid[0].size) for consequent in system.consequents}
+        for start in range(0, grid[0].size, chunk_size):
+            chunk = {label: values[start:start + chunk_size] for label, values in zip(self.labels, grid)}
+            for label, output in system.compute(chunk).items():
+                self.tables[label][start:start + chunk_size] = output
+        self.tables = {label: table.reshape(self.shape) for label, table in self.tables.items()}
+        # (first, last, step, points) of each universe as plain floats, for lookup_row
+        self.axes = [(float(universe[0]), float(universe[-1]), float(universe[1] - universe[0]), len(universe))
+                     for universe in self.universes]
+
+    def lookup(self, inputs, interpolation='nearest'):
+        """Same contract as ``VectorizedSystem.compute``, answered from the table."""
+        if interpolation not in self.interpolations:
+            raise ValueError("Unknown interpolation %r, expected one of %s" % (interpolation, self.interpolations))
+
+        # Per axis: list of (index, weight) pairs to blend
+        corners = []
+        for label, universe, flag in zip(self.labels, self.universes, self.flags):
+            value = np.clip(np.asarray(inputs[label], dtype=np.float64), universe[0], universe[-1])
+            step = universe[1] - universe[0]
+            position = (value - universe[0]) / step
+            missing = np.isnan(value)
+            if flag or interpolation == 'nearest':
+                index = np.where(missing, len(universe), np.rint(np.nan_to_num(position))).astype(np.intp)
+                corners.append([(index, 1.)])
+            else:
+                lower = np.minimum(np.floor(np.nan_to_num(position)), len(universe) - 2)
+                fraction = np.where(missing, 0., position - lower)
+                lower = np.where(missing, len(universe), lower).astype(np.intp)
+                upper = np.where(missing, len(universe), lower + 1).astype(np.intp)
+                corners.append([(lower, 1. - fraction), (upper, fraction)])
+
+        outputs = {}
+        for label, table in self.tables.items():
+            output = 0.
+            for corner in np.ndindex(*[len(axis) for axis in corners]):
+                index = tuple(corners[axis][i][0] for axis, i in enumerate(corner))
+                weight = reduce(np.multiply, [corners[axis][i][1] for axis, i in enumerate(corner)])
+                # Skip zero weights so a NaN neighbour doesn't leak in
+                output = output + np.where(weight == 0., 0., weight * table[index])
+            outputs[label] = output
+        return outputs
+
+    def lookup_row(self, inputs, interpolation='nearest'):
+        """
+        ``lookup`` of one row, ``{label: value}``, in plain Python: NumPy's
+        per-call overhead dwarfs the work on a single value. Returns
+        ``{consequent label: float}`` with the same results.
+        """
+        if interpolation not in self.interpolations:
+            raise ValueError("Unknown interpolation %r, expected one of %s" % (interpolation, self.interpolations))
+
+        corners = []
+        for label, (first, last, step, points), flag in zip(self.labels, self.axes, self.flags):
+            value = float(inputs[label])
+            if math.isnan(value):
+                corners.append([(points, 1.)] if flag or interpolation == 'nearest' else [(points, 1.), (points, 0.)])
+                continue
+            position = (min(max(value, first), last) - first) / step
+            if flag or interpolation == 'nearest':
+                corners.append([(round(position), 1.)])
+            else:
+                lower = min(math.floor(position), points - 2)
+                fraction = position - lower
+                corners.append([(lower, 1. - fraction), (lower + 1, fraction)])
+
+        outputs = {}
+        for label, table in self.tables.items():
+            output = 0.
+            for corner in itertools.product(*corners):
+                weight = reduce(operator.mul, [weight for _, weight in corner])
+                if weight != 0.:
+                    output = output + weight * float(table[tuple(index for index, _ in corner)])
+            outputs[label] = output
+        return outputs
+
+
+_lock = threading.Lock()
+# Compiled per rule set version, so switching between rule sets compiles nothing
+_vectorized_systems = {}
+
+
+def get_vectorized_systems(ruleset=None):
+    """
+    Return the process-wide ``(entry, exit)`` ``VectorizedSystem`` pair of
+    ``ruleset`` (default ``get_ruleset()``), compiling the rule bases on
+    first use. ``VectorizedSystem.compute`` keeps no state, so the pair is
+    shared by every thread and request.
+    """
+    ruleset = ruleset or get_ruleset()
+    systems = _vectorized_systems.get(ruleset.version)
+    if systems is None:
+        with _lock:
+            systems = _vectorized_systems.get(ruleset.version)
+            if systems is None:
+                entry_position_ctrl, exit_position_ctrl = build_control_systems(ruleset)
+                systems = _vectorized_systems[ruleset.version] = (
+                    VectorizedSystem(entry_position_ctrl),
+                    VectorizedSystem(exit_position_ctrl),
+                )
+    return systems
+
+
+class SimulationPool:
+    """
+    Pool of ``(entry, exit)`` skfuzzy ``ControlSystemSimulation`` pairs.
+
+    skfuzzy stores the current input of a simulation on the ``Antecedent``
+    objects themselves, so two threads can't drive simulations of the same
+    ``ControlSystem`` at once. Every pooled pair therefore owns its own
+    control systems; pairs are built on demand and reused afterwards.
+    """
+
+    def __init__(self):
+        self._idle = defaultdict(queue.LifoQueue)
+
+    @contextmanager
+    def simulations(self, ruleset=None):
+        ruleset = ruleset or get_ruleset()
+        idle = self._idle[ruleset.version]
+        try:
+            pair = idle.get_nowait()
+        except queue.Empty:
+            entry_position_ctrl, exit_position_ctrl = build_control_systems(ruleset)
+            pair = (
+                ctrl.ControlSystemSimulation(entry_position_ctrl),
+                ctrl.ControlSystemSimulation(exit_position_ctrl),
+            )
+        try:
+            yield pair
+        finally:
+            idle.put(pair)
+
+
+simulation_pool = SimulationPool()
+
+
+_lookup_tables = {}
+
+
+def get_lookup_tables(ruleset=None):
+    """Return the process-wide ``(entry, exit)`` ``LookupTable`` pair of ``ruleset``, built on first use."""
+    ruleset = ruleset or get_ruleset()
+    tables = _lookup_tables.get(ruleset.version)
+    if tables is None:
+        entry_system, exit_system = get_vectorized_systems(ruleset)
+        with _lock:
+            tables = _lookup_tables.get(ruleset.version)
+            if tables is None:
+                tables = _lookup_tables[ruleset.version] = (LookupTable(entry_system), LookupTable(exit_system))
+    return tables
+
+
+def score(df, lut_mode=None, systems=None, ruleset=None):
+    """
+    Add ``Entry_Position`` and ``Exit_Position`` to ``df``, scored with
+    ``ruleset`` (default ``get_ruleset()``).
+
+    ``lut_mode`` (default ``settings.FUZZY_LUT_MODE``) selects the
+    ``LookupTable`` interpolation; when it is empty the vectorized engine
+    computes the exact outputs. ``systems`` is an ``(entry, exit)``
+    ``VectorizedSystem`` pair built from ``ruleset`` to use instead of the
+    process-wide one.
+    """
+    ruleset = ruleset or get_ruleset()
+    if lut_mode is None:
+        lut_mode = getattr(settings, 'FUZZY_LUT_MODE', None)
+
+    if systems is not None:
+        entry_system, exit_system = (system.compute for system in systems)
+    elif lut_mode:
+        entry_table, exit_table = get_lookup_tables(ruleset)
+        entry_system = partial(entry_table.lookup, interpolation=lut_mode)
+        exit_system = partial(exit_table.lookup, interpolation=lut_mode)
+    else:
+        entry_system, exit_system = (system.compute for system in get_vectorized_systems(ruleset))
+
+    entry = entry_system(
+        {label: df[column].to_numpy(dtype=np.float64) for label, column in ruleset.inputs('entry_position').items()})
+    exit = exit_system(
+        {label: df[column].to_numpy(dtype=np.float64) for label, column in ruleset.inputs('exit_position').items()})
+
+    df['Entry_Position'] = entry['entry_position']
+    df['Exit_Position'] = exit['exit_position']
+    return df
+
+
+def score_row(row, lut_mode=None, ruleset=None):
+    """
+    ``score`` for a single row given as ``{column: value}``, without the
+    DataFrame overhead. Returns ``(entry_position, exit_position)``.
+    """
+    ruleset = ruleset or get_ruleset()
+    if lut_mode is None:
+        lut_mode = getattr(settings, 'FUZZY_LUT_MODE', None)
+    entry_inputs = {label: row[column] for label, column in ruleset.inputs('entry_position').items()}
+    exit_inputs = {label: row[column] for label, column in ruleset.inputs('exit_position').items()}
+    if lut_mode:
+        entry_table, exit_table = get_lookup_tables(ruleset)
+        return (entry_table.lookup_row(entry_inputs, lut_mode)['entry_position'],
+                exit_table.lookup_row(exit_inputs, lut_mode)['exit_position'])
+
+    entry_system, exit_system = get_vectorized_systems(ruleset)
+    entry = entry_system.compute({label: np.array([value], dtype=np.float64) for label, value in entry_inputs.items()})
+    exit = exit_system.compute({label: np.array([value], dtype=np.float64) for label, value in exit_inputs.items()})
+    return float(entry['entry_position'][0]), float(exit['exit_position'][0])
+
+
+def score_skfuzzy(df, ruleset=None):
+    """
+    Reference implementation of ``score`` running one
+    ``ControlSystemSimulation.compute()`` per row.
+    """
+    ruleset = ruleset or get_ruleset()
+    entry_inputs = ruleset.inputs('entry_position')
+    exit_inputs = ruleset.inputs('exit_position')
+    with simulation_pool.simulations(ruleset) as (entry_position_simulation, exit_position_simulation):
+        # Loop through the data and predict the entry entry_position for each row
+        for i in range(len(df)):
+            # Set the input values for the current row
+            for label, column in entry_inputs.items():
+                entry_position_simulation.input[label] = df.loc[i, column]
+            entry_position_simulation.compute()
+
+            for label, column in exit_inputs.items():
+                exit_position_simulation.input[label] = df.loc[i, column]
+            exit_position_simulation.compute()
+
+            df.loc[i, 'Entry_Position'] = entry_position_simulation.output['entry_position']
+            df.loc[i, 'Exit_Position'] = exit_position_simulation.output['exit_position']
+    return df
@@ -0,0 +1,161 @@
+import math
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+
+from app.indicators import (
+    WARMUP_BARS,
+    IndicatorState,
+    compute_indicators,
+    indicator_columns,
+    prices_to_frame,
+)
+from app.models import Indicator, Price, Signal, Stock
+
+ohlc_fields = ('open', 'high', 'low', 'close')
+
+
+def _to_db(value):
+    # NaN becomes NULL; NumPy scalars become plain Python values
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def _indicator(stock, date, row):
+    return Indicator(
+        stock=stock,
+        date=date,
+        **{field: _to_db(row[column]) for field, column in indicator_columns.items()}
+    )
+
+
+def _lock_stock(stock):
+    # Writers of the same stock's indicators (a scrape in a worker, a CSV
+    # upload) take turns, so none computes its rows from a stale last date.
+    # A no-op UPDATE rather than select_for_update, which SQLite ignores:
+    # it locks the row, and on SQLite takes the write lock up front
+    Stock.objects.filter(pk=stock.pk).update(data_version=F('data_version'))
+
+
+def recompute_indicators(stock):
+    """
+    Replace the stored indicators of ``stock`` with a from-scratch
+    computation. The snapshot scores computed from the old ones go too.
+    """
+    with transaction.atomic():
+        _lock_stock(stock)
+        data_list = list(Price.objects.filter(stock=stock).order_by('date').values())
+        Indicator.objects.filter(stock=stock).delete()
+        Signal.objects.filter(stock=stock).delete()
+        if not data_list:
+            return 0
+        df = compute_indicators(prices_to_frame(data_list))
+        # Column-wise NaN -> None conversion, much cheaper than per value
+        columns = [
+            df[column].astype(object).where(df[column].notna(), None).tolist()
+            for column in indicator_columns.values()
+        ]
+        Indicator.objects.bulk_create(
+            (
+                Indicator(stock=stock, date=date, **dict(zip(indicator_columns, values)))
+                for date, *values in zip(df['Date'], *columns)
+            ),
+            batch_size=1000,
+        )
+    return len(df)
+
+
+def update_indicators(stock):
+    """
+    Store the indicators of the bars of ``stock`` that don't have any yet.
+
+    The running state is rebuilt from the last ``WARMUP_BARS`` stored bars
+    and then advanced one bar at a time, so the cost grows with the number
+    of new bars rather than with the history, under a lock on the stock's
+    row so concurrent writers don't both append the same dates. Falls back to
+    ``recompute_indicators`` when nothing is stored yet or when bars were
+    inserted inside the already stored range. Returns the number of rows
+    written.
+    """
+    with transaction.atomic():
+        _lock_stock(stock)
+        last = Indicator.objects.filter(stock=stock).order_by('-date').values().first()
+        if last is None:
+            return recompute_indicators(stock)
+
+        stored = Indicator.objects.filter(stock=stock).count()
+        if Price.objects.filter(stock=stock, date__lte=last['date']).count() != stored:
+            return recompute_indicators(stock)
+
+        new_bars = list(
+            Price.objects.filter(stock=stock, date__gt=last['date']).order_by('date').values_list('date', *ohlc_fields)
+        )
+        if not new_bars:
+            return 0
+
+        state = stored_state(stock, last)
+        Indicator.objects.bulk_create(
+            _indicator(stock, date, state.update(*bar)) for date, *bar in new_bars
+        )
+        return len(new_bars)
+
+
+def stored_state(stock, last):
+    """
+    The ``IndicatorState`` of ``stock`` after ``last``, its last stored
+    ``Indicator`` row (as ``.values()``), rebuilt from the last
+    ``WARMUP_BARS`` bars up to it.
+    """
+    warmup = Price.objects.filter(stock=stock, date__lte=last['date']).order_by('-date').values_list(*ohlc_fields)
+    return IndicatorState.resume(reversed(list(warmup[:WARMUP_BARS])), last)
+
+
+def attach_indicators(stock, df):
+    """
+    Add the stored indicator columns of ``stock`` to ``df``, a frame built
+    from its ``Price`` rows in date order: all of them, or a contiguous
+    range (the stored values already account for the bars before it).
+    Returns ``False``, leaving ``df`` untouched, when the store doesn't
+    cover exactly those bars.
+    """
+    fields = ['date', *indicator_columns]
+    indicators = Indicator.objects.filter(stock=stock)
+    if len(df):
+        indicators = indicators.filter(date__gte=df['Date'].iloc[0], date__lte=df['Date'].iloc[-1])
+    rows = list(indicators.order_by('date').values_list(*fields))
+    if len(rows) != len(df) or any(row[0] != date for row, date in zip(rows, df['Date'])):
+        return False
+
+    columns = list(zip(*rows)) if rows else [()] * len(fields)
+    for (field, column), values in zip(indicator_columns.items(), columns[1:]):
+        if Indicator._meta.get_field(field).get_internal_type() == 'BooleanField':
+            df[column] = np.array(values, dtype=bool)
+        else:
+            df[column] = np.array(values, dtype=np.float64)
+    return True
+
+
+def verify_indicators(stock, rtol=1e-9):
+    """
+    Compare the stored indicators of ``stock`` with a from-scratch
+    computation. Returns a list of ``(date, column)`` mismatches.
+    """
+    data_list = list(Price.objects.filter(stock=stock).order_by('date').values())
+    if not data_list:
+        return []
+    expected = compute_indicators(prices_to_frame(data_list))
+    stored = prices_to_frame(data_list)
+    if not attach_indicators(stock, stored):
+        return [(None, 'missing rows')]
+
+    mismatches = []
+    for column in indicator_columns.values():
+        want = expected[column].to_numpy(dtype=np.float64)
+        got = stored[column].to_numpy(dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            same = np.isclose(got, want, rtol=rtol, atol=rtol, equal_nan=True)
+        mismatches.extend((expected['Date'][i], column) for i in np.flatnonzero(~same))
+    return mismatches
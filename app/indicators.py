@@ -0,0 +1,367 @@
+import math
+from collections import deque
+
+import pandas as pd
+
+
+# Column names used by the DataFrame pipeline, mapped from the Price model fields
+column_mapping = {
+    'date': 'Date',
+    'open': 'Open',
+    'high': 'High',
+    'low': 'Low',
+    'close': 'Close',
+    'adj': 'Adj Close',
+    'volume': 'Volume',
+}
+
+# Indicator model fields and the DataFrame column each one is stored from,
+# in the order compute_indicators() adds them
+indicator_columns = {
+    'rolling_min': 'RollingMin',
+    'rolling_max': 'RollingMax',
+    'support_area': 'SupportArea',
+    'resistance_area': 'ResistanceArea',
+    'body_length': 'BodyLength',
+    'bullish_hammer': 'BullishHammer',
+    'high_low_range': 'HighLowRange',
+    'doji': 'Doji',
+    'lowest_low': 'Lowest Low',
+    'highest_high': 'Highest High',
+    'percent_k': '%K',
+    'percent_d': '%D',
+    'delta': 'delta',
+    'gain': 'gain',
+    'loss': 'loss',
+    'avg_gain': 'avg_gain',
+    'avg_loss': 'avg_loss',
+    'rs': 'rs',
+    'rsi': 'RSI',
+    'ema_12': 'ema_12',
+    'ema_26': 'ema_26',
+    'macd_line': 'macd_line',
+    'signal_line': 'signal_line',
+    'macd_golden_cross': 'MACD_GoldenCross',
+    'macd_death_cross': 'MACD_DeathCross',
+    'above_ema_200': 'Above_EMA_200',
+    'engulfing': 'Engulfing',
+}
+
+# Longest window in compute_indicators(), the bars needed to warm the state up
+WARMUP_BARS = 200
+
+# Indicator windows: support/resistance rolling window, stochastic %K and
+# %D smoothing, RSI, MACD fast/slow/signal EMA spans and the trend SMA
+DEFAULT_WINDOWS = {
+    'rolling': 50,
+    'stochastic': (14, 3),
+    'rsi': 14,
+    'macd': (12, 26, 9),
+    'trend': 200,
+}
+
+
+def _rolling(series, window, by, how):
+    if by is None:
+        return getattr(series.rolling(window=window), how)()
+    return getattr(series.groupby(by, sort=False).rolling(window=window), how)().droplevel(0)
+
+
+def _ewm_mean(series, span, by):
+    if by is None:
+        return series.ewm(span=span, adjust=False).mean()
+    return series.groupby(by, sort=False).ewm(span=span, adjust=False).mean().droplevel(0)
+
+
+def _shift(series, by):
+    return series.shift(1) if by is None else series.groupby(by, sort=False).shift(1)
+
+
+def _diff(series, by):
+    return series.diff() if by is None else series.groupby(by, sort=False).diff()
+
+
+def compute_indicators(df, windows=None, by=None):
+    """
+    Add the technical analysis columns used as fuzzy inputs to ``df``.
+
+    ``df`` must hold the Open/High/Low/Close columns ordered by date with a
+    default RangeIndex. ``windows`` overrides some of ``DEFAULT_WINDOWS``
+    (the stored indicators always use the defaults). With ``by`` (e.g.
+    ``'stock_id'``) the frame holds several histories, one after the other,
+    and every window stays within its own group; each group gets the
+    values it would get on its own. The frame is modified in place and
+    returned.
+    """
+    windows = {**DEFAULT_WINDOWS, **(windows or {})}
+    by = df[by] if by is not None else None
+    stochastic_window, stochastic_smooth = windows['stochastic']
+    macd_fast, macd_slow, macd_signal = windows['macd']
+
+    # Determine local price extrema using rolling windows
+    df['RollingMin'] = _rolling(df['Close'], windows['rolling'], by, 'min')
+    df['RollingMax'] = _rolling(df['Close'], windows['rolling'], by, 'max')
+
+    # Identify support levels
+    df['SupportArea'] = ((abs(df['Close'] - df['RollingMin']) / df['RollingMin']) * 100) <= 3
+    df['ResistanceArea'] = ((abs(df['Close'] - df['RollingMax']) / df['RollingMax']) * 100) <= 3
+
+    #BullishHammer Pattern
+    df['BodyLength'] = abs(df['Open'] - df['Close'])
+    upperShadow = df['High'] - df[['Open', 'Close']].max(axis=1)
+    lowerShadow = df[['Open', 'Close']].min(axis=1) - df['Low']
+    df['BullishHammer'] = (df['Close'] > df['Open']) & (df['BodyLength'] < lowerShadow) & (lowerShadow > upperShadow * 2)
+
+    # Doji Pattern
+    df['HighLowRange'] = df['High'] - df['Low']
+    df['Doji'] = df['BodyLength'] <= (0.02 * df['HighLowRange'])
+
+    # Stochastic
+    df['Lowest Low'] = _rolling(df['Close'], stochastic_window, by, 'min')
+    df['Highest High'] = _rolling(df['Close'], stochastic_window, by, 'max')
+    df['%K'] = ((df['Close'] - df['Lowest Low']) / (df['Highest High'] - df['Lowest Low'])) * 100
+    df['%D'] = _rolling(df['%K'], stochastic_smooth, by, 'mean')
+
+    # Calculate RSI
+    df['delta'] = _diff(df['Close'], by)
+    df['gain'] = df['delta'].where(df['delta'] > 0, 0)
+    df['loss'] = -df['delta'].where(df['delta'] < 0, 0)
+    df['avg_gain'] = _rolling(df['gain'], windows['rsi'], by, 'mean')
+    df['avg_loss'] = _rolling(df['loss'], windows['rsi'], by, 'mean').abs()
+    df['rs'] = df['avg_gain'] / df['avg_loss']
+    df['RSI'] = 100 - (100 / (1 + df['rs']))
+
+    # macd setting
+    # 8, 21, 5
+    # 3, 17, 5
+    # 3, 10, 16
+
+    # Calculate the MACD line (12-day EMA minus 26-day EMA)
+    df['ema_12'] = _ewm_mean(df['Close'], macd_fast, by)
+    df['ema_26'] = _ewm_mean(df['Close'], macd_slow, by)
+    df['macd_line'] = df['ema_12'] - df['ema_26']
+    # Calculate the signal line (9-day EMA of the MACD line)
+    df['signal_line'] = _ewm_mean(df['macd_line'], macd_signal, by)
+
+    df['MACD_GoldenCross'] = (df['macd_line'] > df['signal_line']) & (_shift(df['macd_line'], by) < _shift(df['signal_line'], by))
+    df['MACD_DeathCross'] = (df['macd_line'] < df['signal_line']) & (_shift(df['macd_line'], by) > _shift(df['signal_line'], by))
+
+    df['Above_EMA_200'] = df['Close'] > _rolling(df['Close'], windows['trend'], by, 'mean')
+
+    df['Engulfing'] = (df['Close'] > df['Open']) & (_shift(df['Close'], by) < _shift(df['Open'], by)) & \
+                            (df['High'] > _shift(df['High'], by)) & (df['Low'] < _shift(df['Low'], by))
+
+    # # Add a column for the downtrend or consolidation condition
+    # df['Downtrend_Consolidation'] = (df['Close'] < df['Close'].rolling(window=50).mean())
+
+    return df
+
+
+def prices_to_frame(data_list):
+    """Build the pipeline DataFrame from ``Price`` rows as returned by ``.values()``."""
+    return pd.DataFrame(data_list).rename(columns=column_mapping)
+
+
+def _divide(a, b):
+    # Float division with NumPy semantics: x/0 is +-inf and 0/0 is NaN
+    if b == 0:
+        if a == 0 or math.isnan(a):
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1., b)
+    return a / b
+
+
+class RollingWindow:
+    """
+    Fixed-size window over a stream of values.
+
+    The values sit in a ring buffer with a running sum for the mean, and the
+    min/max are tracked with monotonic deques, so every push is amortized
+    O(1). Like ``Series.rolling(size)`` the statistics are NaN until the
+    window is full (and the mean is NaN while it holds a NaN).
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.values = deque(maxlen=size)
+        self.total = 0.
+        self.nans = 0
+        self.count = 0
+        self._min = deque()
+        self._max = deque()
+
+    def push(self, value):
+        if len(self.values) == self.size:
+            dropped = self.values[0]
+            if math.isnan(dropped):
+                self.nans -= 1
+            else:
+                self.total -= dropped
+        self.values.append(value)
+        if math.isnan(value):
+            self.nans += 1
+        else:
+            self.total += value
+
+            while self._min and self._min[-1][1] >= value:
+                self._min.pop()
+            self._min.append((self.count, value))
+            while self._max and self._max[-1][1] <= value:
+                self._max.pop()
+            self._max.append((self.count, value))
+
+        self.count += 1
+        for extrema in (self._min, self._max):
+            while extrema and extrema[0][0] <= self.count - 1 - self.size:
+                extrema.popleft()
+
+    @property
+    def full(self):
+        return len(self.values) == self.size
+
+    def mean(self):
+        if not self.full or self.nans:
+            return math.nan
+        return self.total / self.size
+
+    def min(self):
+        return self._min[0][1] if self.full and not self.nans else math.nan
+
+    def max(self):
+        return self._max[0][1] if self.full and not self.nans else math.nan
+
+    def copy(self):
+        window = RollingWindow.__new__(RollingWindow)
+        window.size, window.total, window.nans, window.count = self.size, self.total, self.nans, self.count
+        window.values, window._min, window._max = self.values.copy(), self._min.copy(), self._max.copy()
+        return window
+
+
+class ExponentialAverage:
+    """``Series.ewm(span=span, adjust=False).mean()`` one value at a time."""
+
+    def __init__(self, span, value=math.nan):
+        self.alpha = 2. / (span + 1.)
+        self.value = value
+
+    def push(self, value):
+        if math.isnan(self.value):
+            self.value = value
+        else:
+            # Same operation order as pandas so the results are bit-identical
+            old_weight = 1. - self.alpha
+            self.value = (old_weight * self.value + self.alpha * value) / (old_weight + self.alpha)
+        return self.value
+
+    def copy(self):
+        average = ExponentialAverage.__new__(ExponentialAverage)
+        average.alpha, average.value = self.alpha, self.value
+        return average
+
+
+class IndicatorState:
+    """
+    Running state that produces the ``compute_indicators`` columns one bar
+    at a time.
+
+    ``update`` costs O(1) per bar, so new bars can be appended to a stored
+    history without recomputing it. ``resume`` rebuilds the state from the
+    last ``WARMUP_BARS`` bars and the stored EMA values of the last bar.
+    """
+
+    def __init__(self):
+        self.window_50 = RollingWindow(50)
+        self.window_14 = RollingWindow(14)
+        self.window_200 = RollingWindow(200)
+        self.percent_k = RollingWindow(3)
+        self.gain = RollingWindow(14)
+        self.loss = RollingWindow(14)
+        self.ema_12 = ExponentialAverage(12)
+        self.ema_26 = ExponentialAverage(26)
+        self.signal = ExponentialAverage(9)
+        self.previous = None
+
+    @classmethod
+    def resume(cls, bars, last=None):
+        """
+        Replay ``bars`` (``(open, high, low, close)`` tuples in date order,
+        at least the last ``WARMUP_BARS`` of the history) and restore the EMAs
+        from ``last``, the stored indicator values of the final bar.
+        """
+        state = cls()
+        for bar in bars:
+            state.update(*bar)
+        if last is not None:
+            state.ema_12.value = last['ema_12']
+            state.ema_26.value = last['ema_26']
+            state.signal.value = last['signal_line']
+            state.previous['macd_line'] = last['macd_line']
+            state.previous['signal_line'] = last['signal_line']
+        return state
+
+    def copy(self):
+        """An independent copy, to try a bar on without touching this state."""
+        state = IndicatorState.__new__(IndicatorState)
+        for name, value in vars(self).items():
+            setattr(state, name, value.copy() if value is not None else None)
+        return state
+
+    def peek(self, open, high, low, close):
+        """The row ``update`` would return for this bar, leaving the state as it is."""
+        return self.copy().update(open, high, low, close)
+
+    def update(self, open, high, low, close):
+        """Push one bar and return its indicator values keyed by DataFrame column."""
+        previous = self.previous
+        row = {}
+
+        self.window_50.push(close)
+        row['RollingMin'] = self.window_50.min()
+        row['RollingMax'] = self.window_50.max()
+        row['SupportArea'] = _divide(abs(close - row['RollingMin']), row['RollingMin']) * 100 <= 3
+        row['ResistanceArea'] = _divide(abs(close - row['RollingMax']), row['RollingMax']) * 100 <= 3
+
+        row['BodyLength'] = abs(open - close)
+        upper_shadow = high - max(open, close)
+        lower_shadow = min(open, close) - low
+        row['BullishHammer'] = close > open and row['BodyLength'] < lower_shadow and lower_shadow > upper_shadow * 2
+
+        row['HighLowRange'] = high - low
+        row['Doji'] = row['BodyLength'] <= 0.02 * row['HighLowRange']
+
+        self.window_14.push(close)
+        row['Lowest Low'] = self.window_14.min()
+        row['Highest High'] = self.window_14.max()
+        row['%K'] = _divide(close - row['Lowest Low'], row['Highest High'] - row['Lowest Low']) * 100
+        self.percent_k.push(row['%K'])
+        row['%D'] = self.percent_k.mean()
+
+        row['delta'] = close - previous['close'] if previous else math.nan
+        row['gain'] = row['delta'] if row['delta'] > 0 else 0.
+        row['loss'] = -row['delta'] if row['delta'] < 0 else -0.
+        self.gain.push(row['gain'])
+        self.loss.push(row['loss'])
+        row['avg_gain'] = self.gain.mean()
+        row['avg_loss'] = abs(self.loss.mean())
+        row['rs'] = _divide(row['avg_gain'], row['avg_loss'])
+        row['RSI'] = 100 - _divide(100, 1 + row['rs'])
+
+        row['ema_12'] = self.ema_12.push(close)
+        row['ema_26'] = self.ema_26.push(close)
+        row['macd_line'] = row['ema_12'] - row['ema_26']
+        row['signal_line'] = self.signal.push(row['macd_line'])
+
+        row['MACD_GoldenCross'] = bool(previous) and row['macd_line'] > row['signal_line'] and previous['macd_line'] < previous['signal_line']
+        row['MACD_DeathCross'] = bool(previous) and row['macd_line'] < row['signal_line'] and previous['macd_line'] > previous['signal_line']
+
+        self.window_200.push(close)
+        row['Above_EMA_200'] = close > self.window_200.mean()
+
+        row['Engulfing'] = bool(previous) and close > open and previous['close'] < previous['open'] and \
+            high > previous['high'] and low < previous['low']
+
+        self.previous = {
+            'open': open, 'high': high, 'low': low, 'close': close,
+            'macd_line': row['macd_line'], 'signal_line': row['signal_line'],
+        }
+        return row
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from app.bar_store import rebuild_bars, store_dir, update_bars
+from app.indicator_store import recompute_indicators, update_indicators
+from app.models import Price, Stock
+from app.signal_cache import invalidate_signals
+
+csv_columns = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+price_columns = ['Open', 'High', 'Low', 'Close']
+price_fields = ['open', 'high', 'low', 'close', 'volume']
+
+# Errors listed per chunk; the rest are only counted
+MAX_ERRORS_PER_CHUNK = 100
+
+
+def _validate_chunk(chunk):
+    """
+    Coerce and validate one CSV chunk column by column.
+
+    Returns the cleaned frame (valid rows only) and a list of
+    ``{'line', 'column', 'error'}`` dicts, ``line`` being the line number in
+    the CSV file.
+    """
+    clean = pd.DataFrame(index=chunk.index)
+    invalid = {}
+
+    dates = pd.to_datetime(chunk['Date'], errors='coerce')
+    invalid['Date'] = (dates.isna(), 'not a valid date')
+    clean['Date'] = dates.dt.date
+
+    for column in price_columns:
+        values = pd.to_numeric(chunk[column], errors='coerce')
+        invalid[column] = (values.isna() | ~np.isfinite(values), 'not a number')
+        clean[column] = values
+
+    volume = pd.to_numeric(chunk['Volume'], errors='coerce')
+    invalid['Volume'] = (volume.isna() | (volume < 0) | (volume % 1 != 0), 'not a positive integer')
+    clean['Volume'] = volume
+
+    errors = []
+    bad_rows = pd.Series(False, index=chunk.index)
+    for column, (mask, message) in invalid.items():
+        bad_rows |= mask
+        for index in chunk.index[mask.to_numpy()]:
+            errors.append({'line': int(index) + 2, 'column': column, 'error': message})
+    errors.sort(key=lambda error: error['line'])
+
+    return clean[~bad_rows], errors
+
+
+def upsert_prices(stock, bars, batch_size=None):
+    """
+    Insert ``(date, open, high, low, close, volume)`` bars of ``stock``,
+    overwriting the rows already stored for the same dates, so writing the
+    same bars twice is harmless.
+    """
+    Price.objects.bulk_create(
+        (
+            Price(stock=stock, date=date, open=open, high=high, low=low, close=close, volume=volume)
+            for date, open, high, low, close, volume in bars
+        ),
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['stock', 'date'],
+        update_fields=price_fields,
+    )
+
+
+def ingest_csv(csv_file, name, code, sector, chunk_size=None, batch_size=None):
+    """
+    Create (or update, by upper-cased ``code``) a ``Stock`` and load its
+    daily bars from ``csv_file``.
+
+    The file is parsed ``chunk_size`` rows at a time. Each chunk is
+    validated with vectorized column checks and written with
+    ``upsert_prices`` in batches of ``batch_size``, all inside one
+    transaction. If any row is invalid nothing is saved. Uploading bars
+    that are already stored overwrites them, so uploading the same file
+    twice changes nothing.
+
+    Returns ``(stock, reports)``. ``stock`` is ``None`` when the load was
+    rolled back. ``reports`` holds one ``{'chunk', 'rows', 'error_count',
+    'errors'}`` dict per chunk.
+    """
+    chunk_size = chunk_size or settings.CSV_INGEST_CHUNK_SIZE
+    batch_size = batch_size or settings.CSV_INGEST_BATCH_SIZE
+
+    reports = []
+    with transaction.atomic():
+        stock, _ = Stock.objects.update_or_create(code=code.upper(), defaults={'name': name, 'sector': sector})
+        last_date = Price.objects.filter(stock=stock).aggregate(last=Max('date'))['last']
+        rewritten = False
+
+        for number, chunk in enumerate(pd.read_csv(csv_file, chunksize=chunk_size)):
+            missing = [column for column in csv_columns if column not in chunk.columns]
+            if missing:
+                reports.append({
+                    'chunk': number,
+                    'rows': len(chunk),
+                    'error_count': 1,
+                    'errors': [{'line': 1, 'column': ', '.join(missing), 'error': 'missing column'}],
+                })
+                break
+
+            clean, errors = _validate_chunk(chunk)
+            reports.append({
+                'chunk': number,
+                'rows': len(chunk),
+                'error_count': len(errors),
+                'errors': errors[:MAX_ERRORS_PER_CHUNK],
+            })
+            # Keep validating after an error so the report covers the whole file
+            if any(report['error_count'] for report in reports):
+                continue
+
+            # Repeated dates overwrite the earlier row, last one in the file wins
+            clean = clean.drop_duplicates('Date', keep='last')
+            rewritten |= last_date is not None and bool((clean['Date'] <= last_date).any())
+            upsert_prices(
+                stock,
+                zip(
+                    clean['Date'].tolist(),
+                    *(clean[column].tolist() for column in price_columns),
+                    clean['Volume'].astype(int).tolist(),
+                ),
+                batch_size=batch_size,
+            )
+
+        if any(report['error_count'] for report in reports):
+            transaction.set_rollback(True)
+            return None, reports
+
+    if rewritten:
+        # Every indicator after a rewritten bar depends on it
+        recompute_indicators(stock)
+        if store_dir():
+            rebuild_bars(stock)
+    else:
+        update_indicators(stock)
+        update_bars(stock)
+    invalidate_signals(stock)
+    return stock, reports
@@ -0,0 +1,70 @@
+from datetime import date, timedelta
+
+from django.db.models import Case, ExpressionWrapper, F, FloatField, Max, Min, OuterRef, Subquery, Value, When
+from django.db.models.functions import NullIf
+
+from app.models import Price, Stock
+
+# Fields of an api/saham/all row, in order; all of them can be sorted by
+listing_fields = ['id', 'name', 'code', 'sector', 'last_date', 'close', 'change', 'volume', 'high_52w', 'low_52w']
+
+# The window of the 52-week high/low, ending at the last bar of the market
+YEAR = timedelta(weeks=52)
+# A stock whose last bar is older than this before the end of the window
+# (suspended, delisted) gets no 52-week figures: the window isn't its 52 weeks
+STALE = timedelta(days=7)
+
+
+def _window(aggregate, field, since):
+    # The high or low of the outer stock's bars after ``since``, for the
+    # stocks that were still trading at the end of the window
+    bars = Price.objects.filter(stock=OuterRef('pk'), date__gt=since)
+    value = Subquery(bars.order_by().values('stock').annotate(value=aggregate(field)).values('value'))
+    return Case(When(last_date__gte=since + YEAR - STALE, then=value), default=Value(None), output_field=FloatField())
+
+
+def market_date():
+    """The date of the last bar of any stock, ``None`` when there are no bars."""
+    # One index seek per stock, where Max('date') over Price would scan it
+    last_dates = Stock.objects.annotate(
+        last_date=Subquery(Price.objects.filter(stock=OuterRef('pk')).order_by('-date').values('date')[:1]))
+    return last_dates.aggregate(last=Max('last_date'))['last']
+
+
+def stock_listing(sort='code', last_date=None):
+    """
+    Every stock with its last bar in a single query: the date and close of
+    that bar, its change from the previous close in percent, its volume and
+    its high and low over the 52 weeks up to ``last_date`` (default
+    ``market_date()``). Each figure is a correlated subquery served by the
+    (stock, date) index, so the cost grows with the number of stocks and
+    not with the length of their histories. Stocks without bars have
+    ``None`` figures, and so have the 52-week ones of a stock whose last
+    bar is more than ``STALE`` before the end of the window. Sorted by
+    ``sort`` (``-`` prefix for descending, missing values last) and then by
+    code; raises ``ValueError`` for an unknown field.
+    """
+    field = sort.lstrip('-')
+    if field not in listing_fields:
+        raise ValueError(f"Cannot sort by '{field}'")
+
+    # A constant bound keeps the window a range scan of the index (date
+    # arithmetic in SQL would run for every row on SQLite)
+    since = (last_date or market_date() or date.min + YEAR) - YEAR
+    bars = Price.objects.filter(stock=OuterRef('pk')).order_by('-date')
+    stocks = Stock.objects.annotate(
+        last_date=Subquery(bars.values('date')[:1]),
+        close=Subquery(bars.values('close')[:1]),
+        previous_close=Subquery(bars.values('close')[1:2]),
+        volume=Subquery(bars.values('volume')[:1]),
+    ).annotate(
+        change=ExpressionWrapper(
+            (F('close') - F('previous_close')) * 100.0 / NullIf(F('previous_close'), 0.0),
+            output_field=FloatField(),
+        ),
+        high_52w=_window(Max, 'high', since),
+        low_52w=_window(Min, 'low', since),
+    )
+
+    order = F(field).desc(nulls_last=True) if sort.startswith('-') else F(field).asc(nulls_last=True)
+    return stocks.order_by(order, 'code', 'pk').values(*listing_fields)
@@ -0,0 +1,160 @@
+import csv
+import math
+import threading
+from datetime import date as Date
+
+from django.db.models import Max
+from django.utils import timezone
+
+from app.fuzzy import get_ruleset, score_row
+from app.indicator_store import stored_state, update_indicators
+from app.indicators import indicator_columns
+from app.models import Indicator, Stock
+
+_lock = threading.Lock()
+# Stock id -> (data_version and date of its last stored bar, IndicatorState after that bar)
+_states = {}
+
+
+def live_state(stock):
+    """
+    ``(last_date, state)``: the date of the last stored bar of ``stock`` and
+    the ``IndicatorState`` after it, or ``(None, None)`` when it has no bars.
+    The state is kept in memory and rebuilt (indicators brought up to date
+    first) once bars are written, new ones or rewrites of stored ones, in
+    any process, so a hit costs a single query.
+    """
+    # save_bars bumps data_version on every write, in whichever process ran it
+    version = Stock.objects.filter(pk=stock.pk).annotate(last_date=Max('price__date')).values_list(
+        'data_version', 'last_date').first()
+    if version is None or version[1] is None:
+        return None, None
+    with _lock:
+        cached = _states.get(stock.pk)
+    if cached is not None and cached[0] == version:
+        return version[1], cached[1]
+
+    update_indicators(stock)
+    last = Indicator.objects.filter(stock=stock).order_by('-date').values().first()
+    state = stored_state(stock, last)
+    with _lock:
+        _states[stock.pk] = (version, state)
+    return version[1], state
+
+
+def forget_states():
+    """Drop the cached states, e.g. after stored bars were edited outside ``save_bars``."""
+    with _lock:
+        _states.clear()
+
+
+def score_provisional(state, open, high, low, close, ruleset=None):
+    """
+    Indicators and fuzzy scores of a provisional bar following ``state``,
+    as ``{column: value}`` with the ``api/saham`` column names. Nothing is
+    stored and ``state`` is left as it was, so every price update of the
+    forming bar is scored on top of the same history.
+    """
+    row = state.peek(open, high, low, close)
+    row['Entry_Position'], row['Exit_Position'] = score_row(row, ruleset=ruleset or get_ruleset())
+    row.update({'Open': open, 'High': high, 'Low': low, 'Close': close})
+    return row
+
+
+def score_live(stock, bar, ruleset=None):
+    """
+    ``score_provisional`` of ``bar``, a dict with ``open``/``high``/``low``/
+    ``close`` (and optionally ``date`` and ``volume``), on top of the stored
+    history of ``stock``. Raises ``ValueError`` when the stock has no bars
+    or the bar isn't after the last stored one.
+    """
+    last_date, state = live_state(stock)
+    if state is None:
+        raise ValueError(f'{stock.code} has no bars')
+    if bar.get('date') is not None and bar['date'] <= last_date:
+        raise ValueError(f"The bar of {stock.code} on {bar['date']} is already stored")
+    row = score_provisional(state, bar['open'], bar['high'], bar['low'], bar['close'], ruleset)
+    row['Date'] = bar.get('date')
+    row['Volume'] = bar.get('volume')
+    return row
+
+
+# Columns of a scored provisional bar, as in the api/saham rows
+live_columns = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume', *indicator_columns.values(),
+                'Entry_Position', 'Exit_Position']
+
+
+def parse_bar(data):
+    """
+    Validate a provisional bar sent as JSON: ``open``, ``high``, ``low`` and
+    ``close`` prices, optional ``volume`` and ``date`` (default today).
+    Raises ``ValueError`` with the message for the client.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Body must be a JSON object')
+    bar = {}
+    for field in ('open', 'high', 'low', 'close'):
+        value = data.get(field)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"'{field}' must be a number")
+        bar[field] = float(value)
+    if not bar['low'] <= min(bar['open'], bar['close']) <= max(bar['open'], bar['close']) <= bar['high']:
+        raise ValueError("Prices must satisfy low <= open, close <= high")
+
+    volume = data.get('volume', 0)
+    if isinstance(volume, bool) or not isinstance(volume, int) or volume < 0:
+        raise ValueError("'volume' must be a non-negative integer")
+    bar['volume'] = volume
+    try:
+        bar['date'] = Date.fromisoformat(data['date']) if data.get('date') else timezone.localdate()
+    except (TypeError, ValueError):
+        raise ValueError("'date' must be a YYYY-MM-DD date")
+    return bar
+
+
+def to_json(row):
+    """``row`` with the ``live_columns``, NaN as ``None``, for ``JsonResponse``."""
+    values = {}
+    for column in live_columns:
+        value = row[column]
+        if isinstance(value, float) and math.isnan(value):
+            value = None
+        elif hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        values[column] = value
+    return values
+
+
+def read_ticks(path):
+    """
+    The trades of a tick file, a CSV with ``time``, ``price`` and
+    ``volume`` columns in time order, as ``(time, price, volume)``.
+    """
+    with open(path, newline='') as tick_file:
+        return [(row['time'], float(row['price']), int(row['volume'] or 0)) for row in csv.DictReader(tick_file)]
+
+
+def replay_ticks(stock, ticks, date=None, ruleset=None):
+    """
+    Score the day's bar of ``stock`` as it forms, one tick at a time: the
+    first price opens it, the last one closes it. The state is read once,
+    so each tick costs only ``score_provisional``. Yields the tick time and
+    the row of the bar so far, as ``score_live`` returns it.
+    """
+    ruleset = ruleset or get_ruleset()
+    last_date, state = live_state(stock)
+    if state is None:
+        raise ValueError(f'{stock.code} has no bars')
+    if date is not None and date <= last_date:
+        raise ValueError(f'The bar of {stock.code} on {date} is already stored')
+    bar = None
+    for time, price, volume in ticks:
+        if bar is None:
+            bar = {'open': price, 'high': price, 'low': price, 'close': price, 'volume': volume}
+        else:
+            bar.update(high=max(bar['high'], price), low=min(bar['low'], price), close=price,
+                       volume=bar['volume'] + volume)
+        row = score_provisional(state, bar['open'], bar['high'], bar['low'], bar['close'], ruleset)
+        row['Date'] = date
+        row['Volume'] = bar['volume']
+        yield time, row
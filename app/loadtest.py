@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import numpy as np
+from django.test import AsyncClient
+from django.test.utils import override_settings
+
+from app.compute import shutdown_pool, start_pool
+
+
+async def _get(client, path):
+    started = time.perf_counter()
+    response = await client.get(path)
+    if response.streaming:
+        [chunk async for chunk in response.streaming_content]
+    assert response.status_code == 200, (path, response.status_code)
+    return time.perf_counter() - started
+
+
+def _percentiles(timings):
+    if not timings:
+        return {'p50': None, 'p95': None}
+    return {'p50': float(np.percentile(timings, 50)), 'p95': float(np.percentile(timings, 95))}
+
+
+async def _load(slow_path, fast_path, requests, concurrency):
+    client = AsyncClient()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def slow():
+        async with slots:
+            return await _get(client, slow_path)
+
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(slow()) for _ in range(requests)]
+    # Cheap requests one after the other while the slow ones are in flight
+    fast = []
+    while not all(task.done() for task in tasks):
+        fast.append(await _get(client, fast_path))
+    slow_timings = await asyncio.gather(*tasks)
+    seconds = time.perf_counter() - started
+
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'seconds': seconds,
+        'throughput': requests / seconds,
+        'slow': _percentiles(slow_timings),
+        'fast': {'count': len(fast), **_percentiles(fast)},
+    }
+
+
+def run_load(slow_path, fast_path='/api/saham/all', requests=40, concurrency=8, threads=4, processes=0):
+    """
+    Send ``requests`` GETs of ``slow_path``, ``concurrency`` at a time,
+    through the ASGI handler while requesting ``fast_path`` in a loop, with
+    ``COMPUTE_THREADS=threads`` and ``COMPUTE_PROCESSES=processes``
+    (started before the clock runs). Returns the requests per second of
+    ``slow_path`` and the latency percentiles of both, in seconds.
+
+    ``threads=0`` runs the compute on the event loop, which serves one
+    request at a time the way the views did before they were async.
+    """
+    with override_settings(COMPUTE_THREADS=threads, COMPUTE_PROCESSES=processes):
+        start_pool()
+        try:
+            return asyncio.run(_load(slow_path, fast_path, requests, concurrency))
+        finally:
+            shutdown_pool()
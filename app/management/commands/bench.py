@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from app.benchmarks import compare, groups, load_results, run_suite, save_results, sizes
+
+
+class Command(BaseCommand):
+    help = "Run the benchmark suite on synthetic data, optionally comparing it with a baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=list(sizes), default='quick',
+                            help="quick: 1k/10k bars, 1/100 stocks; full: also 100k bars and 900 stocks")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--only', help=f"Comma separated groups ({', '.join(groups)})")
+        parser.add_argument('--output', help="Write the results to this JSON file")
+        parser.add_argument('--baseline', help="Results JSON file to compare with")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Slowdown ratio above which a benchmark counts as a regression")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        only = [group for group in (options['only'] or '').split(',') if group]
+        unknown = sorted(set(only) - set(groups))
+        if unknown:
+            raise CommandError(f"Unknown groups: {', '.join(unknown)}")
+        baseline = load_results(options['baseline']) if options['baseline'] else None
+
+        self.stdout.write(f"{'benchmark':<48} {'min':>10} {'median':>10}")
+        # DEBUG would keep every query of the run in memory
+        with override_settings(DEBUG=False):
+            document = run_suite(options['size'], options['repeat'], only, log=self.stdout.write)
+        if options['output']:
+            save_results(options['output'], document)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is None:
+            return
+        self.stdout.write(f"\n{'benchmark':<48} {'baseline':>10} {'current':>10} {'ratio':>7}")
+        regressions = []
+        for name, before, current, ratio, status in compare(document, baseline, options['tolerance'], only):
+            before = f'{before:9.4f}s' if before is not None else '-'
+            current = f'{current:9.4f}s' if current is not None else '-'
+            ratio = f'{ratio:6.2f}x' if ratio is not None else '-'
+            self.stdout.write(f"{name:<48} {before:>10} {current:>10} {ratio:>7}  {status}")
+            if status == 'regressed':
+                regressions.append(name)
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} benchmarks regressed: {', '.join(regressions)}")
@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from app import fuzzy
+from app.indicators import compute_indicators
+from app.synthetic import make_ohlcv
+
+
+class Command(BaseCommand):
+    help = "Compare exact skfuzzy, vectorized and lookup-table fuzzy scoring on synthetic bars"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bars', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--skip-skfuzzy', action='store_true',
+                            help="Skip the slow per-row skfuzzy reference (errors are then against the vectorized path)")
+
+    def handle(self, *args, **options):
+        df = compute_indicators(make_ohlcv(options['bars']))
+
+        started = time.perf_counter()
+        fuzzy.get_vectorized_systems()
+        self.stdout.write(f"compile systems     {time.perf_counter() - started:9.4f}s")
+        started = time.perf_counter()
+        fuzzy.get_lookup_tables()
+        self.stdout.write(f"build lookup tables {time.perf_counter() - started:9.4f}s")
+
+        paths = [
+            ('vectorized', lambda frame: fuzzy.score(frame, lut_mode='')),
+            ('lut nearest', lambda frame: fuzzy.score(frame, lut_mode='nearest')),
+            ('lut linear', lambda frame: fuzzy.score(frame, lut_mode='linear')),
+        ]
+        if not options['skip_skfuzzy']:
+            paths.insert(0, ('skfuzzy', fuzzy.score_skfuzzy))
+
+        reference = None
+        for name, path in paths:
+            timings = []
+            for _ in range(options['repeat'] if name != 'skfuzzy' else 1):
+                frame = df.copy()
+                started = time.perf_counter()
+                path(frame)
+                timings.append(time.perf_counter() - started)
+            if reference is None:
+                reference = frame
+
+            error = max(
+                np.nanmax(np.abs(frame[column].to_numpy() - reference[column].to_numpy()))
+                for column in ('Entry_Position', 'Exit_Position')
+            )
+            self.stdout.write(
+                f"{name:<19} {min(timings):9.4f}s  "
+                f"{len(df) / min(timings):12.0f} rows/s  max abs error {error:.3g}"
+            )
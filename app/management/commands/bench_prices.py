@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from app.ingest import upsert_prices
+from app.models import Price, Stock
+from app.scraper import start_date
+from app.synthetic import make_ohlcv
+
+
+class Command(BaseCommand):
+    help = "Time the per-stock Price queries on a seeded table (rolled back afterwards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--stocks', type=int, default=900)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def measure(self, name, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - started)
+        self.stdout.write(f"{name:<22} {min(timings):9.4f}s  {len(queries)} queries")
+
+    def handle(self, *args, **options):
+        bars_per_stock = options['rows'] // options['stocks']
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            stocks = Stock.objects.bulk_create(
+                Stock(name=f'Bench {number}', code=f'BENCH{number}', sector='Bench')
+                for number in range(options['stocks'])
+            )
+            for number, stock in enumerate(stocks):
+                bars = make_ohlcv(bars_per_stock, seed=number)
+                upsert_prices(stock, bars.itertuples(index=False, name=None), batch_size=1000)
+            self.stdout.write(
+                f"seed {bars_per_stock * len(stocks)} rows     {time.perf_counter() - started:9.4f}s"
+            )
+
+            stock = stocks[len(stocks) // 2]
+            rerun = list(make_ohlcv(bars_per_stock, seed=len(stocks) // 2)[-10:].itertuples(index=False, name=None))
+            self.measure('last date', lambda: start_date(stock), options['repeat'])
+            self.measure('ordered history', lambda: list(Price.objects.filter(stock=stock).order_by('date').values()),
+                         options['repeat'])
+            self.measure('upsert 10 bars rerun', lambda: upsert_prices(stock, rerun), options['repeat'])
+            self.stdout.write(f"rows after reruns      {Price.objects.filter(stock=stock).count()}")
+
+            sql, params = Price.objects.filter(stock=stock).order_by('date').query.sql_with_params()
+            with connection.cursor() as cursor:
+                prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+                cursor.execute(f'{prefix} {sql}', params)
+                for row in cursor.fetchall():
+                    self.stdout.write(f"plan: {row[-1]}")
+
+            transaction.set_rollback(True)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.export import export_formats, write_export
+from app.models import Stock
+
+
+class Command(BaseCommand):
+    help = "Export price history as an Arrow IPC stream or a Parquet file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Output file")
+        parser.add_argument('codes', nargs='*', help="Stock codes (default: all stocks)")
+        parser.add_argument('--format', choices=list(export_formats), default='parquet')
+        parser.add_argument('--signals', action='store_true',
+                            help="Add the indicators and the fuzzy entry/exit scores")
+        parser.add_argument('--chunk-rows', type=int, help="Rows read from the database per batch")
+
+    def handle(self, *args, **options):
+        stocks = Stock.objects.order_by('code')
+        if options['codes']:
+            codes = [code.upper() for code in options['codes']]
+            stocks = stocks.filter(code__in=codes)
+            missing = sorted(set(codes) - {stock.code for stock in stocks})
+            if missing:
+                raise CommandError(f"Unknown stock codes: {', '.join(missing)}")
+
+        rows = write_export(options['output'], list(stocks), options['format'], options['signals'],
+                            options['chunk_rows'])
+        self.stdout.write(f"{rows} rows written to {options['output']}")
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from app.loadtest import run_load
+from app.models import Stock
+
+
+class Command(BaseCommand):
+    help = "Concurrent requests through the ASGI handler, with the compute on the event loop and in the pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('code', nargs='?', help="Stock to score (default: the first one)")
+        parser.add_argument('--path', help="Slow request (default: api/saham for the stock, past the cache)")
+        parser.add_argument('--fast-path', default='/api/saham/all', help="Cheap request timed meanwhile")
+        parser.add_argument('--requests', type=int, default=40)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--threads', type=int, default=settings.COMPUTE_THREADS,
+                            help="COMPUTE_THREADS of the second run")
+        parser.add_argument('--processes', type=int, default=0,
+                            help="Add a run with this many COMPUTE_PROCESSES")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if path is None:
+            stock = Stock.objects.order_by('code')
+            if options['code']:
+                stock = stock.filter(code=options['code'].upper())
+            stock = stock.first()
+            if stock is None:
+                raise CommandError("No stock to score")
+            # A date range skips the signal cache, so every request is scored
+            path = f'/api/saham?kode={stock.code}&from=1900-01-01'
+
+        self.stdout.write(f"{options['requests']} x {path}, {options['concurrency']} at a time")
+        self.stdout.write(f"{'compute':<16} {'req/s':>8} {'p50':>9} {'p95':>9} {'fast':>6} {'fast p50':>9} {'fast p95':>9}")
+        # DEBUG would keep every query of the run in memory
+        with override_settings(DEBUG=False):
+            runs = [('event loop', 0, 0), (f"{options['threads']} threads", options['threads'], 0)]
+            if options['processes']:
+                runs.append((f"{options['processes']} processes", options['threads'], options['processes']))
+            for label, threads, processes in runs:
+                result = run_load(path, options['fast_path'], options['requests'], options['concurrency'],
+                                  threads, processes)
+                slow, fast = result['slow'], result['fast']
+                self.stdout.write(
+                    f"{label:<16} {result['throughput']:8.2f} {slow['p50']:8.3f}s {slow['p95']:8.3f}s "
+                    f"{fast['count']:6d} {_seconds(fast['p50'])} {_seconds(fast['p95'])}"
+                )
+
+
+def _seconds(value):
+    return f'{value:8.3f}s' if value is not None else f"{'-':>9}"
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.bar_store import rebuild_bars, store_dir, verify_bars
+from app.models import Stock
+
+
+class Command(BaseCommand):
+    help = "Rebuild the memory-mapped bar store from Price, or check it with --verify"
+
+    def add_arguments(self, parser):
+        parser.add_argument('codes', nargs='*', help="Stock codes (default: all stocks)")
+        parser.add_argument('--verify', action='store_true',
+                            help="Only compare the stored bars with the database")
+
+    def handle(self, *args, **options):
+        if not store_dir():
+            raise CommandError("BAR_STORE_DIR is not set")
+
+        stocks = Stock.objects.order_by('code')
+        if options['codes']:
+            stocks = stocks.filter(code__in=[code.upper() for code in options['codes']])
+
+        failed = 0
+        for stock in stocks:
+            if options['verify']:
+                mismatches = verify_bars(stock)
+                if mismatches:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f"{stock.code}: {len(mismatches)} mismatches"))
+                    for date, column in mismatches[:10]:
+                        self.stdout.write(f"  {date} {column}")
+                else:
+                    self.stdout.write(f"{stock.code}: ok")
+            else:
+                rows = rebuild_bars(stock)
+                self.stdout.write(f"{stock.code}: {rows} rows")
+
+        if failed:
+            raise CommandError(f"{failed} stock(s) have a stale or broken bar store")
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.indicator_store import recompute_indicators, verify_indicators
+from app.models import Stock
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored indicators from scratch, or check them with --verify"
+
+    def add_arguments(self, parser):
+        parser.add_argument('codes', nargs='*', help="Stock codes (default: all stocks)")
+        parser.add_argument('--verify', action='store_true',
+                            help="Only compare the stored values with a fresh computation")
+
+    def handle(self, *args, **options):
+        stocks = Stock.objects.order_by('code')
+        if options['codes']:
+            stocks = stocks.filter(code__in=[code.upper() for code in options['codes']])
+
+        failed = 0
+        for stock in stocks:
+            if options['verify']:
+                mismatches = verify_indicators(stock)
+                if mismatches:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f"{stock.code}: {len(mismatches)} mismatches"))
+                    for date, column in mismatches[:10]:
+                        self.stdout.write(f"  {date} {column}")
+                else:
+                    self.stdout.write(f"{stock.code}: ok")
+            else:
+                rows = recompute_indicators(stock)
+                self.stdout.write(f"{stock.code}: {rows} rows")
+
+        if failed:
+            raise CommandError(f"{failed} stock(s) have stale or wrong indicators")
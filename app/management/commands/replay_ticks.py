@@ -0,0 +1,46 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.fuzzy import get_ruleset
+from app.live import read_ticks, replay_ticks
+from app.models import Stock
+
+
+class Command(BaseCommand):
+    help = "Score the forming bar of a stock tick by tick from a CSV tick file (time, price, volume)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('code')
+        parser.add_argument('tick_file')
+        parser.add_argument('--ruleset', help="Rule set to score with (default: FUZZY_RULESET)")
+        parser.add_argument('--quiet', action='store_true', help="Only print the timing summary")
+
+    def handle(self, *args, **options):
+        try:
+            ruleset = get_ruleset(options['ruleset'])
+            ticks = read_ticks(options['tick_file'])
+        except (ValueError, KeyError, OSError) as error:
+            raise CommandError(error)
+        stock = Stock.objects.filter(code=options['code'].upper()).first()
+        if stock is None:
+            raise CommandError(f"Unknown stock {options['code']}")
+
+        timings = []
+        rows = replay_ticks(stock, ticks, ruleset=ruleset)
+        while True:
+            started = time.perf_counter()
+            try:
+                tick_time, row = next(rows)
+            except StopIteration:
+                break
+            except ValueError as error:
+                raise CommandError(error)
+            timings.append(time.perf_counter() - started)
+            if not options['quiet']:
+                self.stdout.write(f"{tick_time:<12} {row['Close']:>10.2f} entry {row['Entry_Position']:6.2f} "
+                                  f"exit {row['Exit_Position']:6.2f}")
+        if timings:
+            self.stdout.write(f"{len(timings)} ticks, {statistics.median(timings) * 1e6:.0f} us median, "
+                              f"{max(timings) * 1e6:.0f} us max per tick")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.fuzzy import get_ruleset
+from app.snapshots import latest_snapshot, run_snapshot
+
+
+class Command(BaseCommand):
+    help = "Store the fuzzy scores of the stocks whose bars changed since the last snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ruleset', help="Rule set to score with (default: FUZZY_RULESET)")
+        parser.add_argument('--status', action='store_true', help="Show the last completed snapshot and exit")
+
+    def handle(self, *args, **options):
+        try:
+            ruleset = get_ruleset(options['ruleset'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        if options['status']:
+            snapshot = latest_snapshot(ruleset)
+            if snapshot is None:
+                self.stdout.write(f"No snapshot of {ruleset.name} yet")
+            else:
+                self.stdout.write(f"Snapshot {snapshot.pk} of {snapshot.ruleset}, completed {snapshot.completed_at.isoformat()}")
+            return
+
+        snapshot = run_snapshot(ruleset)
+        self.stdout.write(f"Snapshot {snapshot.pk} of {snapshot.ruleset}: "
+                          f"{snapshot.rows} rows of {snapshot.stocks} changed stocks")
@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import Stock
+from app.sweep import default_space, grid_configs, random_configs, run_sweep
+
+
+class Command(BaseCommand):
+    help = "Backtest a grid or a random sample of indicator windows and memberships"
+
+    def add_arguments(self, parser):
+        parser.add_argument('codes', nargs='*', help="Stock codes (default: all stocks)")
+        parser.add_argument('--space', help="JSON file of {parameter: [values]} (default: the window settings)")
+        parser.add_argument('--random', type=int, metavar='N', help="Sample N configurations instead of the grid")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the random sample")
+        parser.add_argument('--output', default='sweep.jsonl',
+                            help="JSON lines results file, resumed when it exists")
+        parser.add_argument('--workers', type=int, help="Worker processes (default: BACKTEST_WORKERS or CPUs)")
+        parser.add_argument('--top', type=int, default=10, help="Results to print")
+
+    def handle(self, *args, **options):
+        stocks = Stock.objects.order_by('code')
+        if options['codes']:
+            codes = [code.upper() for code in options['codes']]
+            stocks = stocks.filter(code__in=codes)
+            missing = sorted(set(codes) - {stock.code for stock in stocks})
+            if missing:
+                raise CommandError(f"Unknown stock codes: {', '.join(missing)}")
+
+        space = default_space
+        if options['space']:
+            with open(options['space']) as space_file:
+                space = json.load(space_file)
+        try:
+            if options['random']:
+                configs = random_configs(space, options['random'], options['seed'])
+            else:
+                configs = grid_configs(space)
+        except ValueError as error:
+            raise CommandError(error)
+
+        results = run_sweep(list(stocks), configs, options['output'], options['workers'])
+        self.stdout.write(f"{len(results)} configurations, results in {options['output']}")
+        for result in results[:options['top']]:
+            self.stdout.write(f"{json.dumps(result['metrics'])}  {json.dumps(result['config'])}")
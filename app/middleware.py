@@ -0,0 +1,99 @@
+import cProfile
+import io
+import pstats
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+
+from app import compute
+from app.timing import Timer, observe, timing
+
+
+class TimingMiddleware:
+    """
+    Time every request and the stages its view marks with
+    ``app.timing.stage``: a ``Server-Timing`` header on the response and
+    histograms per endpoint and stage at ``/metrics``.
+
+    Staff users can add ``?profile=1`` to get the cProfile summary of the
+    request instead of its response.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.GET.get('profile') and _is_staff(request):
+            return self.profile(request)
+
+        timer = Timer()
+        start = time.perf_counter()
+        with timing(timer):
+            response = self.get_response(request)
+        return self.finish(request, response, timer, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if request.GET.get('profile') and await sync_to_async(_is_staff)(request):
+            return await self.aprofile(request)
+
+        timer = Timer()
+        start = time.perf_counter()
+        with timing(timer):
+            response = await self.get_response(request)
+        return self.finish(request, response, timer, time.perf_counter() - start)
+
+    def finish(self, request, response, timer, total):
+        match = request.resolver_match
+        endpoint = match.route if match else 'unmatched'
+        observe('request_duration_seconds', total, endpoint=endpoint)
+        timer.observe('request_stage_duration_seconds', endpoint=endpoint)
+        # A streamed body is still being encoded after this point
+        timer.add('total', total)
+        response['Server-Timing'] = timer.server_timing()
+        return response
+
+    def profile(self, request):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+            if response.streaming:
+                b''.join(response)
+        finally:
+            profiler.disable()
+        return self.profile_response(profiler)
+
+    async def aprofile(self, request):
+        # Only this thread is profiled: run the compute pool's work inline,
+        # the database reads in Django's sync thread show up as waits
+        profiler = cProfile.Profile()
+        token = compute.inline.set(True)
+        profiler.enable()
+        try:
+            response = await self.get_response(request)
+            if response.streaming and response.is_async:
+                [chunk async for chunk in response.streaming_content]
+            elif response.streaming:
+                b''.join(response.streaming_content)
+        finally:
+            profiler.disable()
+            compute.inline.reset(token)
+        return self.profile_response(profiler)
+
+    def profile_response(self, profiler):
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output).strip_dirs().sort_stats('cumulative')
+        stats.print_stats(settings.PROFILE_LINES)
+        return HttpResponse(output.getvalue(), content_type='text/plain')
+
+
+def _is_staff(request):
+    return getattr(request, 'user', None) is not None and request.user.is_staff
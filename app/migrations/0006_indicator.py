@@ -0,0 +1,53 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_stock_remove_price_code_price_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Indicator',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('rolling_min', models.FloatField(null=True)),
+                ('rolling_max', models.FloatField(null=True)),
+                ('support_area', models.BooleanField(default=False)),
+                ('resistance_area', models.BooleanField(default=False)),
+                ('body_length', models.FloatField(null=True)),
+                ('bullish_hammer', models.BooleanField(default=False)),
+                ('high_low_range', models.FloatField(null=True)),
+                ('doji', models.BooleanField(default=False)),
+                ('lowest_low', models.FloatField(null=True)),
+                ('highest_high', models.FloatField(null=True)),
+                ('percent_k', models.FloatField(null=True)),
+                ('percent_d', models.FloatField(null=True)),
+                ('delta', models.FloatField(null=True)),
+                ('gain', models.FloatField(null=True)),
+                ('loss', models.FloatField(null=True)),
+                ('avg_gain', models.FloatField(null=True)),
+                ('avg_loss', models.FloatField(null=True)),
+                ('rs', models.FloatField(null=True)),
+                ('rsi', models.FloatField(null=True)),
+                ('ema_12', models.FloatField(null=True)),
+                ('ema_26', models.FloatField(null=True)),
+                ('macd_line', models.FloatField(null=True)),
+                ('signal_line', models.FloatField(null=True)),
+                ('macd_golden_cross', models.BooleanField(default=False)),
+                ('macd_death_cross', models.BooleanField(default=False)),
+                ('above_ema_200', models.BooleanField(default=False)),
+                ('engulfing', models.BooleanField(default=False)),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.stock')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='indicator',
+            constraint=models.UniqueConstraint(fields=('stock', 'date'), name='unique_indicator_stock_date'),
+        ),
+    ]
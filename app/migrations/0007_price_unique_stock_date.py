@@ -0,0 +1,26 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:17
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def remove_duplicate_prices(apps, schema_editor):
+    # Keep the most recently inserted row of every (stock, date)
+    Price = apps.get_model('app', 'Price')
+    keep = Price.objects.values('stock', 'date').annotate(keep=Max('id')).values('keep')
+    Price.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_indicator'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_prices, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='price',
+            constraint=models.UniqueConstraint(fields=('stock', 'date'), name='unique_price_stock_date'),
+        ),
+    ]
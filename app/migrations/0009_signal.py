@@ -0,0 +1,40 @@
+# Generated by Django 4.2.5 on 2026-10-18 12:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_scrapejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SignalSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ruleset', models.CharField(max_length=100)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(null=True)),
+                ('stocks', models.PositiveIntegerField(default=0)),
+                ('rows', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Signal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('ruleset', models.CharField(max_length=100)),
+                ('entry_position', models.FloatField(null=True)),
+                ('exit_position', models.FloatField(null=True)),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.stock')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='signal',
+            constraint=models.UniqueConstraint(fields=('stock', 'ruleset', 'date'), name='unique_signal_stock_ruleset_date'),
+        ),
+    ]
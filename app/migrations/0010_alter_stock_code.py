@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_signal'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stock',
+            name='code',
+            field=models.CharField(db_index=True, default='', max_length=40),
+        ),
+    ]
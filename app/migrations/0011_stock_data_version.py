@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_alter_stock_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,10 +1,16 @@
+import uuid
+
 from django.db import models
 
 # Create your models here.
 class Stock(models.Model):
     name = models.CharField(max_length=40, default='')
-    code = models.CharField(max_length=40, default='')
+    # Looked up by code on nearly every request
+    code = models.CharField(max_length=40, default='', db_index=True)
     sector = models.CharField(max_length=100, default='')
+    # Bumped whenever its bars are written; part of the response cache keys,
+    # so every process sees the change, whichever one wrote them
+    data_version = models.PositiveIntegerField(default=0)
 
 
 class Price(models.Model):
@@ -15,3 +21,86 @@ class Price(models.Model):
     low = models.FloatField()
     close = models.FloatField()
     volume = models.PositiveIntegerField()
+
+    class Meta:
+        # Also the index behind every per-stock, date ordered read
+        constraints = [
+            models.UniqueConstraint(fields=['stock', 'date'], name='unique_price_stock_date'),
+        ]
+
+
+class Indicator(models.Model):
+    """Technical indicators of one bar, as computed by ``app.indicators``."""
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE)
+    date = models.DateField()
+    rolling_min = models.FloatField(null=True)
+    rolling_max = models.FloatField(null=True)
+    support_area = models.BooleanField(default=False)
+    resistance_area = models.BooleanField(default=False)
+    body_length = models.FloatField(null=True)
+    bullish_hammer = models.BooleanField(default=False)
+    high_low_range = models.FloatField(null=True)
+    doji = models.BooleanField(default=False)
+    lowest_low = models.FloatField(null=True)
+    highest_high = models.FloatField(null=True)
+    percent_k = models.FloatField(null=True)
+    percent_d = models.FloatField(null=True)
+    delta = models.FloatField(null=True)
+    gain = models.FloatField(null=True)
+    loss = models.FloatField(null=True)
+    avg_gain = models.FloatField(null=True)
+    avg_loss = models.FloatField(null=True)
+    rs = models.FloatField(null=True)
+    rsi = models.FloatField(null=True)
+    ema_12 = models.FloatField(null=True)
+    ema_26 = models.FloatField(null=True)
+    macd_line = models.FloatField(null=True)
+    signal_line = models.FloatField(null=True)
+    macd_golden_cross = models.BooleanField(default=False)
+    macd_death_cross = models.BooleanField(default=False)
+    above_ema_200 = models.BooleanField(default=False)
+    engulfing = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['stock', 'date'], name='unique_indicator_stock_date'),
+        ]
+
+
+class Signal(models.Model):
+    """Fuzzy scores of one bar under a rule set, as written by ``app.snapshots``."""
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE)
+    date = models.DateField()
+    # app.signal_cache.ruleset_tag(): rule set name, version and lookup mode
+    ruleset = models.CharField(max_length=100)
+    entry_position = models.FloatField(null=True)
+    exit_position = models.FloatField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['stock', 'ruleset', 'date'], name='unique_signal_stock_ruleset_date'),
+        ]
+
+
+class SignalSnapshot(models.Model):
+    """One run of the snapshot pipeline; its id is the snapshot version."""
+    ruleset = models.CharField(max_length=100)
+    started_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True)
+    # Stocks whose bars changed since the previous run, and the rows scored
+    stocks = models.PositiveIntegerField(default=0)
+    rows = models.PositiveIntegerField(default=0)
+
+
+class ScrapeJob(models.Model):
+    """A scraping run started from ``api/scraping``, followed at ``api/scraping/jobs/<id>``."""
+    STATUSES = [('pending', 'Pending'), ('running', 'Running'), ('finished', 'Finished'), ('failed', 'Failed')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    codes = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    # Stocks scraped so far, out of len(codes)
+    done = models.PositiveIntegerField(default=0)
+    messages = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True)
@@ -0,0 +1,28 @@
+from app.bar_store import bars_to_frame, read_current_bars
+from app.indicator_store import attach_indicators
+from app.indicators import compute_indicators, prices_to_frame
+from app.models import Price
+from app.timing import stage
+
+
+def history_frame(stock, compute=True):
+    """
+    The whole history of ``stock`` with its indicator columns, ready to be
+    scored. Bars come from the bar store when it is enabled and current,
+    indicators from the indicator store unless it is behind. Then they are
+    computed, or left out without ``compute``. ``None`` when the stock has
+    no bars.
+    """
+    with stage('db'):
+        bars = read_current_bars(stock)
+        if bars is None:
+            data_list = list(Price.objects.filter(stock=stock).order_by('date').values())
+            if not data_list:
+                return None
+    with stage('frame'):
+        df = bars_to_frame(stock, bars) if bars is not None else prices_to_frame(data_list)
+
+    with stage('indicators'):
+        if not attach_indicators(stock, df) and compute:
+            compute_indicators(df)
+    return df
@@ -0,0 +1,60 @@
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Values of the ``format`` query parameter: a list of row objects, or one
+# array per field (much smaller for charting clients)
+response_formats = ('records', 'columns')
+
+
+def frame_chunks(df, response_format='records', chunk_rows=None):
+    """
+    Encode ``df`` as JSON, yielding it ``chunk_rows`` rows at a time so
+    the whole document never has to sit in memory next to the frame.
+    Joined, the chunks are a single JSON document.
+    """
+    chunk_rows = chunk_rows or settings.JSON_CHUNK_ROWS
+    if response_format == 'columns':
+        # One field at a time, each as a plain array
+        yield '{'
+        for number, column in enumerate(df.columns):
+            yield ('' if number == 0 else ',') + json.dumps(column) + ':'
+            yield df[column].to_json(orient='values')
+        yield '}'
+        return
+
+    yield '['
+    for start in range(0, len(df), chunk_rows):
+        records = df.iloc[start:start + chunk_rows].to_json(orient='records')
+        yield ('' if start == 0 else ',') + records[1:-1]
+    yield ']'
+
+
+def queryset_chunks(queryset, fields, response_format='records', chunk_rows=None):
+    """
+    Encode the ``fields`` of ``queryset`` as JSON, reading it with a
+    server-side iterator ``chunk_rows`` rows at a time. The records match
+    what ``JsonResponse(list(queryset.values(*fields)))`` would send.
+    """
+    chunk_rows = chunk_rows or settings.JSON_CHUNK_ROWS
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_rows)
+
+    if response_format == 'columns':
+        # A column needs every row; only the per-row dicts are saved here
+        columns = list(zip(*rows)) or [()] * len(fields)
+        yield json.dumps(dict(zip(fields, map(list, columns))), cls=DjangoJSONEncoder)
+        return
+
+    yield '['
+    chunk = []
+    first = True
+    for row in rows:
+        chunk.append(dict(zip(fields, row)))
+        if len(chunk) == chunk_rows:
+            yield ('' if first else ', ') + json.dumps(chunk, cls=DjangoJSONEncoder)[1:-1]
+            chunk = []
+            first = False
+    if chunk:
+        yield ('' if first else ', ') + json.dumps(chunk, cls=DjangoJSONEncoder)[1:-1]
+    yield ']'
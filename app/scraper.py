@@ -0,0 +1,309 @@
+import csv
+import io
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date as date_type, datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+import urllib3
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone as django_timezone
+
+from app.bar_store import rebuild_bars, store_dir, update_bars
+from app.indicator_store import recompute_indicators, update_indicators
+from app.ingest import upsert_prices
+from app.models import Price, ScrapeJob, Stock
+from app.signal_cache import invalidate_signals
+from app.timing import Timer, stage, timing
+
+
+class FetchError(Exception):
+    """
+    A fetcher could not get the bars of a stock. ``transient`` errors
+    (timeouts, throttling, server errors) may go away on a retry; the
+    others, like an unknown symbol, won't.
+    """
+
+    def __init__(self, message, transient=False):
+        super().__init__(message)
+        self.transient = transient
+
+
+class RateLimiter:
+    """Spaces out requests to the same host by at least ``1 / rate`` seconds."""
+
+    def __init__(self, rate):
+        self.interval = 1. / rate if rate else 0.
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class HttpCsvFetcher:
+    """
+    Download daily bars as CSV (Yahoo Finance download format) over a
+    pooled HTTP connection, retrying failures with exponential backoff.
+    """
+
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(self, url=None, retries=None, backoff=None, rate=None, timeout=None):
+        self.url = url or settings.SCRAPER_CSV_URL
+        self.retries = settings.SCRAPER_RETRIES if retries is None else retries
+        self.backoff = settings.SCRAPER_BACKOFF if backoff is None else backoff
+        self.timeout = timeout or settings.SCRAPER_TIMEOUT
+        self.rate_limiter = RateLimiter(settings.SCRAPER_RATE_LIMIT if rate is None else rate)
+        self.pool = urllib3.PoolManager(
+            maxsize=settings.SCRAPER_CONCURRENCY,
+            headers={'User-Agent': 'Mozilla/5.0'},
+        )
+
+    def fetch(self, code, start):
+        """Return ``(date, open, high, low, close, volume)`` bars of ``code`` from ``start`` on."""
+        period1 = int(datetime.combine(start, datetime.min.time(), timezone.utc).timestamp())
+        period2 = int(time.time())
+        url = self.url.format(symbol=f'{code}.JK', period1=period1, period2=period2)
+        host = urlsplit(url).netloc
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            self.rate_limiter.wait(host)
+            try:
+                with stage('fetch'):
+                    response = self.pool.request('GET', url, timeout=self.timeout, retries=False)
+            except urllib3.exceptions.HTTPError as e:
+                error = str(e)
+                continue
+            if response.status in self.retry_statuses:
+                error = f'HTTP {response.status}'
+                continue
+            if response.status != 200:
+                raise FetchError(f'HTTP {response.status} for {code}')
+            with stage('parse'):
+                return [bar for bar in parse_csv(response.data.decode()) if bar[0] >= start]
+
+        raise FetchError(f'{code}: giving up after {self.retries + 1} attempts ({error})', transient=True)
+
+
+def parse_csv(text):
+    """Parse Yahoo Finance CSV rows, skipping the ones without prices (``null``)."""
+    bars = []
+    for row in csv.DictReader(io.StringIO(text)):
+        try:
+            bars.append((
+                date_type.fromisoformat(row['Date']),
+                float(row['Open']),
+                float(row['High']),
+                float(row['Low']),
+                float(row['Close']),
+                int(float(row['Volume'])),
+            ))
+        except (KeyError, TypeError, ValueError):
+            logging.warning("Skipping CSV row %s", row)
+    return bars
+
+
+class SeleniumFetcher:
+    """Scrape the Yahoo Finance history page with a headless browser."""
+
+    def __init__(self, browser=None):
+        self.browser = browser or settings.SCRAPER_SELENIUM_BROWSER
+
+    def fetch(self, code, start):
+        from selenium import webdriver
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.wait import WebDriverWait
+
+        url = f'https://finance.yahoo.com/quote/{code}.JK/history?p={code}.JK'
+        if self.browser == 'edge':
+            options = webdriver.EdgeOptions()
+            options.add_argument('headless')
+            driver = webdriver.Edge(options=options)
+        else:
+            options = webdriver.ChromeOptions()
+            options.add_argument('--headless')
+            driver = webdriver.Chrome(options=options)
+
+        bars = []
+        try:
+            with stage('fetch'):
+                driver.get(url)
+            elements = WebDriverWait(driver, 10).until(
+                EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'tr.BdT'))
+            )
+            for element in elements:
+                row = [td.text for td in element.find_elements(By.TAG_NAME, 'td')]
+                if len(row) < 7:
+                    logging.warning("Row < 7")
+                    continue
+                try:
+                    bar_date = datetime.strptime(row[0], '%b %d, %Y').date()
+                    values = [float(value.replace(',', '')) for value in row[1:5]]
+                    volume = int(row[6].replace(',', ''))
+                except ValueError:
+                    continue  # dividend and split rows
+                if bar_date < start:
+                    break  # rows are newest first
+                bars.append((bar_date, *values, volume))
+        except Exception as e:
+            # Page load and wait timeouts mostly
+            raise FetchError(str(e), transient=True) from e
+        finally:
+            driver.quit()
+
+        return bars[::-1]
+
+
+class FallbackFetcher:
+    """Try each fetcher in turn until one succeeds."""
+
+    def __init__(self, *fetchers):
+        self.fetchers = fetchers
+
+    def fetch(self, code, start):
+        errors = []
+        for fetcher in self.fetchers:
+            try:
+                return fetcher.fetch(code, start)
+            except FetchError as e:
+                logging.warning("%s failed for %s: %s", type(fetcher).__name__, code, e)
+                errors.append(e)
+        # Worth retrying when one of the fetchers might succeed next time
+        raise FetchError('; '.join(str(e) for e in errors), transient=any(e.transient for e in errors))
+
+
+def default_fetcher():
+    fetchers = {'http': HttpCsvFetcher, 'selenium': SeleniumFetcher}
+    return FallbackFetcher(*(fetchers[name]() for name in settings.SCRAPER_FETCHERS))
+
+
+def save_bars(stock, bars):
+    """
+    Upsert the fetched bars and bring the indicator store up to date.
+
+    Bars at or before the last stored one replace the stored values, in
+    which case the indicators are recomputed from scratch since every later
+    value depends on them.
+    """
+    if not bars:
+        return 'Data sudah paling baru'
+
+    last_date = Price.objects.filter(stock=stock).aggregate(last=Max('date'))['last']
+    rewritten = [bar for bar in bars if last_date is not None and bar[0] <= last_date]
+    upsert_prices(stock, bars)
+
+    if rewritten:
+        recompute_indicators(stock)
+        if store_dir():
+            rebuild_bars(stock)
+        invalidate_signals(stock)
+        return f'Saved {len(bars) - len(rewritten)} new bars, rewrote {len(rewritten)}'
+    update_indicators(stock)
+    update_bars(stock)
+    invalidate_signals(stock)
+    return f'Saved {len(bars)} new bars'
+
+
+def start_date(stock):
+    """First date to fetch for ``stock``: the day after its last stored bar."""
+    last_date = Price.objects.filter(stock=stock).aggregate(last=Max('date'))['last']
+    return last_date + timedelta(days=1) if last_date else date_type(1990, 1, 1)
+
+
+def _timed_fetch(fetcher, code, start, timer):
+    # Pool threads don't share the caller's context, so set the timer here
+    with timing(timer):
+        return fetcher.fetch(code, start)
+
+
+def timed_save_bars(stock, bars, timer):
+    """``save_bars`` timed as the 'write' stage of ``timer``."""
+    with timing(timer), stage('write'):
+        return save_bars(stock, bars)
+
+
+_jobs_lock = threading.Lock()
+# Jobs finished up to then are in this process's histograms
+_observed_until = django_timezone.now()
+
+
+def observe_scrape_jobs():
+    """
+    Add the per stock timings of the scrape jobs finished since the last
+    call to the scraper histograms. The jobs run in the Celery workers,
+    whose histograms ``/metrics`` can't see, and keep the timings in their
+    messages.
+    """
+    global _observed_until
+    with _jobs_lock:
+        jobs = list(
+            ScrapeJob.objects.filter(finished_at__gt=_observed_until)
+            .order_by('finished_at').values_list('finished_at', 'messages')
+        )
+        for finished_at, messages in jobs:
+            for message in messages:
+                timer = Timer()
+                for name, seconds in message.get('timings', {}).items():
+                    timer.add(name, seconds)
+                timer.observe('scraper_stage_duration_seconds')
+            _observed_until = finished_at
+
+
+def scrape_stocks(codes, fetcher=None, concurrency=None):
+    """
+    Fetch and store new bars for ``codes``.
+
+    Fetching runs in a pool of ``concurrency`` threads
+    (``settings.SCRAPER_CONCURRENCY`` by default). The results are written
+    from the calling thread as they arrive, so database writes stay serial.
+    Returns one ``{'stock_code', 'msg', 'timings'}`` dict per code, in input
+    order; ``timings`` holds the fetch/parse/write seconds of the stock.
+    """
+    fetcher = fetcher or default_fetcher()
+    concurrency = concurrency or settings.SCRAPER_CONCURRENCY
+    stocks = {stock.code: stock for stock in Stock.objects.filter(code__in=[code.upper() for code in codes])}
+
+    messages = {}
+    timers = {code: Timer() for code in codes}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {}
+        for code in codes:
+            stock = stocks.get(code.upper())
+            if stock is None:
+                messages[code] = f"Stock with code '{code}' not found."
+                logging.error(messages[code])
+                continue
+            future = executor.submit(_timed_fetch, fetcher, stock.code, start_date(stock), timers[code])
+            futures[future] = (code, stock)
+
+        for future in as_completed(futures):
+            code, stock = futures[future]
+            try:
+                messages[code] = timed_save_bars(stock, future.result(), timers[code])
+            except Exception as e:
+                messages[code] = f"An error occurred: {str(e)}"
+                logging.error(messages[code])
+            timers[code].observe('scraper_stage_duration_seconds')
+
+    return [
+        {'stock_code': code, 'msg': messages[code], 'timings': timers[code].durations}
+        for code in codes
+    ]
+
+
+def scrape_stock_data(stock_symbol, fetcher=None):
+    return scrape_stocks([stock_symbol], fetcher=fetcher, concurrency=1)[0]['msg']
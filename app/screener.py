@@ -0,0 +1,132 @@
+import math
+import time
+
+import numpy as np
+import pandas as pd
+from django.db.models import OuterRef, Subquery
+
+from app.fuzzy import get_ruleset, score
+from app.indicators import indicator_columns
+from app.models import Indicator, Price, Signal, Stock
+from app.signal_cache import get_cache, ruleset_tag, screener_key
+
+# Indicator columns listed for every stock next to the scores
+screener_columns = [
+    'RSI', '%K', '%D', 'macd_line', 'signal_line',
+    'MACD_GoldenCross', 'MACD_DeathCross', 'SupportArea', 'ResistanceArea', 'Above_EMA_200',
+]
+
+# Fields the screener can be sorted by
+sort_fields = ['code', 'name', 'sector', 'Date', 'Close', 'Entry_Position', 'Exit_Position', *screener_columns]
+
+
+def _json_value(value):
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (float, np.floating)):
+        return None if math.isnan(value) else float(value)
+    return value
+
+
+def compute_screener(ruleset=None):
+    """
+    Score the latest bar of every stock with stored indicators under
+    ``ruleset`` (default ``get_ruleset()``).
+
+    One query reads the last ``Indicator`` row of each stock, joined with its
+    close and the scores a snapshot stored for that bar, if any. The bars
+    without stored scores go through a single vectorized fuzzy call.
+    Returns one dict per stock, ordered by code.
+    """
+    ruleset = ruleset or get_ruleset()
+    # Driven from Stock so each stock costs one index seek on (stock, date)
+    latest = Stock.objects.annotate(
+        indicator_id=Subquery(Indicator.objects.filter(stock=OuterRef('pk')).order_by('-date').values('id')[:1])
+    ).values('indicator_id')
+    close = Price.objects.filter(stock=OuterRef('stock'), date=OuterRef('date')).values('close')[:1]
+    signal = Signal.objects.filter(stock=OuterRef('stock'), ruleset=ruleset_tag(ruleset), date=OuterRef('date'))
+    rows = list(
+        Indicator.objects
+        .filter(id__in=latest)
+        .annotate(
+            close=Subquery(close),
+            signal_id=Subquery(signal.values('id')[:1]),
+            entry_position=Subquery(signal.values('entry_position')[:1]),
+            exit_position=Subquery(signal.values('exit_position')[:1]),
+        )
+        .order_by('stock__code')
+        .values('stock__code', 'stock__name', 'stock__sector', 'date', 'close', *indicator_columns,
+                'signal_id', 'entry_position', 'exit_position')
+    )
+    if not rows:
+        return []
+
+    df = pd.DataFrame(rows).rename(columns={
+        'stock__code': 'code',
+        'stock__name': 'name',
+        'stock__sector': 'sector',
+        'date': 'Date',
+        'close': 'Close',
+        'entry_position': 'Entry_Position',
+        'exit_position': 'Exit_Position',
+        **indicator_columns,
+    })
+    df[['Entry_Position', 'Exit_Position']] = df[['Entry_Position', 'Exit_Position']].astype(np.float64)
+    unscored = df['signal_id'].isna()
+    if unscored.any():
+        # Bars newer than the last snapshot, or no snapshot of this rule set
+        pending = df[unscored].copy()
+        score(pending, ruleset=ruleset)
+        df.loc[unscored, ['Entry_Position', 'Exit_Position']] = pending[['Entry_Position', 'Exit_Position']]
+    df['Date'] = df['Date'].apply(lambda x: x.strftime('%Y-%m-%d'))
+
+    columns = ['code', 'name', 'sector', 'Date', 'Close', 'Entry_Position', 'Exit_Position', *screener_columns]
+    return [
+        {column: _json_value(value) for column, value in zip(columns, values)}
+        for values in zip(*(df[column].tolist() for column in columns))
+    ]
+
+
+def refresh_screener(ruleset=None):
+    """Recompute the screener of ``ruleset`` and store it in the signal cache."""
+    entry = {'stocks': compute_screener(ruleset), 'updated': time.time()}
+    get_cache().set(screener_key(ruleset), entry)
+    return entry
+
+
+def get_screener(ruleset=None):
+    """The cached screener of ``ruleset``, computed on the first request after an invalidation."""
+    entry = get_cache().get(screener_key(ruleset))
+    if entry is None:
+        entry = refresh_screener(ruleset)
+    return entry
+
+
+def filter_screener(stocks, sectors=None, min_entry=None, max_entry=None, min_exit=None, max_exit=None,
+                    sort='-Entry_Position'):
+    """
+    Filter the screener rows by sector (case-insensitive) and score range,
+    then sort them by ``sort`` (``-`` prefix for descending). Rows without
+    a value for the sort field come last.
+    """
+    if sectors:
+        sectors = {sector.lower() for sector in sectors}
+        stocks = [stock for stock in stocks if stock['sector'].lower() in sectors]
+
+    bounds = [
+        ('Entry_Position', min_entry, max_entry),
+        ('Exit_Position', min_exit, max_exit),
+    ]
+    for field, low, high in bounds:
+        if low is not None:
+            stocks = [stock for stock in stocks if stock[field] is not None and stock[field] >= low]
+        if high is not None:
+            stocks = [stock for stock in stocks if stock[field] is not None and stock[field] <= high]
+
+    field = sort.lstrip('-')
+    if field not in sort_fields:
+        raise ValueError(f"Cannot sort by '{field}'")
+    missing = [stock for stock in stocks if stock[field] is None]
+    present = [stock for stock in stocks if stock[field] is not None]
+    present.sort(key=lambda stock: stock[field], reverse=sort.startswith('-'))
+    return present + missing
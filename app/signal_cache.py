@@ -0,0 +1,111 @@
+import hashlib
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, F, Max, Sum
+
+from app.fuzzy import get_ruleset
+from app.models import Price, Stock
+
+_lock = threading.Lock()
+_counts = Counter()
+
+
+def get_cache():
+    return caches[settings.SIGNAL_CACHE]
+
+
+def _count(outcome):
+    with _lock:
+        _counts[outcome] += 1
+
+
+def counts():
+    """Hits and misses of this process since it started."""
+    with _lock:
+        return {'hits': _counts['hits'], 'misses': _counts['misses']}
+
+
+def ruleset_tag(ruleset=None):
+    """Identifies what the scores are computed with, for the cache keys."""
+    ruleset = ruleset or get_ruleset()
+    lut_mode = getattr(settings, 'FUZZY_LUT_MODE', None) or 'exact'
+    return f'{ruleset.name}:{ruleset.version}:{lut_mode}'
+
+
+def _last_date(stock):
+    return Price.objects.filter(stock=stock).aggregate(last=Max('date'))['last']
+
+
+async def _alast_date(stock):
+    return (await Price.objects.filter(stock=stock).aaggregate(last=Max('date')))['last']
+
+
+def _signal_key(stock, last_date, tag, response_format):
+    return f'signals:{stock.code}:{stock.data_version}:{last_date.isoformat()}:{tag}:{response_format}'
+
+
+def signal_key(stock, response_format='records', ruleset=None):
+    """
+    Cache key of the scored history of ``stock`` in ``response_format``:
+    its code and data version, the date of its last bar and the rule set
+    scoring it. ``None`` when it has no bars.
+    """
+    last_date = _last_date(stock)
+    if last_date is None:
+        return None
+    return _signal_key(stock, last_date, ruleset_tag(ruleset), response_format)
+
+
+async def asignal_key(stock, response_format='records', ruleset=None):
+    """``signal_key`` for async views."""
+    last_date = await _alast_date(stock)
+    if last_date is None:
+        return None
+    return _signal_key(stock, last_date, ruleset_tag(ruleset), response_format)
+
+
+def screener_key(ruleset=None):
+    # Any bars written, added or removed stock moves the version
+    version = Stock.objects.aggregate(stocks=Count('pk'), writes=Sum('data_version'))
+    return f"screener:{version['stocks']}:{version['writes'] or 0}:{ruleset_tag(ruleset)}"
+
+
+def etag(content):
+    return '"%s"' % hashlib.md5(content).hexdigest()
+
+
+def get_signals(key):
+    """Return the cached ``{'content', 'etag', 'last_modified'}`` entry of ``key``, or ``None``."""
+    entry = get_cache().get(key)
+    _count('misses' if entry is None else 'hits')
+    return entry
+
+
+async def aget_signals(key):
+    entry = await get_cache().aget(key)
+    _count('misses' if entry is None else 'hits')
+    return entry
+
+
+def set_signals(key, entry):
+    get_cache().set(key, entry)
+
+
+async def aset_signals(key, entry):
+    await get_cache().aset(key, entry)
+
+
+def invalidate_signals(stock):
+    """
+    Make the cached scores of ``stock`` and the screener stale after its
+    bars were written, by bumping its ``data_version``.
+
+    The keys hold the version rather than the entries being deleted: the
+    scraper runs in the Celery workers and the cache may be local to each
+    process, so only the database reaches every server.
+    """
+    Stock.objects.filter(pk=stock.pk).update(data_version=F('data_version') + 1)
+    stock.refresh_from_db(fields=['data_version'])
@@ -0,0 +1,98 @@
+from datetime import date as date_type
+
+import pandas as pd
+
+
+class Slice:
+    """
+    The ``from``, ``to``, ``limit``, ``cursor`` and ``fields`` query
+    parameters of the history endpoints.
+
+    Rows come in date order. ``cursor`` is the date of the last row of the
+    previous page, as sent back in the ``X-Next-Cursor`` header. The date
+    column is always part of a ``fields`` projection. Invalid values raise
+    ``ValueError`` with a message for the client.
+    """
+
+    params = ('from', 'to', 'limit', 'cursor', 'fields')
+
+    def __init__(self, query, columns, date_column):
+        self.date_column = date_column
+        self.active = any(query.get(param) for param in self.params)
+        self.date_from = self._date(query, 'from')
+        self.date_to = self._date(query, 'to')
+        self.cursor = self._date(query, 'cursor')
+
+        self.limit = None
+        if query.get('limit'):
+            try:
+                self.limit = int(query['limit'])
+            except ValueError:
+                raise ValueError("'limit' must be a positive integer")
+            if self.limit < 1:
+                raise ValueError("'limit' must be a positive integer")
+
+        self.fields = list(columns)
+        if query.get('fields'):
+            requested = [field.strip() for field in query['fields'].split(',') if field.strip()]
+            unknown = [field for field in requested if field not in columns]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+            self.fields = [date_column] + [field for field in requested if field != date_column]
+
+    @staticmethod
+    def _date(query, param):
+        if not query.get(param):
+            return None
+        try:
+            return date_type.fromisoformat(query[param])
+        except ValueError:
+            raise ValueError(f"'{param}' must be a date (YYYY-MM-DD)")
+
+    def filter(self, queryset):
+        """Restrict a queryset with a ``date`` field to the requested range, in date order."""
+        if self.date_from:
+            queryset = queryset.filter(date__gte=self.date_from)
+        if self.date_to:
+            queryset = queryset.filter(date__lte=self.date_to)
+        if self.cursor:
+            queryset = queryset.filter(date__gt=self.cursor)
+        return queryset.order_by('date')
+
+    def filter_frame(self, df):
+        """
+        ``filter`` for a DataFrame in date order whose date column holds ISO
+        dates, projected on ``fields``.
+        """
+        dates = df[self.date_column]
+        keep = pd.Series(True, index=df.index)
+        if self.date_from:
+            keep &= dates >= self.date_from.isoformat()
+        if self.date_to:
+            keep &= dates <= self.date_to.isoformat()
+        if self.cursor:
+            keep &= dates > self.cursor.isoformat()
+        return df.loc[keep, self.fields].reset_index(drop=True)
+
+    def page(self, queryset):
+        """
+        Return the current page of the filtered ``queryset`` and the cursor
+        of the next one (``None`` on the last page).
+        """
+        if not self.limit:
+            return queryset, None
+        # One indexed lookup tells whether a row follows the page
+        dates = list(queryset.values_list('date', flat=True)[self.limit - 1:self.limit + 1])
+        next_cursor = dates[0].isoformat() if len(dates) == 2 else None
+        return queryset[:self.limit], next_cursor
+
+
+def add_next_link(request, response, next_cursor):
+    """Point the client at the next page with ``X-Next-Cursor`` and a ``Link`` header."""
+    if next_cursor is None:
+        return response
+    query = request.GET.copy()
+    query['cursor'] = next_cursor
+    response['X-Next-Cursor'] = next_cursor
+    response['Link'] = f'<{request.path}?{query.urlencode()}>; rel="next"'
+    return response
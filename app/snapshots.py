@@ -0,0 +1,140 @@
+import math
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db.models import F, Max, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from app.fuzzy import get_ruleset, score
+from app.indicator_store import attach_indicators, update_indicators
+from app.indicators import prices_to_frame
+from app.models import Price, Signal, SignalSnapshot, Stock
+from app.signal_cache import ruleset_tag
+
+
+def changed_stocks(ruleset=None):
+    """
+    Ids of the stocks whose last bar has no stored scores under
+    ``ruleset``: new bars since the last snapshot, or scores dropped when
+    their indicators were recomputed.
+    """
+    tag = ruleset_tag(ruleset)
+    last_signal = Signal.objects.filter(stock=OuterRef('pk'), ruleset=tag).order_by('-date').values('date')[:1]
+    stocks = Stock.objects.annotate(last_bar=Max('price__date'), last_signal=Subquery(last_signal))
+    return list(
+        stocks.filter(last_bar__isnull=False)
+        .filter(Q(last_signal__isnull=True) | ~Q(last_signal=F('last_bar')))
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+
+
+def _to_db(value):
+    return None if math.isnan(value) else value
+
+
+def snapshot_stocks(stock_ids, ruleset=None):
+    """
+    Score and store the bars of ``stock_ids`` that have no scores under
+    ``ruleset`` yet. Indicators are brought up to date first; the new rows
+    of every stock then go through a single fuzzy call. Returns the number
+    of rows written.
+    """
+    ruleset = ruleset or get_ruleset()
+    tag = ruleset_tag(ruleset)
+    frames = []
+    for stock in Stock.objects.filter(pk__in=stock_ids):
+        update_indicators(stock)
+        last = Signal.objects.filter(stock=stock, ruleset=tag).aggregate(last=Max('date'))['last']
+        prices = Price.objects.filter(stock=stock).order_by('date')
+        if last is not None:
+            prices = prices.filter(date__gt=last)
+        data_list = list(prices.values())
+        if not data_list:
+            continue
+        df = prices_to_frame(data_list)
+        # The scores are per bar, so only the new ones need the stored indicators
+        if not attach_indicators(stock, df):
+            raise RuntimeError(f'Indicators of {stock.code} are behind its bars')
+        frames.append(df)
+    if not frames:
+        return 0
+
+    df = pd.concat(frames, ignore_index=True)
+    score(df, ruleset=ruleset)
+    Signal.objects.bulk_create(
+        (
+            Signal(stock_id=stock_id, date=date, ruleset=tag,
+                   entry_position=_to_db(entry_position), exit_position=_to_db(exit_position))
+            for stock_id, date, entry_position, exit_position in zip(
+                df['stock_id'], df['Date'], df['Entry_Position'].tolist(), df['Exit_Position'].tolist())
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    return len(df)
+
+
+def start_snapshot(ruleset=None):
+    """
+    Open a ``SignalSnapshot`` of ``ruleset`` and return it with the
+    changed stock ids split in chunks of ``SNAPSHOT_CHUNK`` stocks. Scores
+    of older versions of the rule set are dropped.
+    """
+    ruleset = ruleset or get_ruleset()
+    tag = ruleset_tag(ruleset)
+    Signal.objects.filter(ruleset__startswith=f'{ruleset.name}:').exclude(ruleset=tag).delete()
+    stock_ids = changed_stocks(ruleset)
+    snapshot = SignalSnapshot.objects.create(ruleset=tag, stocks=len(stock_ids))
+    size = settings.SNAPSHOT_CHUNK
+    return snapshot, [stock_ids[start:start + size] for start in range(0, len(stock_ids), size)]
+
+
+def snapshot_chunk(snapshot_id, stock_ids, ruleset=None):
+    rows = snapshot_stocks(stock_ids, ruleset)
+    SignalSnapshot.objects.filter(pk=snapshot_id).update(rows=F('rows') + rows)
+    return rows
+
+
+def finish_snapshot(snapshot_id):
+    SignalSnapshot.objects.filter(pk=snapshot_id).update(completed_at=timezone.now())
+
+
+def run_snapshot(ruleset=None):
+    """Write a snapshot in this process, one chunk after the other. Returns the ``SignalSnapshot``."""
+    snapshot, chunks = start_snapshot(ruleset)
+    for stock_ids in chunks:
+        snapshot_chunk(snapshot.pk, stock_ids, ruleset)
+    finish_snapshot(snapshot.pk)
+    snapshot.refresh_from_db()
+    return snapshot
+
+
+def latest_snapshot(ruleset=None):
+    """The last completed ``SignalSnapshot`` of ``ruleset``, or ``None``."""
+    return (SignalSnapshot.objects.filter(ruleset=ruleset_tag(ruleset), completed_at__isnull=False)
+            .order_by('-completed_at').first())
+
+
+def attach_signals(stock, df, ruleset=None):
+    """
+    Add the stored ``Entry_Position`` / ``Exit_Position`` of ``stock`` under
+    ``ruleset`` to ``df``, like ``attach_indicators``: the frame must hold
+    all its bars or a contiguous range of them. Returns ``False``, leaving
+    ``df`` untouched, unless every row has stored scores.
+    """
+    if not len(df):
+        return False
+    rows = list(
+        Signal.objects
+        .filter(stock=stock, ruleset=ruleset_tag(ruleset), date__gte=df['Date'].iloc[0], date__lte=df['Date'].iloc[-1])
+        .order_by('date')
+        .values_list('date', 'entry_position', 'exit_position')
+    )
+    if len(rows) != len(df) or any(row[0] != date for row, date in zip(rows, df['Date'])):
+        return False
+    _, entry_positions, exit_positions = zip(*rows)
+    df['Entry_Position'] = np.array(entry_positions, dtype=np.float64)
+    df['Exit_Position'] = np.array(exit_positions, dtype=np.float64)
+    return True
@@ -0,0 +1,301 @@
+import dataclasses
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from app.backtest import BacktestParams, simulate
+from app.compute import _warm
+from app.fuzzy import VectorizedSystem, build_control_systems, get_ruleset, score
+from app.indicators import DEFAULT_WINDOWS, compute_indicators
+from app.models import Price
+
+# A configuration maps names to values: ``DEFAULT_WINDOWS`` keys, membership
+# triangles of the default rule set as '<input>.<term>' (e.g.
+# 'rsi.oversold': [0, 25, 40]) and
+# ``BacktestParams`` fields such as 'entry' / 'exit'
+default_space = {
+    'rolling': [20, 50],
+    'stochastic': [[14, 3], [9, 3]],
+    'rsi': [9, 14, 21],
+    # The MACD settings tried by hand before
+    'macd': [[12, 26, 9], [8, 21, 5], [3, 17, 5], [3, 10, 16]],
+}
+
+price_columns = ['Open', 'High', 'Low', 'Close']
+
+backtest_fields = {field.name for field in dataclasses.fields(BacktestParams)}
+
+
+def _parameter_kind(name):
+    if name in DEFAULT_WINDOWS:
+        return 'window'
+    variable, _, term = name.partition('.')
+    if term in get_ruleset().definition['inputs'].get(variable, {}).get('terms', {}):
+        return 'membership'
+    if name in backtest_fields:
+        return 'backtest'
+    raise ValueError(f"Unknown sweep parameter '{name}'")
+
+
+def config_key(config):
+    """Stable text identifying ``config`` in a results file."""
+    return json.dumps(config, sort_keys=True)
+
+
+def sweep_run(stocks, params):
+    """What the results of a sweep depend on besides the configurations: the stock codes and ``params``."""
+    return {'stocks': sorted(stock.code for stock in stocks), 'params': dataclasses.asdict(params)}
+
+
+def split_config(config):
+    """Split ``config`` into ``compute_indicators`` windows, memberships and ``BacktestParams`` overrides."""
+    windows, memberships, overrides = {}, {}, {}
+    for name, value in config.items():
+        kind = _parameter_kind(name)
+        if kind == 'window':
+            windows[name] = value
+        elif kind == 'membership':
+            variable, term = name.split('.', 1)
+            memberships.setdefault(variable, {})[term] = value
+        else:
+            overrides[name] = value
+    return windows, memberships, overrides
+
+
+def grid_configs(space):
+    """Every combination of the values in ``space`` (``{name: [values]}``)."""
+    names = sorted(space)
+    for name in names:
+        _parameter_kind(name)
+    # Through JSON so tuples and lists give the same config_key
+    return [json.loads(json.dumps(dict(zip(names, values))))
+            for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_configs(space, count, seed=None):
+    """``count`` distinct random combinations of ``space``, the same ones for the same ``seed``."""
+    names = sorted(space)
+    if count >= math.prod(len(space[name]) for name in names):
+        return grid_configs(space)
+    for name in names:
+        _parameter_kind(name)
+    rng = random.Random(seed)
+    configs = {}
+    while len(configs) < count:
+        config = json.loads(json.dumps({name: rng.choice(space[name]) for name in names}))
+        configs.setdefault(config_key(config), config)
+    return list(configs.values())
+
+
+def load_prices(stocks):
+    """
+    Read the bars of ``stocks`` in one query. Returns a ``(rows, 4)``
+    float64 array of ``price_columns`` and ``{code: (start, stop)}`` row
+    ranges into it.
+    """
+    rows = list(Price.objects.filter(stock__in=stocks).order_by('stock__code', 'date')
+                .values_list('stock__code', 'open', 'high', 'low', 'close'))
+    prices = np.array([row[1:] for row in rows], dtype=np.float64).reshape(-1, len(price_columns))
+    offsets = {}
+    for index, (code, *_) in enumerate(rows):
+        start, _ = offsets.get(code, (index, index))
+        offsets[code] = (start, index + 1)
+    return prices, offsets
+
+
+def load_results(path, run=None):
+    """
+    ``{config_key: result}`` of a results file; a torn last line is ignored.
+    With ``run`` (a ``sweep_run``) only the results of that run are kept.
+    """
+    results = {}
+    if not path or not os.path.exists(path):
+        return results
+    with open(path) as results_file:
+        for line in results_file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if run is not None and result.get('run') != run:
+                continue
+            results[config_key(result['config'])] = result
+    return results
+
+
+def _open_results(path):
+    torn = False
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, 'rb') as results_file:
+            results_file.seek(-1, os.SEEK_END)
+            torn = results_file.read(1) != b'\n'
+    results_file = open(path, 'a')
+    # End a line torn by an interruption so the next result starts afresh
+    if torn:
+        results_file.write('\n')
+    return results_file
+
+
+# The price array and its row ranges, in every worker (or here when run
+# in a single process)
+_prices = None
+_shared = None
+
+
+def _use_prices(prices, offsets):
+    global _prices
+    _prices = (prices, offsets)
+    _indicator_frames.cache_clear()
+
+
+def _attach(name, shape, offsets):
+    global _shared
+    if _shared is not None and _shared.name == name:
+        return
+    _shared = shared_memory.SharedMemory(name=name)
+    prices = np.ndarray(shape, dtype=np.float64, buffer=_shared.buf)
+    prices.flags.writeable = False
+    _use_prices(prices, offsets)
+
+
+@lru_cache(maxsize=2)
+def _indicator_frames(windows_key):
+    # Configurations sharing windows reuse these frames
+    prices, offsets = _prices
+    frames = []
+    for start, stop in offsets.values():
+        df = compute_indicators(pd.DataFrame(prices[start:stop], columns=price_columns),
+                                json.loads(windows_key))
+        frames.append(df[['Open', 'Close', *get_ruleset().columns]].copy())
+    return frames
+
+
+@lru_cache(maxsize=32)
+def _systems(memberships_key):
+    entry_position_ctrl, exit_position_ctrl = build_control_systems(memberships=json.loads(memberships_key))
+    return VectorizedSystem(entry_position_ctrl), VectorizedSystem(exit_position_ctrl)
+
+
+def _metrics(frames, systems, params):
+    returns, drawdowns = [], []
+    trades = wins = closed = 0
+    for df in frames:
+        score(df, systems=systems)
+        result = simulate(
+            np.arange(len(df)),
+            df['Open'].to_numpy(dtype=np.float64),
+            df['Close'].to_numpy(dtype=np.float64),
+            df['Entry_Position'].to_numpy(dtype=np.float64),
+            df['Exit_Position'].to_numpy(dtype=np.float64),
+            params,
+        )
+        returns.append(result['summary']['total_return'])
+        drawdowns.append(result['summary']['max_drawdown'])
+        trades += len(result['trades'])
+        pnls = [trade['pnl'] for trade in result['trades'] if trade['pnl'] is not None]
+        wins += sum(pnl > 0 for pnl in pnls)
+        closed += len(pnls)
+    return {
+        'stocks': len(frames),
+        'mean_return': float(np.mean(returns)) if returns else None,
+        'median_return': float(np.median(returns)) if returns else None,
+        'mean_drawdown': float(np.mean(drawdowns)) if drawdowns else None,
+        'worst_drawdown': float(np.min(drawdowns)) if drawdowns else None,
+        'trades': trades,
+        'win_rate': wins / closed if closed else None,
+    }
+
+
+def _evaluate(windows_key, configs, params, run, shared=None):
+    # Runs in a worker process on the shared prices, attached on its first task
+    if shared is not None:
+        _attach(*shared)
+    frames = _indicator_frames(windows_key)
+    results = []
+    for config in configs:
+        _, memberships, overrides = split_config(config)
+        systems = _systems(json.dumps(memberships, sort_keys=True))
+        metrics = _metrics(frames, systems, dataclasses.replace(params, **overrides))
+        results.append({'config': config, 'run': run, 'metrics': metrics})
+    return results
+
+
+def _tasks(configs, workers):
+    # Group by windows so the indicators are computed once per group and worker
+    groups = {}
+    for config in configs:
+        windows, _, _ = split_config(config)
+        groups.setdefault(json.dumps(windows, sort_keys=True), []).append(config)
+    tasks = []
+    for windows_key, group in groups.items():
+        size = math.ceil(len(group) / workers)
+        tasks += [(windows_key, group[start:start + size]) for start in range(0, len(group), size)]
+    return tasks
+
+
+def run_sweep(stocks, configs, output=None, workers=None, params=None):
+    """
+    Backtest every configuration of ``configs`` on ``stocks`` and return
+    the results, best ``mean_return`` first.
+
+    The prices are read once into a shared memory block that the pool of
+    ``workers`` processes (``settings.BACKTEST_WORKERS``, else one per CPU)
+    maps read-only. Each result is appended to the JSON lines file
+    ``output`` as it arrives, with its ``sweep_run``; configurations already
+    there for the same stocks and ``params`` are skipped, so an interrupted
+    sweep resumes where it stopped.
+    """
+    params = params or BacktestParams.defaults()
+    workers = workers or settings.BACKTEST_WORKERS or os.cpu_count()
+    # Through JSON, as it comes back from the file
+    run = json.loads(json.dumps(sweep_run(stocks, params)))
+    done = load_results(output, run)
+    results = [done[config_key(config)] for config in configs if config_key(config) in done]
+    pending = [config for config in configs if config_key(config) not in done]
+
+    prices, offsets = load_prices(stocks)
+    if pending and offsets:
+        tasks = _tasks(pending, workers)
+        results_file = _open_results(output) if output else None
+        shared = executor = None
+        try:
+            if workers <= 1 or len(tasks) <= 1:
+                _use_prices(prices, offsets)
+                completed = (_evaluate(*task, params, run) for task in tasks)
+            else:
+                shared = shared_memory.SharedMemory(create=True, size=prices.nbytes)
+                np.ndarray(prices.shape, dtype=np.float64, buffer=shared.buf)[:] = prices
+                # Spawned, not forked: the caller may have threads (and their locks)
+                # running. A spawned worker sets Django up in _warm before it can
+                # import this module, so the prices come with the tasks
+                executor = ProcessPoolExecutor(
+                    max_workers=min(workers, len(tasks)), mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_warm)
+                attach = (shared.name, prices.shape, offsets)
+                futures = [executor.submit(_evaluate, *task, params, run, attach) for task in tasks]
+                completed = (future.result() for future in as_completed(futures))
+            for task_results in completed:
+                if results_file:
+                    results_file.writelines(json.dumps(result) + '\n' for result in task_results)
+                    results_file.flush()
+                results += task_results
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            if shared is not None:
+                shared.close()
+                shared.unlink()
+            if results_file:
+                results_file.close()
+
+    return sorted(results, key=lambda result: -(result['metrics']['mean_return'] or 0))
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+
+
+def make_ohlcv(n=400, seed=7):
+    """Deterministic random-walk OHLCV frame with the pipeline column names."""
+    rng = np.random.RandomState(seed)
+    close = 1000 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * (1 + rng.normal(0, 0.01, n))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, n)))
+    return pd.DataFrame({
+        'Date': pd.bdate_range('2000-01-03', periods=n).date,
+        'Open': open_.round(),
+        'High': high.round(),
+        'Low': low.round(),
+        'Close': close.round(),
+        'Volume': rng.randint(1000, 100000, n),
+    })
@@ -1,92 +1,112 @@
-from app.models import Stock, Price
 import logging
-from django.db import transaction
-from celery import shared_task, Celery
-import os
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from datetime import datetime
+
+from celery import chord
+from celery.exceptions import SoftTimeLimitExceeded
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from app import snapshots
+from app.fuzzy import get_ruleset
+from app.models import ScrapeJob, Stock
+from app.screener import refresh_screener
+from app.scraper import FetchError, default_fetcher, start_date, timed_save_bars
+from app.timing import Timer, timing
 from stock_api.celery import app
 
 
-def scrape_stock_data(stock_symbol):
-    msg = ''
+@app.task(
+    bind=True,
+    acks_late=True,
+    max_retries=settings.SCRAPER_RETRIES,
+    soft_time_limit=settings.SCRAPER_TASK_SOFT_TIME_LIMIT,
+    time_limit=settings.SCRAPER_TASK_TIME_LIMIT,
+)
+def scrape_stock(self, stock_code, job_id=None):
+    """Fetch and store new bars of one stock, retrying transient fetch errors."""
+    stock = Stock.objects.filter(code=stock_code.upper()).first()
+    if stock is None:
+        msg = f"Stock with code '{stock_code}' not found."
+        logging.error(msg)
+        _count_done(job_id)
+        return {'stock_code': stock_code, 'msg': msg, 'timings': {}}
 
+    timer = Timer()
     try:
-        # Retrieve the Stock instance based on the stock symbol
-        stock_data = Stock.objects.get(code=stock_symbol)
-        
-        # Get the last recorded date for the specific stock
-        last_price = Price.objects.filter(stock=stock_data).latest('date')
-        stop_date = last_price.date.strftime('%b %d, %Y')
-        
-        # Define the URL and set up the webdriver
-        url = f'https://finance.yahoo.com/quote/{stock_symbol}.JK/history?p={stock_symbol}.JK'
-        path = os.path.join(os.path.dirname(__file__), 'chromedriver.exe')
-        options = webdriver.ChromeOptions()
-        options.add_argument('--headless')  # Use headless browser
-        driver = webdriver.Chrome(executable_path=path, options=options)
-        driver.get(url)
-        
-        # Scrape data
-        elements = WebDriverWait(driver, 10).until(
-            EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'tr.BdT'))
-        )
-        
-        for element in elements:
-            row = element.find_elements(By.TAG_NAME, 'td')
-            if last_price.date.strftime('%b %d, %Y') == row[0].text:
-                msg = 'Data sudah paling baru'
-                break
-
-            if len(row) >= 5:
-                date = row[0].text
-                open_price = float(row[1].text.replace(',', ''))
-                high_price = float(row[2].text.replace(',', ''))
-                low_price = float(row[3].text.replace(',', ''))
-                close_price = float(row[4].text.replace(',', ''))
-                volume = int(row[6].text.replace(',', ''))
-
-                # Create the Price instance and save it to the database within a transaction
-                with transaction.atomic():
-                    price_instance = Price(
-                        stock=stock_data,
-                        date=datetime.strptime(date, '%b %d, %Y'),
-                        open=open_price,
-                        high=high_price,
-                        low=low_price,
-                        close=close_price,
-                        volume=volume
-                    )
-                    price_instance.save()
-                logging.info(f"Saved data for date: {date}")
-
-                if date == stop_date:
-                    msg = "Reached stop date. Exiting the loop"
-                    break
-            else:
-                logging.warning("Row < 5")
-    except Stock.DoesNotExist:
-        msg = f"Stock with code '{stock_symbol}' not found."
+        with timing(timer):
+            bars = default_fetcher().fetch(stock.code, start_date(stock))
+        msg = timed_save_bars(stock, bars, timer)
+    except FetchError as e:
+        # A permanent error (unknown symbol, HTTP 404) would fail again
+        if e.transient and self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=settings.SCRAPER_BACKOFF * 2 ** self.request.retries)
+        msg = f"An error occurred: {str(e)}"
+        logging.error(msg)
+    except SoftTimeLimitExceeded:
+        msg = "An error occurred: time limit exceeded"
         logging.error(msg)
     except Exception as e:
         msg = f"An error occurred: {str(e)}"
-        logging.error(msg)
+        logging.exception(msg)
+
+    # Report failures as messages so the chord callback always runs
+    _count_done(job_id)
+    return {'stock_code': stock_code, 'msg': msg, 'timings': timer.durations}
+
+
+def _count_done(job_id):
+    if job_id is not None:
+        ScrapeJob.objects.filter(pk=job_id).update(done=F('done') + 1)
+
+
+@app.task
+def collect_scraping(messages, job_id=None):
+    # Every stock has its new bars now, score the whole market once
+    status = 'failed'
+    try:
+        refresh_screener()
+        status = 'finished'
     finally:
-        driver.quit()  # Close the browser session
+        ScrapeJob.objects.filter(pk=job_id).update(status=status, messages=messages, finished_at=timezone.now())
+    # Then score the new bars ahead of the first request
+    snapshot_signals.delay()
+    return {'messages': messages}
+
+
+@app.task
+def snapshot_chunk(snapshot_id, stock_ids, ruleset_name=None):
+    return snapshots.snapshot_chunk(snapshot_id, stock_ids, get_ruleset(ruleset_name))
+
+
+@app.task
+def finish_snapshot(rows, snapshot_id):
+    snapshots.finish_snapshot(snapshot_id)
+    return {'snapshot': snapshot_id, 'rows': sum(rows)}
+
+
+@app.task
+def snapshot_signals(ruleset_name=None):
+    """Store the scores of the stocks whose bars changed, a chunk of stocks per task."""
+    snapshot, chunks = snapshots.start_snapshot(get_ruleset(ruleset_name))
+    if not chunks:
+        snapshots.finish_snapshot(snapshot.pk)
+        return {'snapshot': snapshot.pk, 'stocks': 0}
+    result = chord(snapshot_chunk.s(snapshot.pk, stock_ids, ruleset_name) for stock_ids in chunks)(
+        finish_snapshot.s(snapshot.pk))
+    return {'snapshot': snapshot.pk, 'chord': result.id, 'stocks': snapshot.stocks}
 
-    return msg
 
 @app.task
-def scraping():
-    stock_codes_query = Stock.objects.values_list('code', flat=True)
-    stock_codes_list = list(stock_codes_query)
+def scraping(job_id=None):
+    """Scrape the stocks of a ``ScrapeJob``; every stock in a new one without ``job_id``."""
+    if job_id is None:
+        job = ScrapeJob.objects.create(codes=list(Stock.objects.order_by('code').values_list('code', flat=True)))
+    else:
+        job = ScrapeJob.objects.get(pk=job_id)
+    ScrapeJob.objects.filter(pk=job.pk).update(status='running')
 
-    messages = []  # Store messages for each stock code
-    for stock_code in stock_codes_list:
-        msg = scrape_stock_data(stock_code)
-        messages.append({'stock_code': stock_code, 'msg': msg})
+    # One task per stock so they spread across workers; the chord callback
+    # gathers the per-stock messages once all of them are done
+    result = chord(scrape_stock.s(code, str(job.pk)) for code in job.codes)(collect_scraping.s(str(job.pk)))
 
-    return {'messages': messages}
\ No newline at end of file
+    return {'job': str(job.pk), 'chord': result.id, 'stocks': len(job.codes)}
@@ -1,3 +1,1050 @@
-from django.test import TestCase
+import asyncio
+import dataclasses
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import urlsplit
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.http import JsonResponse
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from kombu.exceptions import OperationalError
+
+from app import backtest, compute, fuzzy, screener, signal_cache, sweep
+from app.backtest import BacktestParams, run_backtests, simulate
+from app.bar_store import read_bars, verify_bars
+from app.benchmarks import Suite, compare
+from app.indicator_store import update_indicators, verify_indicators
+from app.indicators import IndicatorState, compute_indicators, indicator_columns
+from app.live import forget_states, read_ticks, replay_ticks, score_live
+from app.models import Indicator, Price, Signal, SignalSnapshot, Stock
+from app.scraper import HttpCsvFetcher, save_bars, scrape_stocks
+from app.snapshots import run_snapshot
+from app.sweep import grid_configs, load_results, run_sweep
+from app.tasks import scraping
+from stock_api.celery import app as celery_app
+from app.synthetic import make_ohlcv
+
+
+class VectorizedFuzzyTest(SimpleTestCase):
+    def test_parity_with_skfuzzy(self):
+        df = compute_indicators(make_ohlcv())
+        expected = fuzzy.score_skfuzzy(df.copy())
+        actual = fuzzy.score(df.copy())
+
+        for column in ('Entry_Position', 'Exit_Position'):
+            np.testing.assert_allclose(
+                actual[column].to_numpy(), expected[column].to_numpy(), rtol=0, atol=1e-9)
+
+    def test_zero_area_is_nan(self):
+        entry_position_ctrl, _ = fuzzy.build_control_systems()
+        inputs = {label: np.zeros(1) for label in fuzzy.get_ruleset().inputs('entry_position')}
+        inputs['support_area'] = np.ones(1)
+        output = fuzzy.VectorizedSystem(entry_position_ctrl).compute(inputs)
+        self.assertTrue(np.isnan(output['entry_position'][0]))
+
+    def test_systems_shared_across_threads(self):
+        self.assertIs(fuzzy.get_vectorized_systems(), fuzzy.get_vectorized_systems())
+
+        frames = [compute_indicators(make_ohlcv(60, seed)) for seed in range(4)]
+        expected = [fuzzy.score(df.copy()) for df in frames]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            actual = list(executor.map(lambda df: fuzzy.score_skfuzzy(df.copy()), frames))
+
+        for want, got in zip(expected, actual):
+            np.testing.assert_allclose(
+                got['Entry_Position'].to_numpy(), want['Entry_Position'].to_numpy(), rtol=0, atol=1e-9)
+
+
+class RuleSetTest(SimpleTestCase):
+    def test_versioned_and_compiled_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'custom.json')
+            shutil.copy(os.path.join(settings.FUZZY_RULESETS_DIR, 'default.json'), path)
+            with override_settings(FUZZY_RULESETS_DIR=directory):
+                self.assertEqual(fuzzy.ruleset_names(), ['custom'])
+                ruleset = fuzzy.get_ruleset('custom')
+                self.assertIs(fuzzy.get_ruleset('custom'), ruleset)
+                systems = fuzzy.get_vectorized_systems(ruleset)
+
+                with open(path) as ruleset_file:
+                    definition = json.load(ruleset_file)
+                definition['inputs']['rsi']['terms']['oversold'] = [0, 30, 50]
+                with open(path, 'w') as ruleset_file:
+                    json.dump(definition, ruleset_file)
+                os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+                edited = fuzzy.get_ruleset('custom')
+                self.assertNotEqual(edited.version, ruleset.version)
+                self.assertIsNot(fuzzy.get_vectorized_systems(edited), systems)
+                # Switching back compiles nothing
+                self.assertIs(fuzzy.get_vectorized_systems(ruleset), systems)
+
+                for name in ('missing', '../default'):
+                    with self.assertRaises(ValueError):
+                        fuzzy.get_ruleset(name)
+
+    def test_rules_change_scores(self):
+        df = compute_indicators(make_ohlcv())
+        default = fuzzy.score(df.copy())
+        trend = fuzzy.score(df.copy(), ruleset=fuzzy.get_ruleset('trend'))
+        self.assertIn('Above_EMA_200', fuzzy.get_ruleset('trend').columns)
+        self.assertNotIn('Above_EMA_200', fuzzy.get_ruleset().columns)
+        self.assertFalse(np.allclose(default['Entry_Position'], trend['Entry_Position'], equal_nan=True))
+
+        expected = fuzzy.score_skfuzzy(df.copy(), fuzzy.get_ruleset('trend'))
+        np.testing.assert_allclose(
+            trend['Exit_Position'].to_numpy(), expected['Exit_Position'].to_numpy(), rtol=0, atol=1e-9)
+
+
+class BenchmarkTest(SimpleTestCase):
+    def test_compare_with_baseline(self):
+        suite = Suite(repeat=3)
+        result = suite.measure('indicators[bars=100]', compute_indicators, rows=100, setup=make_ohlcv(100).copy)
+        self.assertEqual(result['repeat'], 3)
+        self.assertLessEqual(result['min'], result['median'])
+
+        document = {'results': {
+            'indicators[bars=100]': {'min': 1.0}, 'fuzzy[lut,bars=100]': {'min': 0.5}, 'api[new]': {'min': 1.0},
+        }}
+        baseline = {'results': {
+            'indicators[bars=100]': {'min': 0.7}, 'fuzzy[lut,bars=100]': {'min': 1.0}, 'ingest[gone]': {'min': 1.0},
+        }}
+        self.assertEqual([row[-1] for row in compare(document, baseline, tolerance=0.25)],
+                         ['regressed', 'improved', 'missing', 'new'])
+        self.assertEqual([row[0] for row in compare(document, baseline, only=['fuzzy'])], ['fuzzy[lut,bars=100]'])
+
+
+class LookupTableTest(SimpleTestCase):
+    def test_exact_on_integer_grid(self):
+        df = compute_indicators(make_ohlcv())
+        df['RSI'] = df['RSI'].round()
+        df['%D'] = df['%D'].round()
+        expected = fuzzy.score(df.copy(), lut_mode='')
+
+        for lut_mode in fuzzy.LookupTable.interpolations:
+            actual = fuzzy.score(df.copy(), lut_mode=lut_mode)
+            for column in ('Entry_Position', 'Exit_Position'):
+                np.testing.assert_allclose(
+                    actual[column].to_numpy(), expected[column].to_numpy(), rtol=0, atol=1e-9)
+
+    def test_unknown_interpolation(self):
+        with self.assertRaises(ValueError):
+            fuzzy.score(compute_indicators(make_ohlcv(60)), lut_mode='cubic')
+
+    def test_single_row_matches_frame(self):
+        df = compute_indicators(make_ohlcv())
+        for lut_mode in ('', *fuzzy.LookupTable.interpolations):
+            expected = fuzzy.score(df.copy(), lut_mode=lut_mode)
+            for row in expected.iloc[[0, 100, 250, -1]].to_dict('records'):
+                self.assertEqual(fuzzy.score_row(row, lut_mode=lut_mode),
+                                 (row['Entry_Position'], row['Exit_Position']))
+
+
+class IndicatorStateTest(SimpleTestCase):
+    def test_matches_compute_indicators(self):
+        df = compute_indicators(make_ohlcv(600))
+        bars = list(df[['Open', 'High', 'Low', 'Close']].itertuples(index=False, name=None))
+
+        state = IndicatorState()
+        rows = [state.update(*bar) for bar in bars[:400]]
+        state = IndicatorState.resume(bars[200:400], rows[-1])
+        rows += [state.update(*bar) for bar in bars[400:]]
+
+        for column in indicator_columns.values():
+            np.testing.assert_allclose(
+                [row[column] for row in rows], df[column].to_numpy(dtype=np.float64),
+                rtol=1e-9, atol=1e-9, err_msg=column)
+
+
+class IndicatorStoreTest(TestCase):
+    def test_incremental_update(self):
+        stock = Stock.objects.create(name='Bank BCA', code='BBCA', sector='Financials')
+        bars = make_ohlcv(300)
+
+        def add(rows):
+            Price.objects.bulk_create(
+                Price(stock=stock, date=row.Date, open=row.Open, high=row.High,
+                      low=row.Low, close=row.Close, volume=row.Volume)
+                for row in rows.itertuples()
+            )
+
+        add(bars[:250])
+        self.assertEqual(update_indicators(stock), 250)
+        add(bars[250:])
+        self.assertEqual(update_indicators(stock), 50)
+        self.assertEqual(update_indicators(stock), 0)
+
+        self.assertEqual(Indicator.objects.filter(stock=stock).count(), 300)
+        self.assertEqual(verify_indicators(stock), [])
+
+        # The stock's row is locked before the stored state is read
+        with CaptureQueriesContext(connection) as queries:
+            update_indicators(stock)
+        statements = [query['sql'] for query in queries.captured_queries if 'SAVEPOINT' not in query['sql']]
+        self.assertTrue(statements[0].startswith('UPDATE "app_stock"'), statements[0])
+
+
+class ApiViewTest(TestCase):
+    def setUp(self):
+        signal_cache.get_cache().clear()
+        self.bars = list(make_ohlcv(320).itertuples(index=False, name=None))
+        self.stock = Stock.objects.create(name='Bank BCA', code='BBCA', sector='Financials')
+        Price.objects.bulk_create(
+            Price(stock=self.stock, date=date, open=open, high=high, low=low, close=close, volume=volume)
+            for date, open, high, low, close, volume in self.bars[:300]
+        )
+
+    def test_scores_every_row(self):
+        response = self.client.get('/api/saham', {'kode': 'bbca'})
+        self.assertEqual(response.status_code, 200)
+        rows = response.json()
+        self.assertEqual(len(rows), 300)
+        self.assertIn('Entry_Position', rows[-1])
+        self.assertIn('Exit_Position', rows[-1])
+
+    @override_settings(JSON_CHUNK_ROWS=64)
+    def test_formats_and_streaming(self):
+        # Streamed when not cached yet
+        streamed = self.client.get('/api/saham', {'kode': 'BBCA', 'stream': 1})
+        self.assertTrue(streamed.streaming)
+        # A sync iterator for a WSGI server, which would buffer an async one
+        self.assertFalse(streamed.is_async)
+        rows = self.client.get('/api/saham', {'kode': 'BBCA'}).json()
+        self.assertEqual(json.loads(b''.join(streamed)), rows)
+
+        columns = self.client.get('/api/saham', {'kode': 'BBCA', 'format': 'columns'}).json()
+        self.assertEqual(list(columns), list(rows[0]))
+        self.assertEqual(columns['Entry_Position'], [row['Entry_Position'] for row in rows])
+        self.assertEqual(self.client.get('/api/saham', {'kode': 'BBCA', 'format': 'csv'}).status_code, 400)
+
+        prices = Price.objects.filter(stock=self.stock).order_by('date')
+        expected = JsonResponse(list(prices.values()), safe=False).content
+        self.assertEqual(self.client.get('/api/saham/BBCA').content, expected)
+        self.assertEqual(b''.join(self.client.get('/api/saham/BBCA', {'stream': 1})), expected)
+        columns = self.client.get('/api/saham/BBCA', {'format': 'columns'}).json()
+        self.assertEqual(columns['close'], [price.close for price in prices])
+
+    def test_range_fields_and_pages(self):
+        full = self.client.get('/api/saham', {'kode': 'BBCA'}).json()
+        date_from, date_to = full[250]['Date'], full[279]['Date']
+        fields = 'Close,RSI,Above_EMA_200,Entry_Position'
+
+        rows, cursor = [], None
+        while True:
+            params = {'kode': 'BBCA', 'from': date_from, 'to': date_to, 'fields': fields, 'limit': 8}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/api/saham', params)
+            rows += response.json()
+            cursor = response.get('X-Next-Cursor')
+            if cursor is None:
+                break
+            self.assertIn('rel="next"', response['Link'])
+
+        # Same values as the full history, warm-up included, with or without the store
+        expected = [{field: row[field] for field in ['Date', *fields.split(',')]} for row in full[250:280]]
+        self.assertEqual(rows, expected)
+        Indicator.objects.all().delete()
+        response = self.client.get('/api/saham', {'kode': 'BBCA', 'from': date_from, 'to': date_to, 'fields': fields})
+        self.assertEqual(response.json(), expected)
+
+        self.assertEqual(self.client.get('/api/saham', {'kode': 'BBCA', 'fields': 'Nope'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/saham', {'kode': 'BBCA', 'from': '2020-13-01'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/saham', {'kode': 'BBCA', 'limit': '0'}).status_code, 400)
+
+        response = self.client.get('/api/saham/BBCA', {'from': date_from, 'limit': 5, 'fields': 'close'})
+        self.assertEqual(response.json(), [{'date': row['Date'], 'close': row['Close']} for row in full[250:255]])
+        response = self.client.get('/api/saham/BBCA', {'cursor': response['X-Next-Cursor'], 'limit': 5})
+        self.assertEqual(response.json()[0]['date'], full[255]['Date'])
+
+    def test_cached_until_bars_change(self):
+        before = signal_cache.counts()
+        first = self.client.get('/api/saham', {'kode': 'BBCA'})
+        second = self.client.get('/api/saham', {'kode': 'BBCA'})
+        after = signal_cache.counts()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(first.content, second.content)
+        self.assertIn('Last-Modified', second)
+
+        response = self.client.get('/api/saham', {'kode': 'BBCA'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # New bars change the key, rewritten bars drop the cached entry
+        save_bars(self.stock, self.bars[300:])
+        response = self.client.get('/api/saham', {'kode': 'BBCA'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 320)
+
+        latest = self.client.get('/api/saham', {'kode': 'BBCA'})
+        date, open, high, low, close, volume = self.bars[-1]
+        save_bars(self.stock, [(date, open, high, low, close * 2, volume)])
+        response = self.client.get('/api/saham', {'kode': 'BBCA'}, HTTP_IF_NONE_MATCH=latest['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[-1]['Close'], close * 2)
+
+        metrics = self.client.get('/metrics').content.decode()
+        self.assertIn(f"signal_cache_hits_total {signal_cache.counts()['hits']}", metrics)
+
+    def test_ruleset_param(self):
+        default = self.client.get('/api/saham', {'kode': 'BBCA'})
+        trend = self.client.get('/api/saham', {'kode': 'BBCA', 'ruleset': 'trend'})
+        self.assertEqual(trend.status_code, 200)
+        self.assertNotEqual(trend['ETag'], default['ETag'])
+        self.assertEqual(self.client.get('/api/saham', {'kode': 'BBCA'}).content, default.content)
+        self.assertEqual(self.client.get('/api/saham', {'kode': 'BBCA', 'ruleset': 'trend'}).content, trend.content)
+        self.assertEqual(self.client.get('/api/saham', {'kode': 'BBCA', 'ruleset': 'nope'}).status_code, 400)
+
+        # Rewritten bars drop the entries of every rule set, even when
+        # written by another process with its own cache
+        date, open, high, low, close, volume = self.bars[-1]
+        with mock.patch('app.signal_cache.get_cache', return_value=caches['default']):
+            save_bars(self.stock, [(date, open, high, low, close * 2, volume)])
+        response = self.client.get('/api/saham', {'kode': 'BBCA', 'ruleset': 'trend'})
+        self.assertEqual(response.json()[-1]['Close'], close * 2)
+
+    def test_server_timing_and_profile(self):
+        response = self.client.get('/api/saham', {'kode': 'BBCA'})
+        stages = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        self.assertEqual(stages, ['cache', 'db', 'frame', 'indicators', 'fuzzy', 'encode', 'total'])
+        response = self.client.get('/api/saham', {'kode': 'BBCA'})
+        self.assertEqual([part.split(';')[0] for part in response['Server-Timing'].split(', ')], ['cache', 'total'])
+
+        metrics = self.client.get('/metrics').content.decode()
+        self.assertIn('request_duration_seconds_count{endpoint="api/saham"}', metrics)
+        self.assertIn('request_stage_duration_seconds_bucket{endpoint="api/saham",stage="fuzzy",le="+Inf"}', metrics)
+
+        # Only staff get the profile
+        self.assertEqual(self.client.get('/api/saham', {'kode': 'BBCA', 'profile': 1})['Content-Type'],
+                         'application/json')
+        staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get('/api/saham', {'kode': 'BBCA', 'profile': 1, 'stream': 1})
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertIn('function calls', response.content.decode())
+
+    def test_batch(self):
+        other = Stock.objects.create(name='Bank BRI', code='BBRI', sector='Financials')
+        save_bars(other, list(make_ohlcv(120, seed=3).itertuples(index=False, name=None)))
+        Stock.objects.create(name='Empty', code='NEW', sector='Financials')
+
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/saham/batch', {'codes': ['bbri', 'BBCA', 'NEW']},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(list(body), ['BBRI', 'BBCA', 'NEW'])
+        for code in ('BBCA', 'BBRI'):
+            self.assertEqual(body[code], self.client.get('/api/saham', {'kode': code}).json())
+        self.assertEqual(body['NEW'], [])
+
+        response = self.client.post('/api/saham/batch?format=columns&from=2000-07-31&fields=Close,RSI&ruleset=trend',
+                                    {'codes': 'BBCA,BBRI'}, content_type='application/json')
+        columns = response.json()['BBCA']
+        self.assertEqual(list(columns), ['Date', 'Close', 'RSI'])
+        self.assertEqual(columns['Date'][0], '2000-07-31')
+
+        self.assertEqual(self.client.get('/api/saham/batch').status_code, 405)
+        for body in ({'codes': ['BBCA', 'NOPE']}, {'codes': []}, {'codes': 5}, 'BBCA'):
+            response = self.client.post('/api/saham/batch', body, content_type='application/json')
+            self.assertEqual(response.status_code, 404 if body == {'codes': ['BBCA', 'NOPE']} else 400)
+
+    async def test_async_views(self):
+        # The fuzzy work runs in the compute pool, concurrent requests get the same rows
+        threads = set()
+
+        def record(*args, **kwargs):
+            threads.add(threading.current_thread().name)
+            return fuzzy.score(*args, **kwargs)
+
+        params = {'kode': 'BBCA', 'from': '2000-07-31', 'fields': 'Close,Entry_Position'}
+        with mock.patch('app.compute.score', side_effect=record):
+            *ranges, stocks = await asyncio.gather(
+                *[self.async_client.get('/api/saham', params) for _ in range(4)],
+                self.async_client.get('/api/saham/all'),
+            )
+        self.assertEqual({response.status_code for response in ranges}, {200})
+        self.assertEqual(len({response.content for response in ranges}), 1)
+        self.assertEqual([stock['code'] for stock in stocks.json()], ['BBCA'])
+        self.assertTrue(threads)
+        self.assertTrue(all(name.startswith('compute') for name in threads), threads)
+
+        streamed = await self.async_client.get('/api/saham', {'kode': 'BBCA', 'stream': 1})
+        self.assertIn('Server-Timing', streamed)
+        self.assertTrue(streamed.is_async)
+        rows = json.loads(b''.join([chunk async for chunk in streamed.streaming_content]))
+        self.assertEqual(len(rows), 300)
+
+    def test_compute_pool_and_limits(self):
+        params = {'kode': 'BBCA', 'from': '2000-07-31'}
+        expected = self.client.get('/api/saham', params).content
+        try:
+            with self.settings(COMPUTE_PROCESSES=1):
+                response = self.client.get('/api/saham', params)
+        finally:
+            compute.shutdown_pool()
+        self.assertEqual(response.content, expected)
+        self.assertIn('pool;dur=', response['Server-Timing'])
+
+        rejected = compute.metric_lines()
+        with self.settings(COMPUTE_QUEUE_LIMIT=0):
+            response = self.client.get('/api/saham', params)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        with self.settings(COMPUTE_TIMEOUT=0):
+            self.assertEqual(self.client.get('/api/saham', params).status_code, 504)
+
+        metrics = self.client.get('/metrics').content.decode()
+        self.assertIn('compute_queue_depth ', metrics)
+        self.assertNotIn(next(line for line in rejected if line.startswith('compute_rejected_total')), metrics)
+
+    def test_snapshot(self):
+        expected = self.client.get('/api/saham', {'kode': 'BBCA'}).content
+        snapshot = run_snapshot()
+        self.assertEqual((snapshot.stocks, snapshot.rows), (1, 300))
+        self.assertIsNotNone(snapshot.completed_at)
+        # Nothing changed, so nothing to score
+        snapshot = run_snapshot()
+        self.assertEqual((snapshot.stocks, snapshot.rows), (0, 0))
+
+        # Served from the snapshot, nothing scored
+        signal_cache.get_cache().clear()
+        with mock.patch('app.compute.score', side_effect=AssertionError):
+            self.assertEqual(self.client.get('/api/saham', {'kode': 'BBCA'}).content, expected)
+            response = self.client.get('/api/saham', {'kode': 'BBCA', 'from': '2000-07-31', 'fields': 'Entry_Position'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'signal_snapshot_version{{ruleset="{snapshot.ruleset}"}} {snapshot.pk}',
+                      self.client.get('/metrics').content.decode())
+
+        # New bars are scored on their own, rewritten ones drop the stock's scores
+        save_bars(self.stock, self.bars[300:])
+        self.assertEqual(run_snapshot().rows, 20)
+        date, open, high, low, close, volume = self.bars[-1]
+        save_bars(self.stock, [(date, open, high, low, close * 2, volume)])
+        self.assertEqual(run_snapshot().rows, 320)
+        signal_cache.get_cache().clear()
+        expected = self.client.get('/api/saham', {'kode': 'BBCA', 'ruleset': 'trend'}).content
+        Signal.objects.filter(date=date).update(entry_position=-1)
+        self.assertEqual(self.client.get('/api/saham', {'kode': 'BBCA'}).json()[-1]['Entry_Position'], -1)
+        self.assertEqual(self.client.get('/api/saham', {'kode': 'BBCA', 'ruleset': 'trend'}).content, expected)
+
+
+class ScreenerTest(TestCase):
+    def setUp(self):
+        signal_cache.get_cache().clear()
+        for code, sector, seed in (('BBCA', 'Financials', 1), ('BBRI', 'Financials', 2), ('TLKM', 'Telco', 3)):
+            stock = Stock.objects.create(name=code, code=code, sector=sector)
+            save_bars(stock, list(make_ohlcv(260, seed=seed).itertuples(index=False, name=None)))
+        Stock.objects.create(name='Empty', code='NONE', sector='Telco')
+
+    def test_latest_scores_of_every_stock(self):
+        response = self.client.get('/api/saham/screener')
+        self.assertEqual(response.status_code, 200)
+        stocks = response.json()['stocks']
+        self.assertEqual(len(stocks), 3)
+        entries = [stock['Entry_Position'] for stock in stocks]
+        self.assertEqual(entries, sorted(entries, reverse=True))
+
+        for stock in stocks:
+            last = self.client.get('/api/saham', {'kode': stock['code']}).json()[-1]
+            self.assertEqual(stock['Date'], last['Date'])
+            self.assertEqual(stock['Close'], last['Close'])
+            self.assertAlmostEqual(stock['Entry_Position'], last['Entry_Position'])
+            self.assertAlmostEqual(stock['Exit_Position'], last['Exit_Position'])
+
+    def test_stock_listing(self):
+        # The figures of every stock come from one query, however many there are
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/saham/all', {'sort': '-change'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Total-Count'], '4')
+        stocks = response.json()
+        self.assertEqual(stocks[-1]['code'], 'NONE')
+        self.assertIsNone(stocks[-1]['close'])
+        changes = [stock['change'] for stock in stocks[:-1]]
+        self.assertEqual(changes, sorted(changes, reverse=True))
+
+        stocks = {stock['code']: stock for stock in self.client.get('/api/saham/all').json()}
+        for code, seed in (('BBCA', 1), ('BBRI', 2), ('TLKM', 3)):
+            stock, bars = stocks[code], make_ohlcv(260, seed=seed)
+            year = bars[bars['Date'] > bars['Date'].iloc[-1] - timedelta(weeks=52)]
+            self.assertEqual(stock['last_date'], bars['Date'].iloc[-1].isoformat())
+            self.assertEqual(stock['close'], bars['Close'].iloc[-1])
+            self.assertEqual(stock['volume'], bars['Volume'].iloc[-1])
+            self.assertAlmostEqual(stock['change'], (bars['Close'].iloc[-1] / bars['Close'].iloc[-2] - 1) * 100)
+            self.assertEqual(stock['high_52w'], year['High'].max())
+            self.assertEqual(stock['low_52w'], year['Low'].min())
+
+        response = self.client.get('/api/saham/all', {'limit': 3, 'offset': 1})
+        self.assertEqual([stock['code'] for stock in response.json()], ['BBRI', 'NONE', 'TLKM'])
+        self.assertNotIn('Link', response)
+        response = self.client.get('/api/saham/all', {'limit': 2})
+        self.assertIn('offset=2', response['Link'])
+        self.assertEqual(self.client.get('/api/saham/all', {'sort': 'Entry_Position'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/saham/all', {'limit': '-1'}).status_code, 400)
+
+        # Delisted before the market's last bar: no 52-week figures from a window that isn't its own
+        stock = Stock.objects.create(name='Delisted', code='DLST', sector='Telco')
+        save_bars(stock, list(make_ohlcv(200, seed=4).itertuples(index=False, name=None)))
+        stocks = {stock['code']: stock for stock in self.client.get('/api/saham/all').json()}
+        self.assertIsNotNone(stocks['DLST']['close'])
+        self.assertIsNone(stocks['DLST']['high_52w'])
+        self.assertIsNone(stocks['DLST']['low_52w'])
+        self.assertIsNotNone(stocks['BBCA']['high_52w'])
+
+    def test_filter_and_sort(self):
+        stocks = self.client.get('/api/saham/screener', {'sector': 'financials', 'sort': 'code'}).json()['stocks']
+        self.assertEqual([stock['code'] for stock in stocks], ['BBCA', 'BBRI'])
+
+        low = min(stock['Exit_Position'] for stock in stocks)
+        stocks = self.client.get('/api/saham/screener', {'min_exit': low + 1e-9}).json()['stocks']
+        self.assertTrue(all(stock['Exit_Position'] > low for stock in stocks))
+
+        self.assertEqual(self.client.get('/api/saham/screener', {'sort': 'volume'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/saham/screener', {'min_entry': 'x'}).status_code, 400)
+
+    def test_stored_signals_and_ruleset(self):
+        # A snapshot's scores are read back, only the bars it doesn't cover are scored
+        run_snapshot()
+        stock = Stock.objects.get(code='BBCA')
+        last_date = Price.objects.filter(stock=stock).latest('date').date
+        Signal.objects.filter(stock=stock, date=last_date).update(entry_position=-1)
+        bars = list(make_ohlcv(261, seed=3).itertuples(index=False, name=None))
+        save_bars(Stock.objects.get(code='TLKM'), bars[260:])
+        with mock.patch('app.screener.score', wraps=screener.score) as score:
+            stocks = {stock['code']: stock for stock in self.client.get('/api/saham/screener').json()['stocks']}
+        self.assertEqual(len(score.call_args.args[0]), 1)
+        self.assertEqual(stocks['BBCA']['Entry_Position'], -1)
+        last = self.client.get('/api/saham', {'kode': 'TLKM'}).json()[-1]
+        self.assertEqual(stocks['TLKM']['Date'], last['Date'])
+        self.assertAlmostEqual(stocks['TLKM']['Entry_Position'], last['Entry_Position'])
+
+        stocks = self.client.get('/api/saham/screener', {'ruleset': 'trend', 'sort': 'code'}).json()['stocks']
+        last = self.client.get('/api/saham', {'kode': 'BBCA', 'ruleset': 'trend'}).json()[-1]
+        self.assertAlmostEqual(stocks[0]['Entry_Position'], last['Entry_Position'])
+        self.assertAlmostEqual(stocks[0]['Exit_Position'], last['Exit_Position'])
+        self.assertEqual(self.client.get('/api/saham/screener', {'ruleset': 'nope'}).status_code, 400)
+
+    def test_new_bars_invalidate(self):
+        self.client.get('/api/saham/screener')
+        stock = Stock.objects.get(code='TLKM')
+        date = Price.objects.filter(stock=stock).latest('date').date
+        # Written by a Celery worker, whose cache isn't this process's
+        with mock.patch('app.signal_cache.get_cache', return_value=caches['default']):
+            save_bars(stock, [(date + timedelta(days=1), 100., 110., 90., 105., 1000)])
+
+        stocks = self.client.get('/api/saham/screener', {'sort': 'code'}).json()['stocks']
+        self.assertEqual(stocks[-1]['Date'], (date + timedelta(days=1)).isoformat())
+        self.assertEqual(stocks[-1]['Close'], 105.)
+
+
+class LiveTest(TestCase):
+    def setUp(self):
+        forget_states()
+        self.bars = make_ohlcv(301)
+        self.stock = Stock.objects.create(name='Bank BCA', code='BBCA', sector='Financials')
+        Price.objects.bulk_create(
+            Price(stock=self.stock, date=row.Date, open=row.Open, high=row.High, low=row.Low,
+                  close=row.Close, volume=row.Volume)
+            for row in self.bars[:300].itertuples()
+        )
+
+    def expected(self, open, high, low, close):
+        # The provisional bar scored the slow way: the whole history recomputed
+        df = self.bars[:301].copy()
+        df.loc[300, ['Open', 'High', 'Low', 'Close']] = [open, high, low, close]
+        return fuzzy.score(compute_indicators(df)).iloc[-1]
+
+    def test_replay_tick_file(self):
+        today = self.bars['Date'].iloc[300]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ticks.csv')
+            prices = [1000, 1012, 995, 1030, 1021, 990, 1008]
+            pd.DataFrame({'time': [f'09:0{number}' for number in range(len(prices))], 'price': prices,
+                          'volume': 100}).to_csv(path, index=False)
+            ticks = read_ticks(path)
+
+        rows = list(replay_ticks(self.stock, ticks, today))
+        self.assertEqual([time for time, _ in rows], [time for time, _, _ in ticks])
+        for number, (_, row) in enumerate(rows):
+            seen = prices[:number + 1]
+            expected = self.expected(seen[0], max(seen), min(seen), seen[-1])
+            for column in [*indicator_columns.values(), 'Entry_Position', 'Exit_Position']:
+                np.testing.assert_allclose(row[column], expected[column], rtol=1e-9, err_msg=column)
+            self.assertEqual(row['Volume'], 100 * (number + 1))
+
+        # Nothing stored, and the same ticks score the same again
+        self.assertEqual(Price.objects.filter(stock=self.stock).count(), 300)
+        again = list(replay_ticks(self.stock, ticks, today))
+        self.assertEqual([row['Entry_Position'] for _, row in again], [row['Entry_Position'] for _, row in rows])
+
+    def test_live_endpoint(self):
+        bar = self.bars.iloc[300]
+        body = {'open': bar.Open, 'high': bar.High, 'low': bar.Low, 'close': bar.Close,
+                'volume': 1500, 'date': bar.Date.isoformat()}
+        response = self.client.post('/api/saham/bbca/live', body, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        row = response.json()
+        expected = self.expected(bar.Open, bar.High, bar.Low, bar.Close)
+        self.assertEqual(row['Date'], bar.Date.isoformat())
+        self.assertAlmostEqual(row['Entry_Position'], expected['Entry_Position'])
+        self.assertAlmostEqual(row['Exit_Position'], expected['Exit_Position'])
+        self.assertAlmostEqual(row['RSI'], expected['RSI'])
+
+        # A new stored bar moves the state forward
+        Price.objects.create(stock=self.stock, date=bar.Date, open=bar.Open, high=bar.High, low=bar.Low,
+                             close=bar.Close, volume=bar.Volume)
+        response = self.client.post('/api/saham/BBCA/live', body, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        body['date'] = (bar.Date + timedelta(days=1)).isoformat()
+        self.assertEqual(self.client.post('/api/saham/BBCA/live', body, content_type='application/json').status_code, 200)
+
+        self.assertEqual(self.client.get('/api/saham/BBCA/live').status_code, 405)
+        self.assertEqual(self.client.post('/api/saham/XXXX/live', body, content_type='application/json').status_code, 404)
+        for invalid in ({**body, 'close': 'x'}, {**body, 'low': bar.High + 1}, {**body, 'date': 'today'}, [1]):
+            response = self.client.post('/api/saham/BBCA/live', invalid, content_type='application/json')
+            self.assertEqual(response.status_code, 400, invalid)
+
+    def test_rewritten_bar(self):
+        bar = self.bars.iloc[300]
+        prices = {'open': bar.Open, 'high': bar.High, 'low': bar.Low, 'close': bar.Close}
+        score_live(self.stock, prices)
+
+        # The last stored bar rewritten in place: same last date, new state
+        date, open, high, low, close, volume = self.bars.iloc[299]
+        save_bars(self.stock, [(date, open, high * 1.2, low, close * 1.2, volume)])
+        self.bars.loc[299, ['High', 'Close']] = [high * 1.2, close * 1.2]
+        row = score_live(self.stock, prices)
+        expected = self.expected(bar.Open, bar.High, bar.Low, bar.Close)
+        for column in ['RSI', 'Entry_Position', 'Exit_Position']:
+            self.assertAlmostEqual(row[column], expected[column], msg=column)
+
+
+class BacktestTest(TestCase):
+    def test_simulate(self):
+        params = BacktestParams(entry=60, exit=60, capital=1_000_000, lot_size=100, buy_fee=0.001, sell_fee=0.002)
+        dates = list(range(6))
+        open_prices = np.array([100., 100., 110., 120., 130., 125.])
+        close_prices = np.array([100., 105., 115., 125., 128., 125.])
+        entry = np.array([np.nan, 70., 10., 10., 10., 10.])
+        exit = np.array([np.nan, 10., 10., 70., 10., 10.])
+
+        result = simulate(dates, open_prices, close_prices, entry, exit, params)
+
+        # Signals on the close of bars 1 and 3, filled at the opens of bars 2 and 4
+        shares = 9000  # 90 lots of 100 at 110 plus fees fit in 1,000,000
+        cost = shares * 110 * 1.001
+        proceeds = shares * 130 * 0.998
+        self.assertEqual(result['trades'], [{
+            'entry_date': 2, 'entry_price': 110., 'shares': shares,
+            'exit_date': 4, 'exit_price': 130., 'pnl': proceeds - cost, 'return': proceeds / cost - 1,
+        }])
+        np.testing.assert_allclose(result['equity'], [
+            1e6, 1e6, 1e6 - cost + shares * 115, 1e6 - cost + shares * 125,
+            1e6 - cost + proceeds, 1e6 - cost + proceeds,
+        ])
+        self.assertEqual(result['summary']['win_rate'], 1.)
+        self.assertEqual(result['summary']['exposure'], 2 / 6)
+        self.assertEqual(result['drawdown'][1], 0.)
+
+        # Less cash than one lot: the entry is skipped, nothing was held
+        params = dataclasses.replace(params, capital=10_000)
+        result = simulate(dates, open_prices, close_prices, entry, exit, params)
+        self.assertEqual(result['trades'], [])
+        self.assertEqual(result['summary']['exposure'], 0.)
+        np.testing.assert_allclose(result['equity'], 10_000)
+
+    @override_settings(BACKTEST_WORKERS=2)
+    def test_endpoint(self):
+        self.addCleanup(backtest.shutdown_pools)
+        for code, seed in (('BBCA', 1), ('BBRI', 2)):
+            stock = Stock.objects.create(name=code, code=code, sector='Financials')
+            save_bars(stock, list(make_ohlcv(400, seed=seed).itertuples(index=False, name=None)))
+
+        response = self.client.get('/api/saham/backtest', {'codes': 'bbca,BBRI', 'entry': 55, 'exit': 50})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['params']['entry'], 55.)
+        self.assertEqual(body['params']['lot_size'], 100)
+        for code in ('BBCA', 'BBRI'):
+            result = body['results'][code]
+            self.assertEqual(len(result['equity']['Equity']), 400)
+            self.assertLessEqual(max(result['equity']['Drawdown']), 0.)
+            self.assertTrue(all(trade['shares'] % 100 == 0 for trade in result['trades']))
+        self.assertEqual(run_backtests(Stock.objects.filter(code='BBCA'), BacktestParams.defaults(entry=55, exit=50),
+                                       workers=1)['BBCA']['summary'], body['results']['BBCA']['summary'])
+        # The workers are spawned once and kept for the next backtest
+        pool = backtest._pools[2]
+        self.assertEqual(pool._mp_context.get_start_method(), 'spawn')
+        self.assertEqual(self.client.get('/api/saham/backtest', {'codes': 'BBCA,BBRI'}).status_code, 200)
+        self.assertIs(backtest._pools[2], pool)
+        with self.settings(COMPUTE_QUEUE_LIMIT=0):
+            self.assertEqual(self.client.get('/api/saham/backtest', {'codes': 'BBCA'}).status_code, 503)
+
+        self.assertEqual(self.client.get('/api/saham/backtest', {'codes': 'NONE'}).status_code, 404)
+        for invalid in ({'lot_size': 'x'}, {'lot_size': 0}, {'entry': 'nan'}, {'exit': 150}, {'capital': -5},
+                        {'capital': 'inf'}, {'buy_fee': 1}):
+            response = self.client.get('/api/saham/backtest', {'codes': 'BBCA', **invalid})
+            self.assertEqual(response.status_code, 400, invalid)
+        with self.assertRaises(ValueError):
+            BacktestParams.defaults(sell_fee=-0.1)
+
+
+class SweepTest(TestCase):
+    def test_resume_and_defaults(self):
+        for code, seed in (('BBCA', 1), ('BBRI', 2)):
+            stock = Stock.objects.create(name=code, code=code, sector='Financials')
+            save_bars(stock, list(make_ohlcv(300, seed=seed).itertuples(index=False, name=None)))
+        stocks = list(Stock.objects.all())
+        configs = grid_configs({'macd': [(12, 26, 9), (8, 21, 5)], 'rsi.oversold': [[0, 20, 45], [0, 25, 40]]})
+        self.assertEqual(len(configs), 4)
+        with self.assertRaises(ValueError):
+            grid_configs({'rsi.unknown': [[0, 1, 2]]})
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'sweep.jsonl')
+            first = run_sweep(stocks, configs[:2], output, workers=2)
+            with open(output, 'a') as results_file:
+                results_file.write('{"config": {"rsi"')  # interrupted mid-write
+            with mock.patch('app.sweep._evaluate', wraps=sweep._evaluate) as evaluate:
+                results = run_sweep(stocks, configs, output, workers=1)
+            self.assertEqual(sum(len(call.args[1]) for call in evaluate.call_args_list), 2)
+            self.assertEqual(len(load_results(output)), 4)
+
+            # Other stocks or backtest parameters are another run, nothing is reused
+            with mock.patch('app.sweep._evaluate', wraps=sweep._evaluate) as evaluate:
+                run_sweep(stocks[:1], configs[:1], output, workers=1)
+                run_sweep(stocks, configs[:1], output, workers=1,
+                          params=BacktestParams.defaults(capital=1_000_000))
+            self.assertEqual(sum(len(call.args[1]) for call in evaluate.call_args_list), 2)
+            self.assertEqual(len(load_results(output, results[0]['run'])), 4)
+
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result in results for result in first))
+        default = next(result for result in results
+                       if result['config'] == {'macd': [12, 26, 9], 'rsi.oversold': [0, 20, 45]})
+        summaries = run_backtests(stocks, workers=1)
+        self.assertAlmostEqual(default['metrics']['mean_return'],
+                               np.mean([summary['summary']['total_return'] for summary in summaries.values()]))
+
+
+class BarStoreTest(TestCase):
+    def setUp(self):
+        signal_cache.get_cache().clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.enterContext(override_settings(BAR_STORE_DIR=directory))
+        self.bars = list(make_ohlcv(260).itertuples(index=False, name=None))
+        self.stock = Stock.objects.create(name='BBCA', code='BBCA', sector='Financials')
+
+    def test_appended_by_writes(self):
+        save_bars(self.stock, self.bars[:250])
+        save_bars(self.stock, self.bars[250:])
+        self.assertEqual(len(read_bars(self.stock)['close']), 260)
+        self.assertEqual(verify_bars(self.stock), [])
+
+        with_store = self.client.get('/api/saham', {'kode': 'BBCA'}).content
+        signal_cache.get_cache().clear()
+        with self.settings(BAR_STORE_DIR=None):
+            self.assertEqual(self.client.get('/api/saham', {'kode': 'BBCA'}).content, with_store)
+
+        # Rewritten bars rebuild the store
+        date, open, high, low, close, volume = self.bars[100]
+        save_bars(self.stock, [(date, open, high, low, close + 1, volume)])
+        self.assertEqual(verify_bars(self.stock), [])
+
+    def test_verify_and_rebuild(self):
+        save_bars(self.stock, self.bars)
+        Price.objects.filter(stock=self.stock, date=self.bars[5][0]).update(close=1.)
+        self.assertEqual(verify_bars(self.stock), [(self.bars[5][0], 'close')])
+        with self.assertRaises(CommandError):
+            call_command('rebuild_bar_store', '--verify', stdout=io.StringIO())
+
+        call_command('rebuild_bar_store', 'bbca', stdout=io.StringIO())
+        self.assertEqual(verify_bars(self.stock), [])
+
+
+@override_settings(EXPORT_CHUNK_ROWS=100)
+class ExportTest(TestCase):
+    def setUp(self):
+        signal_cache.get_cache().clear()
+        for code, seed in (('BBCA', 1), ('BBRI', 2)):
+            stock = Stock.objects.create(name=code, code=code, sector='Financials')
+            save_bars(stock, list(make_ohlcv(250, seed=seed).itertuples(index=False, name=None)))
+
+    def test_arrow_stream(self):
+        response = self.client.get('/api/saham/export', {'codes': 'bbri,bbca', 'signals': 1})
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.arrow.stream')
+        df = pa.ipc.open_stream(response.getvalue()).read_pandas()
+
+        self.assertEqual(len(df), 500)
+        self.assertEqual(df['Code'].astype(str).tolist(), ['BBCA'] * 250 + ['BBRI'] * 250)
+        self.assertEqual(df['Volume'].dtype, np.int64)
+        rows = self.client.get('/api/saham', {'kode': 'BBRI'}).json()
+        np.testing.assert_allclose(df['Entry_Position'][250:], [row['Entry_Position'] for row in rows])
+
+    async def test_asgi_stream(self):
+        # An async iterator under ASGI, which would buffer a sync one
+        response = await self.async_client.get('/api/saham/export', {'codes': 'BBCA'})
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(pa.ipc.open_stream(content).read_all()), 250)
+
+    def test_parquet_with_stale_store(self):
+        Indicator.objects.filter(stock__code='BBCA', date__gt=make_ohlcv(250)['Date'][200]).delete()
+        response = self.client.get('/api/saham/export', {'codes': 'BBCA', 'format': 'parquet', 'signals': 1})
+        df = pq.read_table(io.BytesIO(response.getvalue())).to_pandas()
+
+        expected = compute_indicators(make_ohlcv(250, seed=1))
+        np.testing.assert_allclose(df['RSI'], expected['RSI'])
+        self.assertEqual(self.client.get('/api/saham/export', {'codes': 'NONE'}).status_code, 404)
+        self.assertEqual(self.client.get('/api/saham/export', {'format': 'csv'}).status_code, 400)
+
+
+@override_settings(CSV_INGEST_CHUNK_SIZE=1000, CSV_INGEST_BATCH_SIZE=250)
+class UploadCsvTest(TestCase):
+    def upload(self, content, code='BBCA'):
+        csv_file = SimpleUploadedFile('bars.csv', content.encode(), content_type='text/csv')
+        return self.client.post('/api/create', {'csv_file': csv_file, 'name': 'Bank BCA', 'code': code, 'sector': 'Financials'})
+
+    def test_bulk_load(self):
+        bars = make_ohlcv(2500)
+        response = self.upload(bars.to_csv(index=False))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['rows'], 2500)
+        self.assertEqual(len(response.json()['chunks']), 3)
+        stock = Stock.objects.get(code='BBCA')
+        prices = Price.objects.filter(stock=stock).order_by('date')
+        self.assertEqual(prices.count(), 2500)
+        self.assertEqual(prices.last().low, bars['Low'].iloc[-1])
+        self.assertEqual(Indicator.objects.filter(stock=stock).count(), 2500)
+
+    def test_repeated_dates_are_upserted(self):
+        bars = make_ohlcv(2500)
+        # Repeat rows of the first two chunks at the end of the file
+        repeated = bars.iloc[[5, 1200, 10]].assign(Close=1.)
+        response = self.upload(pd.concat([bars, repeated]).to_csv(index=False))
+
+        self.assertEqual(response.status_code, 201)
+        prices = Price.objects.filter(stock__code='BBCA')
+        self.assertEqual(prices.count(), 2500)
+        self.assertEqual(prices.get(date=bars['Date'].iloc[1200]).close, 1.)
+
+    def test_upload_twice(self):
+        content = make_ohlcv(300).to_csv(index=False)
+        self.assertEqual(self.upload(content, code='bbca').status_code, 201)
+        self.assertEqual(self.upload(content).status_code, 201)
+
+        stock = Stock.objects.get()
+        self.assertEqual(stock.code, 'BBCA')
+        self.assertEqual(Price.objects.count(), 300)
+        self.assertEqual(Indicator.objects.filter(stock=stock).count(), 300)
+
+    def test_invalid_rows_roll_back(self):
+        bars = make_ohlcv(2500).astype({'Close': object, 'Volume': object})
+        bars.loc[10, 'Close'] = 'null'
+        bars.loc[1500, 'Volume'] = -5
+        response = self.upload(bars.to_csv(index=False))
+
+        self.assertEqual(response.status_code, 400)
+        chunks = response.json()['chunks']
+        self.assertEqual(chunks[0]['errors'], [{'line': 12, 'column': 'Close', 'error': 'not a number'}])
+        self.assertEqual(chunks[1]['errors'], [{'line': 1502, 'column': 'Volume', 'error': 'not a positive integer'}])
+        self.assertEqual(chunks[2]['error_count'], 0)
+        self.assertFalse(Stock.objects.exists())
+        self.assertFalse(Price.objects.exists())
+
+    def test_missing_column(self):
+        response = self.upload(make_ohlcv(10).drop(columns='Low').to_csv(index=False))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['chunks'][0]['errors'][0]['column'], 'Low')
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serves ``make_ohlcv`` bars as Yahoo Finance CSV; ``FLKY`` fails once first."""
+
+    failures = {'FLKY.JK': 1}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        symbol = urlsplit(self.path).path.rsplit('/', 1)[-1]
+        with self.lock:
+            failing = self.failures.get(symbol, 0) > 0
+            if failing:
+                self.failures[symbol] -= 1
+        if failing:
+            self.send_response(503)
+            self.end_headers()
+            return
+        if symbol == 'GONE.JK':
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body = make_ohlcv(300, seed=len(symbol)).to_csv(index=False).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ScraperTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = 'http://127.0.0.1:%d/v7/finance/download/{symbol}?period1={period1}&period2={period2}' % cls.server.server_port
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    @contextmanager
+    def eager_celery(self):
+        # Run eagerly with an in-memory broker and result backend. The environment
+        # variables win over the settings, see celery.app.utils.Settings.
+        conf = {'CELERY_TASK_ALWAYS_EAGER': True, 'CELERY_TASK_STORE_EAGER_RESULT': True}
+        previous = {key: celery_app.conf.get(key) for key in conf}
+        celery_app.conf.update(conf)
+        try:
+            with mock.patch.dict(os.environ, {'CELERY_BROKER_URL': 'memory://', 'CELERY_RESULT_BACKEND': 'cache+memory://'}), \
+                    self.settings(SCRAPER_FETCHERS=['http'], SCRAPER_CSV_URL=self.url, SCRAPER_BACKOFF=0.01):
+                vars(celery_app._local).pop('backend', None)
+                yield
+        finally:
+            celery_app.conf.update(previous)
+            vars(celery_app._local).pop('backend', None)
+
+    def test_concurrent_scrape(self):
+        for code in ('BBCA', 'BBRI', 'FLKY', 'GONE'):
+            Stock.objects.create(name=code, code=code, sector='Financials')
+        bbca = Stock.objects.get(code='BBCA')
+        bars = make_ohlcv(300, seed=len("BBCA.JK"))
+        Price.objects.bulk_create(
+            Price(stock=bbca, date=row.Date, open=row.Open, high=row.High,
+                  low=row.Low, close=row.Close, volume=row.Volume)
+            for row in bars[:280].itertuples()
+        )
+
+        fetcher = HttpCsvFetcher(url=self.url, retries=2, backoff=0.01, rate=100)
+        messages = scrape_stocks(['BBCA', 'BBRI', 'FLKY', 'GONE', 'NONE'], fetcher=fetcher, concurrency=4)
+
+        self.assertEqual([m['stock_code'] for m in messages], ['BBCA', 'BBRI', 'FLKY', 'GONE', 'NONE'])
+        self.assertEqual(messages[0]['msg'], 'Saved 20 new bars')
+        self.assertEqual(messages[1]['msg'], 'Saved 300 new bars')
+        self.assertEqual(messages[2]['msg'], 'Saved 300 new bars')
+        self.assertIn('HTTP 404', messages[3]['msg'])
+        self.assertIn('not found', messages[4]['msg'])
+        self.assertEqual(set(messages[1]['timings']), {'fetch', 'parse', 'write'})
+        self.assertEqual(Price.objects.filter(stock=bbca).count(), 300)
+        self.assertEqual(Indicator.objects.filter(stock=bbca).count(), 300)
+
+        messages = scrape_stocks(['BBCA'], fetcher=fetcher)
+        self.assertEqual(messages[0]['msg'], 'Data sudah paling baru')
+
+    def test_save_bars_is_idempotent(self):
+        stock = Stock.objects.create(name='BBCA', code='BBCA', sector='Financials')
+        bars = list(make_ohlcv(250).itertuples(index=False, name=None))
+
+        self.assertEqual(save_bars(stock, bars[:240]), 'Saved 240 new bars')
+        # A re-run overlapping the stored range overwrites instead of duplicating
+        revised = bars[230:239] + [(bars[239][0], 1., 1., 1., 1., 1)] + bars[240:]
+        self.assertEqual(save_bars(stock, revised), 'Saved 10 new bars, rewrote 10')
+        self.assertEqual(Price.objects.filter(stock=stock).count(), 250)
+        self.assertEqual(Price.objects.get(stock=stock, date=bars[239][0]).close, 1.)
+        self.assertEqual(verify_indicators(stock), [])
+
+        with self.assertRaises(IntegrityError):
+            Price.objects.create(stock=stock, date=bars[0][0], open=1, high=1, low=1, close=1, volume=1)
+
+    def test_celery_fan_out(self):
+        for code in ('BBCA', 'FLKY', 'GONE'):
+            Stock.objects.create(name=code, code=code, sector='Financials')
+        FixtureHandler.failures['FLKY.JK'] = 1
+
+        with self.eager_celery():
+            result = scraping.delay().get()
+            messages = celery_app.AsyncResult(result['chord']).get()['messages']
+
+        self.assertEqual(result['stocks'], 3)
+        self.assertEqual({m['stock_code']: m['msg'] for m in messages}, {
+            'BBCA': 'Saved 300 new bars',
+            'FLKY': 'Saved 300 new bars',
+            'GONE': 'An error occurred: HTTP 404 for GONE',
+        })
+
+    def test_failures_reach_the_callback(self):
+        for code in ('BBCA', 'GONE'):
+            Stock.objects.create(name=code, code=code, sector='Financials')
+        fetch = mock.patch.object(HttpCsvFetcher, 'fetch', autospec=True, side_effect=HttpCsvFetcher.fetch)
+        with self.eager_celery(), fetch as fetched, \
+                mock.patch('app.tasks.timed_save_bars', side_effect=RuntimeError('database is locked')):
+            response = self.client.get('/api/scraping')
+
+        job = self.client.get(response.json()['status_url']).json()
+        self.assertEqual((job['status'], job['done']), ('finished', 2))
+        self.assertEqual({m['stock_code']: m['msg'] for m in job['messages']}, {
+            'BBCA': 'An error occurred: database is locked',
+            'GONE': 'An error occurred: HTTP 404 for GONE',
+        })
+        # The 404 isn't retried
+        self.assertEqual(fetched.call_count, 2)
+
+    def write_count(self):
+        for line in self.client.get('/metrics').content.decode().splitlines():
+            if line.startswith('scraper_stage_duration_seconds_count{stage="write"}'):
+                return int(line.split()[-1])
+        return 0
+
+    def test_scraping_jobs(self):
+        Stock.objects.create(name='BBCA', code='BBCA', sector='Financials')
+        written = self.write_count()
+        with self.eager_celery():
+            response = self.client.get('/api/scraping/bbca')
+        self.assertEqual(response.status_code, 202)
+        # The worker's timings reach /metrics through the job
+        self.assertEqual(self.write_count(), written + 1)
+
+        job = self.client.get(response.json()['status_url']).json()
+        self.assertEqual((job['status'], job['stocks'], job['done']), ('finished', 1, 1))
+        self.assertEqual([(m['stock_code'], m['msg']) for m in job['messages']], [('BBCA', 'Saved 300 new bars')])
+        self.assertIsNotNone(job['finished_at'])
+        # Followed by a snapshot of the new bars' scores
+        snapshot = SignalSnapshot.objects.get()
+        self.assertEqual((snapshot.stocks, snapshot.rows), (1, 300))
+        self.assertIsNotNone(snapshot.completed_at)
+
+        self.assertEqual(self.client.get('/api/scraping/NONE').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/scraping/jobs/{uuid.uuid4()}').status_code, 404)
+        with mock.patch.object(scraping, 'delay', side_effect=OperationalError('no broker')):
+            response = self.client.get('/api/scraping')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.client.get(f"/api/scraping/jobs/{response.json()['job']}").json()['status'], 'failed')
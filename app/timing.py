@@ -0,0 +1,102 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Histograms exposed at /metrics: name -> (help, label names)
+histogram_help = {
+    'request_duration_seconds': ('Time spent in each endpoint.', ('endpoint',)),
+    'request_stage_duration_seconds': ('Time spent in each stage of an endpoint.', ('endpoint', 'stage')),
+    'scraper_stage_duration_seconds': ('Time spent fetching, parsing and writing the bars of one stock.', ('stage',)),
+}
+
+
+class Timer:
+    """Durations of the named stages of one request or scraped stock, in seconds."""
+
+    def __init__(self):
+        self.durations = {}
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.) + seconds
+
+    def server_timing(self):
+        """The ``Server-Timing`` header value, in milliseconds."""
+        return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.durations.items())
+
+    def observe(self, metric, **labels):
+        """Add every stage to the ``metric`` histogram."""
+        for name, seconds in self.durations.items():
+            observe(metric, seconds, stage=name, **labels)
+
+
+_current = ContextVar('timer', default=None)
+
+
+@contextmanager
+def timing(timer):
+    """Make ``timer`` collect the ``stage``s run inside the block (in this thread)."""
+    token = _current.set(timer)
+    try:
+        yield timer
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Time the block as stage ``name`` of the current ``Timer``; free when there is none."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+
+
+_lock = threading.Lock()
+# (metric, label values) -> [bucket counts..., count, sum]
+_histograms = {}
+
+
+def observe(metric, seconds, **labels):
+    """Record ``seconds`` in the ``metric`` histogram of this process."""
+    buckets = settings.TIMING_BUCKETS
+    key = (metric, tuple(str(labels[label]) for label in histogram_help[metric][1]))
+    with _lock:
+        values = _histograms.setdefault(key, [0] * (len(buckets) + 2))
+        for i, bound in enumerate(buckets):
+            if seconds <= bound:
+                values[i] += 1
+        values[-2] += 1
+        values[-1] += seconds
+
+
+def _label_text(names, values):
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+
+
+def histogram_lines():
+    """The histograms in Prometheus text format."""
+    buckets = settings.TIMING_BUCKETS
+    with _lock:
+        histograms = {key: list(values) for key, values in _histograms.items()}
+
+    lines = []
+    for metric, (help_text, label_names) in histogram_help.items():
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+        for (name, label_values), values in sorted(histograms.items()):
+            if name != metric:
+                continue
+            labels = _label_text(label_names, label_values)
+            for bound, count in zip(buckets, values):
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {values[-2]}')
+            lines.append(f'{metric}_count{{{labels}}} {values[-2]}')
+            lines.append(f'{metric}_sum{{{labels}}} {values[-1]}')
+    return lines
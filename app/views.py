@@ -1,23 +1,40 @@
-from django.http import JsonResponse
-import json
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.conf import settings
 import os
+import time
+import dataclasses
+import functools
+import json
+from datetime import datetime, timezone
 import pandas as pd
-import numpy as np
-import skfuzzy as fuzz
-from skfuzzy import control as ctrl
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import FinancialDataSerializer
-from app.models import Price, Stock
-from django.shortcuts import get_object_or_404
+from kombu.exceptions import OperationalError
+from app import tasks
+from app.models import Price, ScrapeJob, Stock
+from app.indicators import indicator_columns, prices_to_frame
+from app.pipeline import history_frame
+from app.indicator_store import attach_indicators
+from app.ingest import ingest_csv
+from app.fuzzy import get_ruleset
+from app.backtest import BacktestParams, backtest_frames, read_frames
+from app.batch import abatch_frames
+from app import compute
+from app.compute import ComputeBusy, ComputeTimeout, run_compute, score_frame, stream_chunks
+from app.export import export_formats, stream_export
+from app.renderers import frame_chunks, queryset_chunks, response_formats
+from app.slicing import Slice, add_next_link
+from app.screener import filter_screener, get_screener
+from app.scraper import observe_scrape_jobs
+from app.signal_cache import aget_signals, aset_signals, asignal_key, counts, etag
+from app.snapshots import attach_signals, latest_snapshot
+from app.listing import stock_listing
+from app.live import parse_bar, score_live, to_json
+from app.timing import histogram_lines, stage
 from rest_framework.decorators import api_view
-import logging
-from django.db import transaction
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from datetime import datetime
 # Get the current directory
 current_directory = os.path.dirname(__file__)
 
@@ -35,394 +52,422 @@ def upload_csv(request):
     sector = request.POST.get('sector', 'Untitled')
 
     try:
-        data_frame = pd.read_csv(csv_file)
-    except Exception as e:
+        stock_instance, reports = ingest_csv(csv_file, name, code, sector)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError):
         return Response({'error': 'Error reading CSV file'}, status=status.HTTP_400_BAD_REQUEST)
 
-    data_list = data_frame.to_dict('records')
-    stock_instance = Stock.objects.create(name=name, code=code, sector=sector)
-    
-    for data_entry in data_list:
-        mapped_data_entry = {
-            'stock': stock_instance.pk, 
-            'date': data_entry['Date'],
-            'open': data_entry['Open'],
-            'high': data_entry['High'],
-            'sell': data_entry['Low'],
-            'close': data_entry['Close'],
-            'volume': data_entry['Volume'],
-        }
-        serializer = FinancialDataSerializer(data=mapped_data_entry)
-        
-        if serializer.is_valid():
-            serializer.save()
-        else:
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
-    return Response({'message': 'Data saved successfully'}, status=status.HTTP_201_CREATED)
+    if stock_instance is None:
+        return Response({'error': 'Invalid rows, nothing was saved', 'chunks': reports}, status=status.HTTP_400_BAD_REQUEST)
+
+    rows = sum(report['rows'] for report in reports)
+    return Response({'message': 'Data saved successfully', 'rows': rows, 'chunks': reports}, status=status.HTTP_201_CREATED)
     
-def get_all_data(request):
-    data_queryset = Stock.objects.all().order_by('code')
-    # Convert QuerySet to a list of dictionaries
-    data_list = list(data_queryset.values())
+def _listing_page(sort, offset, limit):
+    # The listing and the number of stocks, for the paging headers
+    data_queryset = stock_listing(sort)
+    if limit:
+        data_queryset = data_queryset[offset:offset + limit]
+    elif offset:
+        data_queryset = data_queryset[offset:]
+    return list(data_queryset), Stock.objects.count()
+
+async def get_all_data(request):
+    # Every stock with its last close, change, volume and 52-week range,
+    # so the list needs no request per stock. ?sort=, ?limit= and ?offset=
+    page = {}
+    for name in ('limit', 'offset'):
+        try:
+            page[name] = int(request.GET.get(name) or 0)
+        except ValueError:
+            return JsonResponse({'error': f"'{name}' must be a non-negative integer"}, status=400)
+        if page[name] < 0:
+            return JsonResponse({'error': f"'{name}' must be a non-negative integer"}, status=400)
+    try:
+        data_list, total = await sync_to_async(_listing_page)(request.GET.get('sort', 'code'), **page)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     # Return the data as JSON response
-    return JsonResponse(data_list, safe=False)
-
-def get_stock_data(request, code):
+    response = JsonResponse(data_list, safe=False)
+    response['X-Total-Count'] = total
+    if page['limit'] and page['offset'] + page['limit'] < total:
+        query = request.GET.copy()
+        query['offset'] = page['offset'] + page['limit']
+        response['Link'] = f'<{request.path}?{query.urlencode()}>; rel="next"'
+    return response
+
+async def get_stock_data(request, code):
+    response_format = request.GET.get('format', 'records')
+    if response_format not in response_formats:
+        return JsonResponse({'error': f"Unknown format '{response_format}'"}, status=400)
+    fields = [field.attname for field in Price._meta.concrete_fields]
     try:
-        stock = Stock.objects.get(code=code.upper())
-        data = Price.objects.filter(stock=stock).order_by('date')
-        return JsonResponse(list(data.values()), safe=False)
-    except Stock.DoesNotExist:
+        price_slice = Slice(request.GET, fields, 'date')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    stock = await Stock.objects.filter(code=code.upper()).afirst()
+    if stock is None:
         return JsonResponse({'error': 'Saham tidak ditemukan'}, status=404, safe=False)
-
-def scrape_stock_data(stock_symbol):
-    msg = ''
-
+    data = price_slice.filter(Price.objects.filter(stock=stock))
+    data, next_cursor = await sync_to_async(price_slice.page)(data)
+    # Encoded a chunk of rows at a time, never as one list of dicts. The
+    # rows come from a server-side cursor, so in Django's sync thread
+    chunks = queryset_chunks(data, price_slice.fields, response_format)
+    if request.GET.get('stream'):
+        response = StreamingHttpResponse(stream_chunks(request, chunks, database=True),
+                                         content_type='application/json')
+    else:
+        response = HttpResponse(await sync_to_async(''.join)(chunks), content_type='application/json')
+    return add_next_link(request, response, next_cursor)
+
+def export(request):
+    export_format = request.GET.get('format', 'arrow')
+    if export_format not in export_formats:
+        return JsonResponse({'error': f"Unknown format '{export_format}'"}, status=400)
+    codes = [code.upper() for code in request.GET.get('codes', '').split(',') if code]
+    stocks = Stock.objects.order_by('code')
+    if codes:
+        stocks = stocks.filter(code__in=codes)
+        missing = sorted(set(codes) - {stock.code for stock in stocks})
+        if missing:
+            return JsonResponse({'error': f"Saham tidak ditemukan: {', '.join(missing)}"}, status=404)
+
+    content_type, extension = export_formats[export_format]
+    # Written and sent one record batch at a time, reading the database
+    chunks = stream_export(list(stocks), export_format, signals=bool(request.GET.get('signals')))
+    response = StreamingHttpResponse(stream_chunks(request, chunks, database=True), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="saham.{extension}"'
+    return response
+
+def _compute_errors(view):
+    # A full compute queue or a job past COMPUTE_TIMEOUT: come back later
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except ComputeBusy:
+            response = JsonResponse({'error': 'Server sibuk, coba lagi nanti'}, status=503)
+            response['Retry-After'] = '1'
+            return response
+        except ComputeTimeout:
+            return JsonResponse({'error': 'Perhitungan terlalu lama'}, status=504)
+    return wrapper
+
+def _backtest_results(frames, params):
+    # Runs in the compute pool, which waits for the backtest processes
+    results = {}
+    for code, result in backtest_frames(frames, params).items():
+        results[code] = {
+            'summary': result['summary'],
+            'trades': result['trades'],
+            'equity': {
+                'Date': result['dates'],
+                'Equity': result['equity'].tolist(),
+                'Drawdown': result['drawdown'].tolist(),
+            },
+        }
+    return JsonResponse({'params': dataclasses.asdict(params), 'results': results})
+
+@_compute_errors
+async def backtest(request):
+    codes = [code.upper() for code in request.GET.get('codes', '').split(',') if code]
+    if not codes:
+        return JsonResponse({'error': "Tolong input kode saham ('codes') !"}, status=400)
+    overrides = {}
+    for field in dataclasses.fields(BacktestParams):
+        if request.GET.get(field.name):
+            try:
+                overrides[field.name] = field.type(request.GET[field.name])
+            except ValueError:
+                return JsonResponse({'error': f"'{field.name}' must be a number"}, status=400)
     try:
-        # Retrieve the Stock instance based on the stock symbol
-        stock_data = Stock.objects.get(code=stock_symbol)
-        
-        # Get the last recorded date for the specific stock
-        last_price = Price.objects.filter(stock=stock_data).latest('date')
-        stop_date = last_price.date.strftime('%b %d, %Y')
-        
-        # Define the URL and set up the webdriver
-        url = f'https://finance.yahoo.com/quote/{stock_symbol}.JK/history?p={stock_symbol}.JK'
-        # path = os.path.join(os.path.dirname(__file__), 'chromedriver.exe')
-        options = webdriver.EdgeOptions()
-        # options.headless = True
-        options.add_argument('headless')  # Use headless browser
-        driver = webdriver.Edge(options=options)
-        driver.get(url)
-        
-        # Scrape data
-        elements = WebDriverWait(driver, 10).until(
-            EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'tr.BdT'))
-        )
-        
-        for element in elements:
-            row = element.find_elements(By.TAG_NAME, 'td')
-            if last_price.date.strftime('%b %d, %Y') == row[0].text:
-                msg = 'Data sudah paling baru'
-                break
-
-            if len(row) >= 5:
-                date = row[0].text
-                open_price = float(row[1].text.replace(',', ''))
-                high_price = float(row[2].text.replace(',', ''))
-                low_price = float(row[3].text.replace(',', ''))
-                close_price = float(row[4].text.replace(',', ''))
-                volume = int(row[6].text.replace(',', ''))
-
-                # Create the Price instance and save it to the database within a transaction
-                with transaction.atomic():
-                    price_instance = Price(
-                        stock=stock_data,
-                        date=datetime.strptime(date, '%b %d, %Y'),
-                        open=open_price,
-                        high=high_price,
-                        low=low_price,
-                        close=close_price,
-                        volume=volume
-                    )
-                    price_instance.save()
-                logging.info(f"Saved data for date: {date}")
-
-                if date == stop_date:
-                    msg = "Reached stop date. Exiting the loop"
-                    break
-            else:
-                logging.warning("Row < 5")
-    except Stock.DoesNotExist:
-        msg = f"Stock with code '{stock_symbol}' not found."
-        logging.error(msg)
-    except Exception as e:
-        msg = f"An error occurred: {str(e)}"
-        logging.error(msg)
-    finally:
-        driver.quit()  # Close the browser session
-
-    return msg
+        params = BacktestParams.defaults(**overrides)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    stocks = [stock async for stock in Stock.objects.filter(code__in=codes)]
+    missing = sorted(set(codes) - {stock.code for stock in stocks})
+    if missing:
+        return JsonResponse({'error': f"Saham tidak ditemukan: {', '.join(missing)}"}, status=404)
+
+    frames = await sync_to_async(read_frames)(stocks)
+    return await run_compute(_backtest_results, frames, params)
+
+async def screener(request):
+    sectors = [sector for sector in request.GET.get('sector', '').split(',') if sector]
+    bounds = {}
+    for name in ('min_entry', 'max_entry', 'min_exit', 'max_exit'):
+        if request.GET.get(name):
+            try:
+                bounds[name] = float(request.GET[name])
+            except ValueError:
+                return JsonResponse({'error': f"'{name}' must be a number"}, status=400)
+    try:
+        ruleset = get_ruleset(request.GET.get('ruleset'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
+    entry = await sync_to_async(get_screener)(ruleset)
+    try:
+        stocks = filter_screener(entry['stocks'], sectors, sort=request.GET.get('sort', '-Entry_Position'), **bounds)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'updated': datetime.fromtimestamp(entry['updated'], timezone.utc).isoformat(),
+        'count': len(stocks),
+        'stocks': stocks,
+    })
+
+def _scrape_job(codes):
+    # Scraped by the Celery workers, the client polls the status URL
+    job = ScrapeJob.objects.create(codes=codes)
+    try:
+        tasks.scraping.delay(str(job.pk))
+    except OperationalError as e:
+        ScrapeJob.objects.filter(pk=job.pk).update(status='failed', messages=[str(e)])
+        return JsonResponse({'error': 'Scraping queue unavailable', 'job': str(job.pk)}, status=503)
+    return JsonResponse({'job': str(job.pk), 'status_url': f'/api/scraping/jobs/{job.pk}'}, status=202)
 
 def scraping(request):
-    stock_codes_query = Stock.objects.values_list('code', flat=True)
-    stock_codes_list = list(stock_codes_query)
-
-    messages = []  # Store messages for each stock code
-    for stock_code in stock_codes_list:
-        msg = scrape_stock_data(stock_code)
-        messages.append({'stock_code': stock_code, 'msg': msg})
-
-    return JsonResponse({'messages': messages})
+    stock_codes_query = Stock.objects.order_by('code').values_list('code', flat=True)
+    return _scrape_job(list(stock_codes_query))
 
 def scraping_single_stock(request, code):
-    msg = ''
-    try:
-        msg = scrape_stock_data(code.upper())
-    except Exception as e:
-        msg = str(e)
-        logging.error(msg)
-
-    return JsonResponse({'messages': msg})
-
-def api_view(request):
+    if not Stock.objects.filter(code=code.upper()).exists():
+        return JsonResponse({'error': 'Saham tidak ditemukan'}, status=404)
+    return _scrape_job([code.upper()])
+
+async def scraping_job(request, job_id):
+    job = await ScrapeJob.objects.filter(pk=job_id).afirst()
+    if job is None:
+        return JsonResponse({'error': 'Job tidak ditemukan'}, status=404)
+    return JsonResponse({
+        'job': str(job.pk),
+        'status': job.status,
+        'stocks': len(job.codes),
+        'done': job.done,
+        'messages': job.messages,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at and job.finished_at.isoformat(),
+    })
+
+# Columns of the api/saham rows, in order
+signal_columns = [
+    'id', 'stock_id', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume',
+    *indicator_columns.values(), 'Entry_Position', 'Exit_Position',
+]
+
+def _load_signals(stock_instance, price_slice=None, ruleset=None):
+    # The database half of the scored rows: the bars with their stored
+    # indicators (and snapshot scores) when the stores cover them, the
+    # page's next cursor and, when a range had to fall back to the whole
+    # history, the dates to keep
+    if price_slice is None:
+        df = history_frame(stock_instance, compute=False)
+        if df is not None and set(indicator_columns.values()) <= set(df.columns):
+            with stage('db'):
+                attach_signals(stock_instance, df, ruleset)
+        return df, None, None
+
+    with stage('db'):
+        data_queryset = Price.objects.filter(stock=stock_instance).order_by('date')
+        data_queryset, next_cursor = price_slice.page(price_slice.filter(data_queryset))
+        # Convert QuerySet to a list of dictionaries
+        data_list = list(data_queryset.values())
+    if not data_list:
+        return pd.DataFrame(columns=price_slice.fields), None, None
+    with stage('frame'):
+        df = prices_to_frame(data_list)
+    # Read the stored indicators, computing them only if the store is behind
+    with stage('indicators'):
+        attached = attach_indicators(stock_instance, df)
+    if attached:
+        with stage('db'):
+            attach_signals(stock_instance, df, ruleset)
+        return df, next_cursor, None
+    # The indicators of a range depend on the bars before it (EMAs
+    # never forget), so compute the whole history and keep the range
+    return history_frame(stock_instance, compute=False), next_cursor, set(df['Date'])
+
+def _score_signals(df, keep_dates=None, price_slice=None, ruleset=None):
+    # The CPU half, run in the compute threads: no database access here
+    if df.empty:
+        return df
+    # Unless the snapshot had them, in the worker processes when there are
+    # some; scores are per row, so they're the same scored before or after
+    # keeping the range
+    if not {'Entry_Position', 'Exit_Position'} <= set(df.columns):
+        score_frame(df, ruleset)
+    if keep_dates is not None:
+        df = df[df['Date'].isin(keep_dates)].reset_index(drop=True)
+
+    df['Date'] = pd.to_datetime(df['Date']).dt.date
+    df['Date'] = df['Date'].apply(lambda x: x.strftime('%Y-%m-%d'))
+    if price_slice is not None:
+        df = df[price_slice.fields]
+    return df
+
+async def _signals_frame(stock_instance, price_slice=None, ruleset=None):
+    df, next_cursor, keep_dates = await sync_to_async(_load_signals)(stock_instance, price_slice, ruleset)
+    df = await run_compute(_score_signals, df, keep_dates, price_slice, ruleset)
+    return df, next_cursor
+
+def _encode(df, response_format):
+    with stage('encode'):
+        return ''.join(frame_chunks(df, response_format)).encode()
+
+@_compute_errors
+async def api_view(request):
   # Load data from a CSV file
     param = request.GET.get('kode')
     if param is not None:
-        stock_instance = get_object_or_404(Stock, code=param.upper())
-        data_queryset = Price.objects.filter(stock=stock_instance).order_by('date')
-        if len(data_queryset) == 0:
+        response_format = request.GET.get('format', 'records')
+        if response_format not in response_formats:
+            return JsonResponse({'error': f"Unknown format '{response_format}'"}, status=400)
+        try:
+            price_slice = Slice(request.GET, signal_columns, 'Date')
+            ruleset = get_ruleset(request.GET.get('ruleset'))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        stock_instance = await Stock.objects.filter(code=param.upper()).afirst()
+        if stock_instance is None:
+            raise Http404('No Stock matches the given query.')
+        key = await asignal_key(stock_instance, response_format, ruleset)
+        if key is None:
             return JsonResponse('Tidak ada data saham ini', safe=False)
-            # Convert QuerySet to a list of dictionaries
-        data_list = list(data_queryset.values())
-        column_mapping = {
-            'date': 'Date',
-            'open': 'Open',
-            'high': 'High',
-            'low': 'Low',
-            'close': 'Close',
-            'adj': 'Adj Close',
-            'volume': 'Volume',
-        }
-        df = pd.DataFrame(data_list).rename(columns=column_mapping)
-        
-        # Determine local price extrema using rolling windows
-        df['RollingMin'] = df['Close'].rolling(window=50).min()
-        df['RollingMax'] = df['Close'].rolling(window=50).max()
-
-        # Identify support levels
-        df['SupportArea'] = ((abs(df['Close'] - df['RollingMin']) / df['RollingMin']) * 100) <= 3
-        df['ResistanceArea'] = ((abs(df['Close'] - df['RollingMax']) / df['RollingMax']) * 100) <= 3
-
-        #BullishHammer Pattern
-        df['BodyLength'] = abs(df['Open'] - df['Close'])
-        upperShadow = df['High'] - df[['Open', 'Close']].max(axis=1)
-        lowerShadow = df[['Open', 'Close']].min(axis=1) - df['Low']
-        df['BullishHammer'] = (df['Close'] > df['Open']) & (df['BodyLength'] < lowerShadow) & (lowerShadow > upperShadow * 2)
-
-        # Doji Pattern
-        df['HighLowRange'] = df['High'] - df['Low']
-        df['Doji'] = df['BodyLength'] <= (0.02 * df['HighLowRange'])
-
-        # Stochastic
-        df['Lowest Low'] = df['Close'].rolling(window=14).min()
-        df['Highest High'] = df['Close'].rolling(window=14).max()
-        df['%K'] = ((df['Close'] - df['Lowest Low']) / (df['Highest High'] - df['Lowest Low'])) * 100
-        df['%D'] = df['%K'].rolling(window=3).mean()
-
-        # Calculate RSI 
-        df['delta'] = df['Close'].diff()
-        df['gain'] = df['delta'].where(df['delta'] > 0, 0)
-        df['loss'] = -df['delta'].where(df['delta'] < 0, 0)
-        df['avg_gain'] = df['gain'].rolling(window=14).mean()
-        df['avg_loss'] = df['loss'].rolling(window=14).mean().abs()
-        df['rs'] = df['avg_gain'] / df['avg_loss']
-        df['RSI'] = 100 - (100 / (1 + df['rs']))
-
-        # macd setting
-        # 8, 21, 5
-        # 3, 17, 5
-        # 3, 10, 16
-
-        # Calculate the MACD line (12-day EMA minus 26-day EMA)
-        df['ema_12'] = df['Close'].ewm(span=12, adjust=False).mean()
-        df['ema_26'] = df['Close'].ewm(span=26, adjust=False).mean()
-        df['macd_line'] = df['ema_12'] - df['ema_26']
-        # Calculate the signal line (9-day EMA of the MACD line)
-        df['signal_line'] = df['macd_line'].ewm(span=9, adjust=False).mean()
-
-        df['MACD_GoldenCross'] = (df['macd_line'] > df['signal_line']) & (df['macd_line'].shift(1) < df['signal_line'].shift(1))
-        df['MACD_DeathCross'] = (df['macd_line'] < df['signal_line']) & (df['macd_line'].shift(1) > df['signal_line'].shift(1))
-
-        df['Above_EMA_200'] = df['Close'] > df['Close'].rolling(window=200).mean()
-
-        df['Engulfing'] = (df['Close'] > df['Open']) & (df['Close'].shift(1) < df['Open'].shift(1)) & \
-                                (df['High'] > df['High'].shift(1)) & (df['Low'] < df['Low'].shift(1))
-
-        # # Add a column for the downtrend or consolidation condition
-        # df['Downtrend_Consolidation'] = (df['Close'] < df['Close'].rolling(window=50).mean())
-
-        # Define the input variables
-        engulfing = ctrl.Antecedent(np.arange(0, 2, 1), 'engulfing')
-        bullish_hammer = ctrl.Antecedent(np.arange(0, 2, 1), 'bullish_hammer')
-        doji = ctrl.Antecedent(np.arange(0, 2, 1), 'doji')
-        macd_goldencross = ctrl.Antecedent(np.arange(0, 2, 1), 'macd_goldencross')
-        macd_deathcross = ctrl.Antecedent(np.arange(0, 2, 1), 'macd_deathcross')
-        rsi = ctrl.Antecedent(np.arange(0, 101, 1), 'rsi')
-        stochastic = ctrl.Antecedent(np.arange(0, 101, 1), 'stochastic')
-        support_area = ctrl.Antecedent(np.arange(0, 2, 1), 'support_area')
-        resistance_area = ctrl.Antecedent(np.arange(0, 2, 1), 'resistance_area')
-        above_ema_200 = ctrl.Antecedent(np.arange(0, 2, 1), 'above_ema_200')
-
-        # Define the output variable
-        exit_position = ctrl.Consequent(np.arange(0, 101, 1), 'exit_position')
-        entry_position = ctrl.Consequent(np.arange(0, 101, 1), 'entry_position')
-
-        # membership function
-        engulfing['no'] = fuzz.trimf(engulfing.universe, [0, 0, 0])
-        engulfing['yes'] = fuzz.trimf(engulfing.universe, [1, 1, 1])
-
-        bullish_hammer['no'] = fuzz.trimf(bullish_hammer.universe, [0, 0, 0])
-        bullish_hammer['yes'] = fuzz.trimf(bullish_hammer.universe, [1, 1, 1])
-
-        doji['no'] = fuzz.trimf(doji.universe, [0, 0, 0])
-        doji['yes'] = fuzz.trimf(doji.universe, [1, 1, 1])
-
-        macd_goldencross['no'] = fuzz.trimf(macd_goldencross.universe, [0, 0, 0])
-        macd_goldencross['yes'] = fuzz.trimf(macd_goldencross.universe, [1, 1, 1])
-
-        macd_deathcross['no'] = fuzz.trimf(macd_deathcross.universe, [0, 0, 0])
-        macd_deathcross['yes'] = fuzz.trimf(macd_deathcross.universe, [1, 1, 1])
-
-        rsi['oversold'] = fuzz.trimf(rsi.universe, [0, 20, 45])
-        rsi['neutral'] = fuzz.trimf(rsi.universe, [30, 50, 70])
-        rsi['overbought'] = fuzz.trimf(rsi.universe, [60, 80, 100])
-
-        stochastic['oversold'] = fuzz.trimf(stochastic.universe, [0, 20, 40])
-        stochastic['neutral'] = fuzz.trimf(stochastic.universe, [30, 50, 70])
-        stochastic['overbought'] = fuzz.trimf(stochastic.universe, [60, 80, 100])
-
-        support_area['no'] = fuzz.trimf(support_area.universe, [0,0,0])
-        support_area['yes'] = fuzz.trimf(support_area.universe, [1,1,1])
-
-        resistance_area['no'] = fuzz.trimf(resistance_area.universe, [0,0,0])
-        resistance_area['yes'] = fuzz.trimf(resistance_area.universe, [1,1,1])
-
-        above_ema_200['no'] = fuzz.trimf(above_ema_200.universe, [0, 0, 0])
-        above_ema_200['yes'] = fuzz.trimf(above_ema_200.universe, [1, 1, 1])
-
-        exit_position['low'] = fuzz.trimf(exit_position.universe, [0, 25, 50])
-        exit_position['high'] = fuzz.trimf(exit_position.universe, [50, 75, 100])
-
-        entry_position['low'] = fuzz.trimf(entry_position.universe, [0, 25, 50])
-        entry_position['high'] = fuzz.trimf(entry_position.universe, [50, 75, 100])
-
-        # Define the rules for the fuzzy system
-        entry_rule1 = ctrl.Rule(rsi['oversold'] & support_area['yes'], entry_position['high'])
-        entry_rule2 = ctrl.Rule(rsi['oversold'] & support_area['no'], entry_position['low'])
-        entry_rule3 = ctrl.Rule(rsi['neutral'] & support_area['yes'], entry_position['low'])
-        entry_rule4 = ctrl.Rule(rsi['neutral'] & support_area['no'], entry_position['low'])
-        entry_rule5 = ctrl.Rule(rsi['overbought'] & support_area['yes'], entry_position['low'])
-        entry_rule6 = ctrl.Rule(rsi['overbought'] & support_area['no'], entry_position['low'])
-        # entry_rule7 = ctrl.Rule(macd_goldencross['yes'] & above_ema_200['yes'], entry_position['high'])
-        # entry_rule8 = ctrl.Rule(macd_goldencross['no'] & above_ema_200['yes'], entry_position['low'])
-        entry_rule9 = ctrl.Rule(support_area['yes'] & engulfing['yes'], entry_position['high'])
-        # entry_rule10 = ctrl.Rule(support_area['no'] & engulfing['no'], entry_position['low'])
-        entry_rule11 = ctrl.Rule(support_area['yes'] & bullish_hammer['yes'], entry_position['high'])
-        # entry_rule12 = ctrl.Rule(support_area['no'] & bullish_hammer['no'], entry_position['low'])
-        entry_rule13 = ctrl.Rule(macd_goldencross['yes'] & support_area['yes'], entry_position['high'])
-        entry_rule14 = ctrl.Rule(macd_goldencross['no'] & support_area['no'], entry_position['low'])
-        entry_rule15 = ctrl.Rule(doji['yes'] & support_area['yes'], entry_position['high'])
-        # entry_rule16 = ctrl.Rule(doji['no'] & support_area['no'], entry_position['low'])
-        # entry_rule17 = ctrl.Rule(support_area['yes'], entry_position['high'])
-        # entry_rule18 = ctrl.Rule(support_area['no'], entry_position['low'])
-        entry_rule19 = ctrl.Rule(stochastic['oversold'] & support_area['yes'], entry_position['high'])
-        entry_rule20 = ctrl.Rule(stochastic['neutral'], entry_position['low'])
-        entry_rule21 = ctrl.Rule(stochastic['overbought'], entry_position['low'])
-        # entry_rule22 = ctrl.Rule(above_ema_200['yes'], entry_position['high'])
-
-        exit_rule1 = ctrl.Rule(rsi['overbought'] & resistance_area['yes'], exit_position['high'])
-        exit_rule2 = ctrl.Rule(rsi['overbought'] & resistance_area['no'], exit_position['low'])
-        exit_rule3 = ctrl.Rule(rsi['neutral'] & resistance_area['yes'], exit_position['low'])
-        exit_rule4 = ctrl.Rule(rsi['neutral'] & resistance_area['no'], exit_position['low'])
-        exit_rule5 = ctrl.Rule(rsi['oversold'] & resistance_area['yes'], exit_position['low'])
-        exit_rule6 = ctrl.Rule(rsi['oversold'] & resistance_area['no'], exit_position['low'])
-        # exit_rule7 = ctrl.Rule(macd_deathcross['yes'] & above_ema_200['yes'], exit_position['high'])
-        # exit_rule8 = ctrl.Rule(macd_deathcross['no'] & above_ema_200['yes'], exit_position['low'])
-        exit_rule9 = ctrl.Rule(macd_deathcross['yes'] & resistance_area['yes'], exit_position['high'])
-        exit_rule10 = ctrl.Rule(macd_deathcross['no'] & resistance_area['no'], exit_position['low'])
-        exit_rule11 = ctrl.Rule(doji['yes'] & resistance_area['yes'], exit_position['high'])
-        exit_rule12 = ctrl.Rule(doji['no'] & resistance_area['no'], exit_position['low'])
-        exit_rule13 = ctrl.Rule(stochastic['oversold'], exit_position['low'])
-        exit_rule14 = ctrl.Rule(stochastic['neutral'], exit_position['low'])
-        exit_rule15 = ctrl.Rule(stochastic['overbought'] & rsi['overbought'] & resistance_area['yes'], exit_position['high'])
-        # exit_rule16 = ctrl.Rule(above_ema_200['no'], exit_position['high'])
-
-        entry_position_ctrl = ctrl.ControlSystem(
-            [
-            entry_rule1, 
-            entry_rule2, 
-            entry_rule3, 
-            entry_rule4, 
-            entry_rule5, 
-            entry_rule6, 
-            # entry_rule7,
-            # entry_rule8,
-            entry_rule9,
-            # entry_rule10,
-            entry_rule11,
-            # entry_rule12,
-            entry_rule13,
-            entry_rule14,
-            entry_rule15,
-            # entry_rule16,
-            # entry_rule17,
-            # entry_rule18,
-            entry_rule19,
-            entry_rule20,
-            entry_rule21,
-            # entry_rule22,
-            ]
-            )
-        entry_position_simulation = ctrl.ControlSystemSimulation(entry_position_ctrl)
-
-        exit_position_ctrl = ctrl.ControlSystem(
-            [
-            exit_rule1, 
-            exit_rule2, 
-            exit_rule3, 
-            exit_rule4, 
-            exit_rule5, 
-            exit_rule6, 
-            # exit_rule7, 
-            # exit_rule8, 
-            exit_rule9,
-            exit_rule10,
-            exit_rule11,
-            exit_rule12,
-            exit_rule13,
-            exit_rule14,
-            exit_rule15,
-            # exit_rule16,
-
-            ]
-            )
-        exit_position_simulation = ctrl.ControlSystemSimulation(exit_position_ctrl)
-
-        # Loop through the data and predict the entry entry_position for each row
-        for i in range(len(df)):
-            # Set the input values for the current row
-            entry_position_simulation.input['rsi'] = df.loc[i, 'RSI']
-            entry_position_simulation.input['stochastic'] = df.loc[i, '%D']
-            entry_position_simulation.input['macd_goldencross'] = df.loc[i, 'MACD_GoldenCross']
-            entry_position_simulation.input['support_area'] = df.loc[i, 'SupportArea']
-            entry_position_simulation.input['engulfing'] = df.loc[i, 'Engulfing']
-            entry_position_simulation.input['bullish_hammer'] = df.loc[i, 'BullishHammer']
-            entry_position_simulation.input['doji'] = df.loc[i, 'Doji']
-            # entry_position_simulation.input['above_ema_200'] = df.loc[i, 'Above_EMA_200']
-            
-            entry_position_simulation.compute()
-
-            exit_position_simulation.input['rsi'] = df.loc[i, 'RSI']
-            exit_position_simulation.input['stochastic'] = df.loc[i, '%D']
-            exit_position_simulation.input['macd_deathcross'] = df.loc[i, 'MACD_DeathCross']
-            exit_position_simulation.input['resistance_area'] = df.loc[i, 'ResistanceArea']
-            exit_position_simulation.input['doji'] = df.loc[i, 'Doji']
-            # exit_position_simulation.input['above_ema_200'] = df.loc[i, 'Above_EMA_200']
-
-            exit_position_simulation.compute()
-            
-            df.loc[i, 'Entry_Position'] = entry_position_simulation.output['entry_position']
-            df.loc[i, 'Exit_Position'] = exit_position_simulation.output['exit_position']
-        
-        df['Date'] = pd.to_datetime(df['Date']).dt.date
-        df['Date'] = df['Date'].apply(lambda x: x.strftime('%Y-%m-%d'))
-
-        data_json = df.to_json(orient='records')
-
-        # Return the JSON response
-        return JsonResponse(json.loads(data_json), safe=False)
+
+        if price_slice.active:
+            # Only the requested rows are read, which is cheap enough to skip the cache
+            df, next_cursor = await _signals_frame(stock_instance, price_slice, ruleset)
+            if request.GET.get('stream'):
+                response = StreamingHttpResponse(stream_chunks(request, frame_chunks(df, response_format)),
+                                                 content_type='application/json')
+            else:
+                content = await run_compute(_encode, df, response_format)
+                response = HttpResponse(content, content_type='application/json')
+                response['ETag'] = etag(content)
+                response = get_conditional_response(request, etag=response['ETag'], response=response)
+            return add_next_link(request, response, next_cursor)
+
+        # The scores only change with the bars, so serve them from the cache
+        # and let clients revalidate with ETag / Last-Modified
+        with stage('cache'):
+            entry = await aget_signals(key)
+        if entry is None and request.GET.get('stream'):
+            # Encoded and sent a chunk at a time, so not cached
+            df, _ = await _signals_frame(stock_instance, ruleset=ruleset)
+            return StreamingHttpResponse(stream_chunks(request, frame_chunks(df, response_format)),
+                                         content_type='application/json')
+        if entry is None:
+            # pandas writes the JSON directly, no Python objects in between
+            df, _ = await _signals_frame(stock_instance, ruleset=ruleset)
+            content = await run_compute(_encode, df, response_format)
+            entry = {'content': content, 'etag': etag(content), 'last_modified': int(time.time())}
+            with stage('cache'):
+                await aset_signals(key, entry)
+
+        response = HttpResponse(entry['content'], content_type='application/json')
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        return get_conditional_response(
+            request, etag=entry['etag'], last_modified=entry['last_modified'], response=response)
     else:
-        return JsonResponse('Tolong input kode saham !', safe=False)
\ No newline at end of file
+        return JsonResponse('Tolong input kode saham !', safe=False)
+
+async def live(request, code):
+    # Today's forming bar, {"open", "high", "low", "close", "volume"} in the
+    # body, scored on top of the stored history. The bar isn't stored
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        ruleset = get_ruleset(request.GET.get('ruleset'))
+        bar = parse_bar(json.loads(request.body or b'{}'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    stock = await Stock.objects.filter(code=code.upper()).afirst()
+    if stock is None:
+        return JsonResponse({'error': 'Saham tidak ditemukan'}, status=404)
+    # A query and well under a millisecond of CPU once the state is cached,
+    # so no trip through the compute pool
+    try:
+        row = await sync_to_async(score_live)(stock, bar, ruleset)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse(to_json(row))
+
+def _encode_batch(frames, codes, price_slice, response_format):
+    with stage('encode'):
+        chunks = ['{']
+        for number, code in enumerate(codes):
+            df = frames.get(code, pd.DataFrame(columns=signal_columns))
+            chunks.append(('' if number == 0 else ',') + json.dumps(code) + ':')
+            chunks.extend(frame_chunks(price_slice.filter_frame(df), response_format))
+        chunks.append('}')
+        return ''.join(chunks)
+
+@_compute_errors
+async def batch(request):
+    # {"codes": ["BBCA", ...]} in the body, one payload keyed by code back.
+    # require_POST can't wrap async views before Django 5.0
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    response_format = request.GET.get('format', 'records')
+    if response_format not in response_formats:
+        return JsonResponse({'error': f"Unknown format '{response_format}'"}, status=400)
+    try:
+        price_slice = Slice(request.GET, signal_columns, 'Date')
+        ruleset = get_ruleset(request.GET.get('ruleset'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if price_slice.limit or price_slice.cursor:
+        return JsonResponse({'error': "'limit' and 'cursor' are not supported here"}, status=400)
+
+    try:
+        codes = json.loads(request.body or b'{}').get('codes')
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Body must be a JSON object'}, status=400)
+    if isinstance(codes, str):
+        codes = codes.split(',')
+    if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+        return JsonResponse({'error': "'codes' must be a list of stock codes"}, status=400)
+    codes = list(dict.fromkeys(code.strip().upper() for code in codes if code.strip()))
+    if not codes:
+        return JsonResponse({'error': "Tolong input kode saham ('codes') !"}, status=400)
+    if len(codes) > settings.BATCH_MAX_CODES:
+        return JsonResponse({'error': f"At most {settings.BATCH_MAX_CODES} codes per request"}, status=400)
+
+    found = {stock.code: stock async for stock in Stock.objects.filter(code__in=codes)}
+    missing = [code for code in codes if code not in found]
+    if missing:
+        return JsonResponse({'error': f"Saham tidak ditemukan: {', '.join(missing)}"}, status=404)
+
+    # Every stock scored together: one query, one indicator pass, one fuzzy call
+    frames = await abatch_frames([found[code] for code in codes], ruleset)
+    content = await run_compute(_encode_batch, frames, codes, price_slice, response_format)
+    return HttpResponse(content, content_type='application/json')
+
+def metrics(request):
+    # Prometheus text format
+    observe_scrape_jobs()
+    cache_counts = counts()
+    lines = [
+        '# HELP signal_cache_hits_total Responses of api/saham served from the cache.',
+        '# TYPE signal_cache_hits_total counter',
+        f"signal_cache_hits_total {cache_counts['hits']}",
+        '# HELP signal_cache_misses_total Responses of api/saham computed and cached.',
+        '# TYPE signal_cache_misses_total counter',
+        f"signal_cache_misses_total {cache_counts['misses']}",
+        *histogram_lines(),
+        *compute.metric_lines(),
+    ]
+    snapshot = latest_snapshot()
+    if snapshot is not None:
+        lines += [
+            '# HELP signal_snapshot_version Id of the last completed signal snapshot.',
+            '# TYPE signal_snapshot_version gauge',
+            f'signal_snapshot_version{{ruleset="{snapshot.ruleset}"}} {snapshot.pk}',
+            '# HELP signal_snapshot_completed_seconds When the last signal snapshot completed, as a Unix time.',
+            '# TYPE signal_snapshot_completed_seconds gauge',
+            f'signal_snapshot_completed_seconds{{ruleset="{snapshot.ruleset}"}} {snapshot.completed_at.timestamp()}',
+        ]
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4')
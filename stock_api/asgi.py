@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "stock_api.settings")
 
 application = get_asgi_application()
+
+# Spawn the compute worker processes (COMPUTE_PROCESSES) before the first request
+from app.compute import start_pool  # noqa: E402
+
+start_pool()
@@ -53,6 +53,8 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     # "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # Server-Timing, per stage histograms and ?profile=1 (needs request.user)
+    "app.middleware.TimingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -137,3 +139,100 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/Singapore'
+
+# Score fuzzy positions from a table precomputed at startup instead of the
+# exact vectorized engine: None (exact), 'nearest' or 'linear' interpolation
+# of non-integer RSI/%D. See app.fuzzy.LookupTable.
+FUZZY_LUT_MODE = None
+
+# Fuzzy rule sets: one JSON file of memberships and rules per name (see
+# app.fuzzy.RuleSet), chosen per request with ?ruleset=<name>
+FUZZY_RULESETS_DIR = BASE_DIR / 'app' / 'rulesets'
+FUZZY_RULESET = 'default'
+
+# CSV upload: rows parsed per chunk and rows per INSERT batch (app.ingest)
+CSV_INGEST_CHUNK_SIZE = 10000
+CSV_INGEST_BATCH_SIZE = 1000
+
+# Scraper (app.scraper): fetchers tried in order, concurrent tickers,
+# requests per second per host, retries with exponential backoff (seconds)
+SCRAPER_FETCHERS = ['http', 'selenium']
+SCRAPER_CSV_URL = 'https://query1.finance.yahoo.com/v7/finance/download/{symbol}?period1={period1}&period2={period2}&interval=1d&events=history'
+SCRAPER_SELENIUM_BROWSER = 'chrome'
+SCRAPER_CONCURRENCY = 8
+SCRAPER_RATE_LIMIT = 5
+SCRAPER_RETRIES = 3
+SCRAPER_BACKOFF = 1.0
+SCRAPER_TIMEOUT = 10
+SCRAPER_TASK_SOFT_TIME_LIMIT = 120
+SCRAPER_TASK_TIME_LIMIT = 150
+
+# Chords need a result backend to join the per-stock scraping tasks
+CELERY_RESULT_BACKEND = CELERY_BROKER_URL
+
+# Computed /api/saham responses (app.signal_cache): an in-process LRU by
+# default, or the file-based backend to share them between processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'signals': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'signals',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+    # 'signals': {
+    #     'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    #     'LOCATION': BASE_DIR / 'cache' / 'signals',
+    #     'TIMEOUT': None,
+    #     'OPTIONS': {'MAX_ENTRIES': 1000},
+    # },
+}
+SIGNAL_CACHE = 'signals'
+
+# Upper bounds (seconds) of the request / scraper duration histograms
+# exposed at /metrics (app.timing)
+TIMING_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Functions listed by ?profile=1
+PROFILE_LINES = 40
+
+# Rows encoded per chunk of JSON output (app.renderers)
+JSON_CHUNK_ROWS = 5000
+
+# Rows per record batch of the Arrow / Parquet export (app.export)
+EXPORT_CHUNK_ROWS = 10000
+
+# Directory of the memory-mapped per-stock OHLCV files read by api/saham
+# (app.bar_store), e.g. BASE_DIR / 'bars'. None disables the store.
+BAR_STORE_DIR = None
+
+# Backtests (app.backtest): default rules (IDX lots of 100 shares, broker
+# fees with the 0.1% sales tax on the sell side) and worker processes
+# (None: one per CPU)
+BACKTEST_DEFAULTS = {
+    'entry': 60.,
+    'exit': 60.,
+    'capital': 100_000_000.,
+    'lot_size': 100,
+    'buy_fee': 0.0015,
+    'sell_fee': 0.0025,
+}
+BACKTEST_WORKERS = None
+
+# Stocks per task of the post-scrape signal snapshot (app.snapshots)
+SNAPSHOT_CHUNK = 50
+
+# Most stock codes one POST api/saham/batch may ask for
+BATCH_MAX_CODES = 100
+
+# Threads running the indicator, fuzzy and JSON work of the async views
+# (app.compute) so the event loop keeps serving; 0 runs it on the loop
+COMPUTE_THREADS = 4
+# Warm worker processes scoring for the API, fed through shared memory so
+# the GIL isn't shared with the server; 0 scores in the compute threads
+COMPUTE_PROCESSES = 0
+# Compute jobs queued or running past which requests get a 503
+COMPUTE_QUEUE_LIMIT = 64
+# Seconds a request waits for its compute job before a 504
+COMPUTE_TIMEOUT = 30
@@ -16,15 +16,22 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from app.views import api_view, get_stock_data, scraping_single_stock, get_all_data, scraping,  upload_csv
+from app.views import api_view, get_stock_data, scraping_single_stock, get_all_data, scraping, scraping_job, upload_csv, metrics, screener, export, backtest, batch, live
 from django.urls import path
 
 urlpatterns = [
     path("api/saham/all", get_all_data),
     path("admin", admin.site.urls),
     path("api/saham", api_view),
+    path("api/saham/screener", screener),
+    path("api/saham/export", export),
+    path("api/saham/backtest", backtest),
+    path("api/saham/batch", batch),
     path("api/saham/<str:code>", get_stock_data),
+    path("api/saham/<str:code>/live", live),
     path('api/scraping', scraping),
+    path('api/scraping/jobs/<uuid:job_id>', scraping_job),
     path('api/scraping/<str:code>', scraping_single_stock),
     path('api/create', upload_csv),
+    path('metrics', metrics),
 ]
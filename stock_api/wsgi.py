@@ -15,4 +15,9 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "stock_api.settings")
 
 application = get_wsgi_application()
 
+# Spawn the compute worker processes (COMPUTE_PROCESSES) before the first request
+from app.compute import start_pool  # noqa: E402
+
+start_pool()
+
 app = application
\ No newline at end of file